@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# Copyright 2019 黎慧剑
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+通用管道处理器模块
+@module processer
+@file processer.py
+"""
+
+import os
+import sys
+import asyncio
+import urllib.parse
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.pipeline import PipelineProcesser
+
+
+__MOUDLE__ = 'processer'  # 模块名
+__DESCRIPT__ = u'通用管道处理器模块'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = u'黎慧剑'  # 作者
+__PUBLISH__ = '2020.09.09'  # 发布日期
+
+
+class UrlImageFetch(PipelineProcesser):
+    """
+    通过Url下载图片(协程处理器，只支持通过AsyncPipeline执行)
+    基于asyncio的HTTP/1.1客户端，等待网络数据时不占用线程
+        输入: {'url': 图片Url地址, 'collection': 默认集合名}
+        输出: {'image': 图片二进制数据, 'collection': 默认集合名}
+    上下文参数:
+        fetch_timeout {float} - 下载超时时间(秒)，默认30
+        fetch_max_size {int} - 下载内容的最大字节数，默认20MB
+        fetch_max_redirects {int} - 最大重定向次数，默认5
+    """
+
+    @classmethod
+    def processer_name(cls) -> str:
+        """
+        处理器名称，唯一标识处理器
+
+        @returns {str} - 当前处理器名称
+        """
+        return 'UrlImageFetch'
+
+    @classmethod
+    async def execute(cls, input_data, context: dict, pipeline_obj):
+        """
+        执行处理
+
+        @param {object} input_data - 处理器输入数据值，格式为 {'url': 图片Url地址, 'collection': 默认集合名}
+        @param {dict} context - 传递上下文
+        @param {Pipeline} pipeline_obj - 管道对象
+
+        @returns {object} - 处理结果输出数据值，格式为 {'image': 图片二进制数据, 'collection': 默认集合名}
+        """
+        _image = await asyncio.wait_for(
+            cls._fetch(
+                input_data['url'], context.get('fetch_max_size', 20971520),
+                context.get('fetch_max_redirects', 5)
+            ),
+            context.get('fetch_timeout', 30)
+        )
+        return {'image': _image, 'collection': input_data.get('collection', '')}
+
+    #############################
+    # 内部函数
+    #############################
+    @classmethod
+    async def _fetch(cls, url: str, max_size: int, max_redirects: int) -> bytes:
+        """
+        下载Url的内容(自动处理重定向)
+
+        @param {str} url - Url地址
+        @param {int} max_size - 下载内容的最大字节数
+        @param {int} max_redirects - 最大重定向次数
+
+        @returns {bytes} - 下载的内容
+
+        @throws {RuntimeError} - 返回非200状态或重定向次数过多时抛出异常
+        """
+        for _i in range(max_redirects + 1):
+            _status, _headers, _body = await cls._request(url, max_size)
+            if _status in (301, 302, 303, 307, 308) and 'location' in _headers.keys():
+                url = urllib.parse.urljoin(url, _headers['location'])
+                continue
+
+            if _status != 200:
+                raise RuntimeError('Fetch url [%s] error: http status [%d]!' % (url, _status))
+
+            return _body
+
+        raise RuntimeError('Fetch url [%s] error: too many redirects!' % url)
+
+    @classmethod
+    async def _request(cls, url: str, max_size: int):
+        """
+        发送GET请求并获取返回结果
+
+        @param {str} url - Url地址
+        @param {int} max_size - 下载内容的最大字节数
+
+        @returns {int, dict, bytes} - 返回 http状态码, 报文头字典(名称为小写), 报文体(非200状态返回b'')
+
+        @throws {AttributeError} - 不支持的Url时抛出异常
+        @throws {RuntimeError} - 返回报文异常或内容超过最大字节数时抛出异常
+        """
+        _url = urllib.parse.urlsplit(url)
+        if _url.scheme not in ('http', 'https') or not _url.hostname:
+            raise AttributeError('Not supported url [%s]!' % url)
+
+        _port = _url.port
+        if _port is None:
+            _port = 443 if _url.scheme == 'https' else 80
+        _path = urllib.parse.quote(_url.path or '/', safe="/%:@!$&'()*+,;=-._~")
+        if _url.query != '':
+            _path += '?' + urllib.parse.quote(_url.query, safe="/%:@!$&'()*+,;=-._~?")
+
+        _reader, _writer = await asyncio.open_connection(
+            _url.hostname, _port, ssl=(_url.scheme == 'https')
+        )
+        try:
+            _writer.write((
+                'GET %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: search_by_image\r\n'
+                'Accept: */*\r\nConnection: close\r\n\r\n' % (
+                    _path, _url.netloc.rpartition('@')[2]
+                )
+            ).encode('latin-1'))
+            await _writer.drain()
+
+            # 状态行及报文头
+            _status_line = (await _reader.readline()).split()
+            if len(_status_line) < 2 or not _status_line[1].isdigit():
+                raise RuntimeError('Fetch url [%s] error: bad http response!' % url)
+            _status = int(_status_line[1])
+            _headers = dict()
+            while True:
+                _line = await _reader.readline()
+                if _line in (b'\r\n', b'\n', b''):
+                    break
+                _name, _, _value = _line.decode('latin-1').partition(':')
+                _headers[_name.strip().lower()] = _value.strip()
+
+            if _status != 200:
+                return _status, _headers, b''
+
+            # 报文体
+            if 'chunked' in _headers.get('transfer-encoding', '').lower():
+                _body = await cls._read_chunked(_reader, max_size)
+            elif 'content-length' in _headers.keys():
+                _length = int(_headers['content-length'])
+                if _length > max_size:
+                    raise RuntimeError('Fetch url [%s] error: content size [%d] over limit!' % (
+                        url, _length
+                    ))
+                _body = await _reader.readexactly(_length)
+            else:
+                _body = await cls._read_to_eof(_reader, max_size)
+
+            return _status, _headers, _body
+        finally:
+            _writer.close()
+
+    @classmethod
+    async def _read_chunked(cls, reader, max_size: int) -> bytes:
+        """
+        读取chunked编码的报文体
+
+        @param {asyncio.StreamReader} reader - 数据读取对象
+        @param {int} max_size - 最大字节数
+
+        @returns {bytes} - 报文体内容
+
+        @throws {RuntimeError} - 内容超过最大字节数时抛出异常
+        """
+        _chunks = list()
+        _size = 0
+        while True:
+            _chunk_size = int((await reader.readline()).split(b';')[0].strip(), 16)
+            if _chunk_size == 0:
+                break
+
+            _size += _chunk_size
+            if _size > max_size:
+                raise RuntimeError('Content size over limit [%d]!' % max_size)
+
+            _chunks.append(await reader.readexactly(_chunk_size))
+            await reader.readexactly(2)  # 块结尾的\r\n
+
+        return b''.join(_chunks)
+
+    @classmethod
+    async def _read_to_eof(cls, reader, max_size: int) -> bytes:
+        """
+        读取报文体直到连接关闭
+
+        @param {asyncio.StreamReader} reader - 数据读取对象
+        @param {int} max_size - 最大字节数
+
+        @returns {bytes} - 报文体内容
+
+        @throws {RuntimeError} - 内容超过最大字节数时抛出异常
+        """
+        _chunks = list()
+        _size = 0
+        while True:
+            _data = await reader.read(65536)
+            if _data == b'':
+                break
+
+            _size += len(_data)
+            if _size > max_size:
+                raise RuntimeError('Content size over limit [%d]!' % max_size)
+
+            _chunks.append(_data)
+
+        return b''.join(_chunks)
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -21,6 +21,7 @@ from HiveNetLib.base_tools.run_tool import RunTool
 sys.path.append(os.path.abspath(os.path.join(
     os.path.dirname(__file__), os.path.pardir)))
 from search_by_image.lib.pipeline import PipelineProcesser
+from search_by_image.lib.scheduler import MicroBatchScheduler
 
 
 __MOUDLE__ = 'processer_inception_v4'  # 模块名
@@ -105,13 +106,31 @@ class Tools(object):
 
         _detection_graph = tf.Graph()
         with _detection_graph.as_default():
+            # 图像预处理子图, 只构建一次, 输入为图片bytes数组
+            with tf.name_scope('preprocess'):
+                _image_bytes = tf.placeholder(tf.string, shape=[None], name='image_bytes')
+                _image_data = tf.map_fn(
+                    lambda _bytes: cls.inception_v4_preprocess_image(
+                        tf.image.decode_jpeg(_bytes, channels=3),
+                        _graph['image_size'], _graph['image_size']
+                    ),
+                    _image_bytes, dtype=tf.float32
+                )
+
+            # 装载模型, 并将模型输入直接对接预处理子图的输出
             _od_graph_def = tf.GraphDef()
             with tf.gfile.GFile(_pb_file, 'rb') as _fid:
                 _serialized_graph = _fid.read()
                 _od_graph_def.ParseFromString(_serialized_graph)
-                tf.import_graph_def(_od_graph_def, name='')
+                tf.import_graph_def(
+                    _od_graph_def, input_map={'input:0': _image_data}, name=''
+                )
 
-            _graph['session'] = tf.Session(graph=_detection_graph)
+        _detection_graph.finalize()  # 禁止后续再往图中增加节点
+        _graph['session'] = tf.Session(graph=_detection_graph)
+
+        # 图片输入
+        _graph['image_bytes'] = _image_bytes
 
         # 图像分类出口
         _graph['softmax_tensor'] = _detection_graph.get_tensor_by_name(
@@ -121,6 +140,16 @@ class Tools(object):
         _graph['vertor_tensor'] = _detection_graph.get_tensor_by_name(
             'InceptionV4/Logits/AvgPool_1a/AvgPool:0')
 
+        # 并发请求合并为批量处理，一次同时获取特征变量及分类结果
+        if _config.get('batch_size', 1) > 1:
+            _graph['scheduler'] = MicroBatchScheduler(
+                processer_name,
+                lambda _images: list(zip(*cls.inception_v4_run(
+                    _graph, [_graph['vertor_tensor'], _graph['softmax_tensor']], _images
+                ))),
+                batch_size=_config['batch_size'], batch_delay=_config.get('batch_delay', 0.005)
+            )
+
     @classmethod
     def inception_v4_preprocess_image(cls, image, height, width, central_fraction=None):
         if image.dtype != tf.float32:
@@ -140,6 +169,36 @@ class Tools(object):
         image = tf.multiply(image, 2.0)
         return image
 
+    @classmethod
+    def inception_v4_run(cls, graph: dict, tensor, images: list):
+        """
+        执行inception_v4模型(含图像预处理)
+
+        @param {dict} graph - 初始化后的模型信息字典
+        @param {tf.Tensor} tensor - 要获取的输出张量
+        @param {list} images - 要处理的图片bytes对象清单
+
+        @returns {numpy.ndarray} - 输出张量的值, 第一维对应每张图片
+        """
+        return graph['session'].run(tensor, {graph['image_bytes']: images})
+
+    @classmethod
+    def inception_v4_predict(cls, graph: dict, image: bytes, tensor_name: str):
+        """
+        获取单张图片的模型输出，有批量调度器时提交到调度器合并执行
+
+        @param {dict} graph - 初始化后的模型信息字典
+        @param {bytes} image - 图片bytes对象
+        @param {str} tensor_name - 输出张量名, vertor_tensor 或 softmax_tensor
+
+        @returns {numpy.ndarray} - 该图片对应的输出值(不含批次维度)
+        """
+        if 'scheduler' in graph.keys():
+            _vertor, _softmax = graph['scheduler'].submit(image)
+            return _vertor if tensor_name == 'vertor_tensor' else _softmax
+
+        return cls.inception_v4_run(graph, graph[tensor_name], [image])[0]
+
 
 class InceptionV4Vertor(PipelineProcesser):
     """
@@ -152,6 +211,9 @@ class InceptionV4Vertor(PipelineProcesser):
             <encoding>utf-8</encoding>
             <image_size type="int">299</image_size>
             <min_score type="float">0.1</min_score>
+            <!-- 并发请求合并批量处理的最大数量, 大于1才启用, 以及等待凑批的最长时间(秒) -->
+            <batch_size type="int">1</batch_size>
+            <batch_delay type="float">0.005</batch_delay>
         </InceptionV4Vertor>
     """
 
@@ -195,19 +257,8 @@ class InceptionV4Vertor(PipelineProcesser):
         """
         _graph = RunTool.get_global_var(PR_INCEPTION_V4_VERTOR_GRAPH)
 
-        # 进行图像预处理
-        with tf.Graph().as_default():
-            _image_data = tf.image.decode_jpeg(input_data['image'])
-            _image_data = Tools.inception_v4_preprocess_image(
-                _image_data, _graph['image_size'], _graph['image_size']
-            )
-            _image_data = tf.expand_dims(_image_data, 0)
-            with tf.Session() as sess:
-                # pass
-                _image_data = sess.run(_image_data)
-
-        # 运行模型
-        _predictions = _graph['session'].run(_graph['vertor_tensor'], {'input:0': _image_data})
+        # 运行模型(图像预处理已包含在模型图中)
+        _predictions = Tools.inception_v4_predict(_graph, input_data['image'], 'vertor_tensor')
         _predictions = np.squeeze(_predictions)
 
         # 返回特征变量
@@ -268,19 +319,8 @@ class InceptionV4Classifier(PipelineProcesser):
         """
         _graph = RunTool.get_global_var(PR_INCEPTION_V4_VERTOR_GRAPH)
 
-        # 进行图像预处理
-        with tf.Graph().as_default():
-            _image_data = tf.image.decode_jpeg(input_data['image'])
-            _image_data = Tools.inception_v4_preprocess_image(
-                _image_data, _graph['image_size'], _graph['image_size']
-            )
-            _image_data = tf.expand_dims(_image_data, 0)
-            with tf.Session() as sess:
-                # pass
-                _image_data = sess.run(_image_data)
-
-        # 运行模型
-        _predictions = _graph['session'].run(_graph['softmax_tensor'], {'input:0': _image_data})
+        # 运行模型(图像预处理已包含在模型图中)
+        _predictions = Tools.inception_v4_predict(_graph, input_data['image'], 'softmax_tensor')
         _predictions = np.squeeze(_predictions)
 
         # 排序
@@ -18,7 +18,6 @@ import os
 import sys
 import math
 import copy
-from io import BytesIO
 import tensorflow as tf
 from PIL import Image
 import numpy as np
@@ -27,6 +26,8 @@ from HiveNetLib.base_tools.run_tool import RunTool
 sys.path.append(os.path.abspath(os.path.join(
     os.path.dirname(__file__), os.path.pardir)))
 from search_by_image.lib.pipeline import Pipeline, PipelineProcesser
+from search_by_image.lib.scheduler import MicroBatchScheduler
+from search_by_image.lib.image_carrier import ImageCarrier
 
 
 __MOUDLE__ = 'processer'  # 模块名
@@ -109,9 +110,12 @@ class Tools(object):
     def load_image_into_numpy_array(cls, image):
         """
         将图片转换为numpy数组
+
+        @param {ImageCarrier|PIL.Image.Image|numpy.ndarray|bytes} image - 图片数据
+
+        @returns {numpy.ndarray} - 形状为(height, width, 3)的uint8只读数组，图片载体已解码时直接共享
         """
-        (im_width, im_height) = image.size
-        return np.array(image.getdata()).reshape((im_height, im_width, 3)).astype(np.uint8)
+        return ImageCarrier.wrap(image).array
 
     @classmethod
     def reframe_box_masks_to_image_masks(cls, box_masks, boxes, image_height,
@@ -213,6 +217,94 @@ class Tools(object):
         # Number of objects detected
         _graph['num_detections'] = _detection_graph.get_tensor_by_name('num_detections:0')
 
+        # 并发请求合并为批量识别
+        cls.create_batch_scheduler(
+            _graph, _config, processer_name, lambda _images: cls.detect_batch_run(_graph, _images)
+        )
+
+    @classmethod
+    def create_batch_scheduler(cls, graph: dict, config: dict, processer_name: str, batch_fun):
+        """
+        根据处理器配置创建微批量调度器，放入graph['scheduler']
+        注：batch_size配置大于1才创建调度器
+
+        @param {dict} graph - 模型信息字典
+        @param {dict} config - 处理器配置
+            batch_size {int} - 每批最大处理数量，默认为1(不进行批量处理)
+            batch_delay {float} - 等待凑批的最长时间，单位为秒，默认0.005
+        @param {str} processer_name - 处理器名
+        @param {function} batch_fun - 批量执行函数，fun(items:list) -> list
+        """
+        if config.get('batch_size', 1) > 1:
+            graph['scheduler'] = MicroBatchScheduler(
+                processer_name, batch_fun, batch_size=config['batch_size'],
+                batch_delay=config.get('batch_delay', 0.005)
+            )
+
+    @classmethod
+    def pad_images_to_batch(cls, images: list):
+        """
+        将大小不一的图片数组右下补黑边后合并为一个批次
+
+        @param {list} images - 图片numpy数组清单, 每个数组形状为(height, width, 3)
+
+        @returns {numpy.ndarray, list} - 返回 批次数组(batch, max_height, max_width, 3),
+            每张图片从批次坐标转换回原图坐标的框比例清单[numpy.ndarray([ymin, xmin, ymax, xmax]比例), ...]
+        """
+        _max_height = max([_image.shape[0] for _image in images])
+        _max_width = max([_image.shape[1] for _image in images])
+        _batch = np.zeros((len(images), _max_height, _max_width, 3), dtype=np.uint8)
+        _scales = list()
+        for _i, _image in enumerate(images):
+            _batch[_i, :_image.shape[0], :_image.shape[1], :] = _image
+            _h_scale = _max_height / float(_image.shape[0])
+            _w_scale = _max_width / float(_image.shape[1])
+            _scales.append(np.array([_h_scale, _w_scale, _h_scale, _w_scale], dtype=np.float32))
+
+        return _batch, _scales
+
+    @classmethod
+    def detect_run(cls, graph: dict, image_np):
+        """
+        执行物体识别，有批量调度器时提交到调度器合并执行
+
+        @param {dict} graph - 模型信息字典
+        @param {numpy.ndarray} image_np - 图片数组，形状为(height, width, 3)
+
+        @returns {numpy.ndarray, numpy.ndarray, numpy.ndarray} - 返回 boxes, scores, classes
+        """
+        if 'scheduler' in graph.keys():
+            return graph['scheduler'].submit(image_np)
+
+        (_boxes, _scores, _classes, _num) = graph['session'].run(
+            [graph['detection_boxes'], graph['detection_scores'],
+             graph['detection_classes'], graph['num_detections']],
+            feed_dict={graph['image_tensor']: np.expand_dims(image_np, axis=0)})
+
+        return np.squeeze(_boxes), np.squeeze(_scores), np.squeeze(_classes)
+
+    @classmethod
+    def detect_batch_run(cls, graph: dict, images: list) -> list:
+        """
+        批量执行物体识别
+
+        @param {dict} graph - 模型信息字典
+        @param {list} images - 图片数组清单
+
+        @returns {list} - 与图片清单对应的识别结果清单, [(boxes, scores, classes), ...]
+        """
+        _batch, _scales = cls.pad_images_to_batch(images)
+        (_boxes, _scores, _classes, _num) = graph['session'].run(
+            [graph['detection_boxes'], graph['detection_scores'],
+             graph['detection_classes'], graph['num_detections']],
+            feed_dict={graph['image_tensor']: _batch})
+
+        # 将补边后的坐标转换回原图坐标
+        return [
+            (np.minimum(_boxes[_i] * _scales[_i], 1.0), _scores[_i], _classes[_i])
+            for _i in range(len(images))
+        ]
+
     @classmethod
     def detect_processer_execute(cls, graph_var_name: str, processer_name: str, input_data,
                                  context: dict, pipeline_obj):
@@ -226,7 +318,7 @@ class Tools(object):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -237,7 +329,7 @@ class Tools(object):
                 {
                     'type': # {str} 识别到的对象分类, ''代表没有找到分类
                     'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                    'image': # {PIL.Image.Image} 通过截图处理后的图片对象
+                    'image': # {ImageCarrier} 通过截图处理后的图片载体
                     'score': # {float} 匹配分数
                 }
         """
@@ -248,20 +340,14 @@ class Tools(object):
         _config = RunTool.get_global_var('PIPELINE_PROCESSER_PARA')[processer_name]
         _graph = RunTool.get_global_var(graph_var_name)
 
-        # 准备图片
-        _image = input_data['image']
-        _image_np = Tools.load_image_into_numpy_array(_image)
-        _image_np_expanded = np.expand_dims(_image_np, axis=0)
+        # 准备图片, 载体放回输入数据，未匹配直接返回时后续处理器可复用已解码的数组
+        _carrier = ImageCarrier.wrap(input_data['image'])
+        input_data['image'] = _carrier
+        _image = _carrier.image
+        _image_np = _carrier.array
 
         # 进行识别
-        (_boxes, _scores, _classes, _num) = _graph['session'].run(
-            [_graph['detection_boxes'], _graph['detection_scores'],
-             _graph['detection_classes'], _graph['num_detections']],
-            feed_dict={_graph['image_tensor']: _image_np_expanded})
-
-        _np_scores = np.squeeze(_scores)
-        _np_boxes = np.squeeze(_boxes)
-        _np_classes = np.squeeze(_classes)
+        _np_boxes, _np_scores, _np_classes = cls.detect_run(_graph, _image_np)
 
         # 区分不同情况的图片获取
         _index = 0
@@ -351,19 +437,19 @@ class Tools(object):
             # 没有找到最佳匹配的图片, 直接返回原图片的输入信息即可
             return input_data
 
+        _source_box = None  # 截图在原图中的位置比例
         if not (processer_name == 'PendantTypeDetect' and input_data['type'] in ['earrings', 'chain']):
             # 非耳环和项链的二次挂件识别，进行截图处理
-            _ymin = int(_np_boxes[_match_index][0] * _image.size[1])
-            _xmin = int(_np_boxes[_match_index][1] * _image.size[0])
-            _ymax = int(_np_boxes[_match_index][2] * _image.size[1])
-            _xmax = int(_np_boxes[_match_index][3] * _image.size[0])
-            _obj_image = _image.crop((_xmin, _ymin, _xmax, _ymax))
+            _obj_image, _source_box = cls.crop_by_box(
+                input_data, _np_boxes[_match_index], min_crop_side=_config.get('min_crop_side', 299)
+            )
 
             if processer_name == 'PendantTypeDetect':
                 # 挂件，获取中间部分，以去掉非翡翠部分背景
                 _obj_image = cls.get_image_center(
                     _obj_image, center_field=_config.get('cut_center_field', 0.7)
                 )
+                _source_box = None  # 截取中间部分后不再对应原图位置
 
         # 处理类型
         _type = _graph['labelmap'][int(_np_classes[_match_index])]
@@ -383,12 +469,18 @@ class Tools(object):
             _type = input_data['type']
 
         # 如果执行两次判断，则第二次为子分类
-        return {
+        _output = {
             'type': _type,
             'sub_type': _sub_type,
-            'image': _obj_image,
+            'image': ImageCarrier(image=_obj_image),
             'score': float(_np_scores[_match_index])
         }
+        if _source_box is not None:
+            # 保留原图，后续识别的截图过小时可从原图截取
+            _output['source'] = input_data['source']
+            _output['source_box'] = _source_box
+
+        return _output
 
     @classmethod
     def mask_processer_initialize(cls, graph_var_name: str, processer_name: str):
@@ -436,9 +528,103 @@ class Tools(object):
             if _tensor_name in _all_tensor_names:
                 _tensor_dict[key] = _mask_graph.get_tensor_by_name(_tensor_name)
 
+        # 模型原始输出，批量执行时使用
+        _raw_tensor_dict = copy.copy(_tensor_dict)
+
+        # 掩码图片处理子图，只在初始化时构建一次，图片大小通过占位符传入，避免每次执行时图不断增长
+        with _mask_graph.as_default():
+            _image_height = tf.placeholder(tf.int32, shape=[], name='mask_image_height')
+            _image_width = tf.placeholder(tf.int32, shape=[], name='mask_image_width')
+            _detection_boxes = tf.squeeze(_tensor_dict['detection_boxes'], [0])
+            _detection_masks = tf.squeeze(_tensor_dict['detection_masks'], [0])
+            # Reframe is required to translate mask from box coordinates to image coordinates and fit the image size.
+            _real_num_detection = tf.cast(_tensor_dict['num_detections'][0], tf.int32)
+            _detection_boxes = tf.slice(_detection_boxes, [0, 0], [_real_num_detection, -1])
+            _detection_masks = tf.slice(
+                _detection_masks, [0, 0, 0], [_real_num_detection, -1, -1])
+            _detection_masks_reframed = cls.reframe_box_masks_to_image_masks(
+                _detection_masks, _detection_boxes, _image_height, _image_width)
+            _detection_masks_reframed = tf.cast(
+                tf.greater(_detection_masks_reframed, 0.5), tf.uint8)
+            # Follow the convention by adding back the batch dimension
+            _tensor_dict['detection_masks'] = tf.expand_dims(
+                _detection_masks_reframed, 0)
+
+        _mask_graph.finalize()  # 禁止后续再往图中增加节点
+
         _graph['session'] = tf.Session(graph=_mask_graph)
         _graph['tensor_dict'] = _tensor_dict
         _graph['image_tensor'] = _mask_graph.get_tensor_by_name('image_tensor:0')
+        _graph['image_height'] = _image_height
+        _graph['image_width'] = _image_width
+        _graph['raw_tensor_dict'] = _raw_tensor_dict
+
+        # 并发请求合并为批量识别
+        cls.create_batch_scheduler(
+            _graph, _config, processer_name, lambda _images: cls.mask_batch_run(_graph, _images)
+        )
+
+    @classmethod
+    def mask_run(cls, graph: dict, image_np) -> dict:
+        """
+        执行对象掩码识别，有批量调度器时提交到调度器合并执行
+
+        @param {dict} graph - 模型信息字典
+        @param {numpy.ndarray} image_np - 图片数组，形状为(height, width, 3)
+
+        @returns {dict} - 识别结果字典，各项结果均带批次维度(批次大小为1)
+        """
+        if 'scheduler' in graph.keys():
+            return graph['scheduler'].submit(image_np)
+
+        return graph['session'].run(
+            graph['tensor_dict'],
+            feed_dict={
+                graph['image_tensor']: np.expand_dims(image_np, axis=0),
+                graph['image_height']: image_np.shape[0],
+                graph['image_width']: image_np.shape[1]
+            }
+        )
+
+    @classmethod
+    def mask_batch_run(cls, graph: dict, images: list) -> list:
+        """
+        批量执行对象掩码识别
+        模型部分按批次执行，掩码还原到原图大小的部分通过送入模型中间结果逐张执行
+
+        @param {dict} graph - 模型信息字典
+        @param {list} images - 图片数组清单
+
+        @returns {list} - 与图片清单对应的识别结果字典清单
+        """
+        _batch, _scales = cls.pad_images_to_batch(images)
+        _raw_output = graph['session'].run(
+            graph['raw_tensor_dict'], feed_dict={graph['image_tensor']: _batch}
+        )
+
+        _raw_dict = graph['raw_tensor_dict']
+        _results = list()
+        for _i in range(len(images)):
+            _boxes = np.minimum(_raw_output['detection_boxes'][_i:_i + 1] * _scales[_i], 1.0)
+            _masks = graph['session'].run(
+                graph['tensor_dict']['detection_masks'],
+                feed_dict={
+                    _raw_dict['num_detections']: _raw_output['num_detections'][_i:_i + 1],
+                    _raw_dict['detection_boxes']: _boxes,
+                    _raw_dict['detection_masks']: _raw_output['detection_masks'][_i:_i + 1],
+                    graph['image_height']: images[_i].shape[0],
+                    graph['image_width']: images[_i].shape[1]
+                }
+            )
+            _results.append({
+                'num_detections': _raw_output['num_detections'][_i:_i + 1],
+                'detection_boxes': _boxes,
+                'detection_scores': _raw_output['detection_scores'][_i:_i + 1],
+                'detection_classes': _raw_output['detection_classes'][_i:_i + 1],
+                'detection_masks': _masks
+            })
+
+        return _results
 
     @classmethod
     def mask_processer_execute(cls, graph_var_name: str, processer_name: str, input_data,
@@ -453,7 +639,7 @@ class Tools(object):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -464,38 +650,19 @@ class Tools(object):
                 {
                     'type': # {str} 识别到的对象分类, ''代表没有找到分类
                     'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                    'image': # {PIL.Image.Image} 通过截图处理后的图片对象
+                    'image': # {ImageCarrier} 通过截图处理后的图片载体
                     'score': # {float} 匹配分数
                 }
         """
         # _config = RunTool.get_global_var('PIPELINE_PROCESSER_PARA')[processer_name]
         _graph = RunTool.get_global_var(graph_var_name)
-        _tensor_dict = copy.copy(_graph['tensor_dict'])
 
         # 准备图片
-        _image = input_data['image']
-        _image_np_expanded = np.expand_dims(_image, axis=0)
-
-        # 掩码图片处理
-        _detection_boxes = tf.squeeze(_tensor_dict['detection_boxes'], [0])
-        _detection_masks = tf.squeeze(_tensor_dict['detection_masks'], [0])
-        # Reframe is required to translate mask from box coordinates to image coordinates and fit the image size.
-        _real_num_detection = tf.cast(_tensor_dict['num_detections'][0], tf.int32)
-        _detection_boxes = tf.slice(_detection_boxes, [0, 0], [_real_num_detection, -1])
-        _detection_masks = tf.slice(_detection_masks, [0, 0, 0], [_real_num_detection, -1, -1])
-        # detection_masks_reframed = utils_ops.reframe_box_masks_to_image_masks(
-        #     detection_masks, detection_boxes, image.shape[0], image.shape[1])
-        _detection_masks_reframed = cls.reframe_box_masks_to_image_masks(
-            _detection_masks, _detection_boxes, _image.size[1], _image.size[0])
-        _detection_masks_reframed = tf.cast(
-            tf.greater(_detection_masks_reframed, 0.5), tf.uint8)
-        # Follow the convention by adding back the batch dimension
-        _tensor_dict['detection_masks'] = tf.expand_dims(
-            _detection_masks_reframed, 0)
+        _carrier = ImageCarrier.wrap(input_data['image'])
+        input_data['image'] = _carrier
 
-        # 进行识别
-        _output_dict = _graph['session'].run(_tensor_dict,
-                                             feed_dict={_graph['image_tensor']: _image_np_expanded})
+        # 进行识别, 掩码处理子图已在初始化时构建，只需传入图片大小
+        _output_dict = cls.mask_run(_graph, _carrier.array)
 
         # all outputs are float32 numpy arrays, so convert types as appropriate
         _output_dict['num_detections'] = int(_output_dict['num_detections'][0])
@@ -511,15 +678,35 @@ class Tools(object):
 
         # 进行图片处理，仅保留mask部分内容，其余部分为黑色
         input_data['score'] = _output_dict['detection_scores']
-        _image_pix = _image.load()
-        for _x in range(_image.size[0]):
-            for _y in range(_image.size[1]):
-                if _output_dict['detection_masks'][_y][_x] == 0:
-                    _image_pix[_x, _y] = (0, 0, 0)
-
-        input_data['image'] = _image
+        input_data['image'] = ImageCarrier(
+            image=cls.apply_image_mask(_carrier.array, _output_dict['detection_masks'])
+        )
+        # 掩码处理后的图片不再与原图对应
+        input_data.pop('source', None)
+        input_data.pop('source_box', None)
         return input_data
 
+    @classmethod
+    def apply_image_mask(cls, image, mask):
+        """
+        对图片应用掩码，仅保留掩码部分内容，其余部分设置为黑色
+
+        @param {PIL.Image.Image|numpy.ndarray} image - 要处理的图片对象或图片数组
+        @param {numpy.ndarray} mask - 与图片大小一致的掩码数组，形状为(height, width)，0代表非掩码区域
+
+        @returns {PIL.Image.Image} - 处理后的图片对象
+        """
+        _image_np = np.array(image)  # 复制一份可写的数组
+        _keep = (np.asarray(mask) != 0)
+        if _image_np.ndim == 2:
+            _image_np *= _keep.astype(_image_np.dtype)
+        else:
+            # 只处理颜色通道(与(0, 0, 0)的处理一致)，透明通道保持不变
+            _channels = min(_image_np.shape[2], 3)
+            _image_np[..., :_channels] *= _keep[..., None].astype(_image_np.dtype)
+
+        return Image.fromarray(_image_np)
+
     @classmethod
     def get_image_center(cls, image, center_field: float = 1.0):
         """
@@ -535,6 +722,44 @@ class Tools(object):
         _y_cut = round((image.size[1] * (1.0 - _center_field)) / 2.0)
         return image.crop((_x_cut, _y_cut, image.size[0] - _x_cut, image.size[0] - _y_cut))
 
+    @classmethod
+    def crop_by_box(cls, input_data: dict, box, min_crop_side: int = 0):
+        """
+        按识别框截图
+        当前图片为缩小后的图片(输入数据中有原图source)且截图的短边小于min_crop_side时，将识别框映射到原图上截图
+
+        @param {dict} input_data - 处理器输入数据，使用以下信息
+            {
+                'image': # {ImageCarrier|PIL.Image.Image} 当前图片
+                'source': # {ImageCarrier} 可选，原图载体
+                'source_box': # {tuple} 可选，当前图片在原图中的位置比例(ymin, xmin, ymax, xmax)
+            }
+        @param {numpy.ndarray} box - 识别框在当前图片中的位置比例[ymin, xmin, ymax, xmax]
+        @param {int} min_crop_side=0 - 截图的最小短边，单位为像素
+
+        @returns {PIL.Image.Image, tuple} - 返回 截图, 截图在原图中的位置比例(没有原图时为None)
+        """
+        _image = ImageCarrier.wrap(input_data['image']).image
+        _ymin, _xmin, _ymax, _xmax = [float(_v) for _v in box]
+        _source = input_data.get('source', None)
+        _source_box = None
+        if _source is not None:
+            _top, _left, _bottom, _right = input_data['source_box']
+            _source_box = (
+                _top + _ymin * (_bottom - _top), _left + _xmin * (_right - _left),
+                _top + _ymax * (_bottom - _top), _left + _xmax * (_right - _left)
+            )
+            _crop_side = min((_xmax - _xmin) * _image.size[0], (_ymax - _ymin) * _image.size[1])
+            if _crop_side < min_crop_side and _source.size[0] * (_right - _left) > _image.size[0]:
+                # 截图过小，从原图截取(此时才解码原图)
+                _image = _source.image
+                _ymin, _xmin, _ymax, _xmax = _source_box
+
+        return _image.crop((
+            int(_xmin * _image.size[0]), int(_ymin * _image.size[1]),
+            int(_xmax * _image.size[0]), int(_ymax * _image.size[1])
+        )), _source_box
+
     @classmethod
     def rgb_to_hsv(cls, rgb: tuple):
         """
@@ -632,6 +857,102 @@ class Tools(object):
         # 返回转换后的颜色坐标
         return (h, s, v)
 
+    @classmethod
+    def rgb_to_hsv_array(cls, rgb: np.ndarray):
+        """
+        将RGB颜色数组批量转换为HSV坐标(rgb_to_hsv的numpy向量化版本, 计算结果一致)
+
+        @param {numpy.ndarray} rgb - 形状为(..., 3)的RGB颜色数组
+
+        @returns {tuple} - 转换后的HSV坐标数组(h:numpy.ndarray, s:numpy.ndarray, v:numpy.ndarray)
+        """
+        _rgb = rgb.astype(np.float64) / 255.0
+        r, g, b = _rgb[..., 0], _rgb[..., 1], _rgb[..., 2]
+        mx = np.maximum(np.maximum(r, g), b)
+        mn = np.minimum(np.minimum(r, g), b)
+        df = mx - mn
+        _df = np.where(df == 0, 1.0, df)  # 避免除零, 该部分结果不会被选用
+
+        # 按原算法的判断顺序选择H值
+        h = np.select(
+            [mx == mn, mx == r, mx == g],
+            [
+                0.0,
+                (60 * ((g - b) / _df) + 360) % 360,
+                (60 * ((b - r) / _df) + 120) % 360
+            ],
+            default=(60 * ((r - g) / _df) + 240) % 360
+        )
+        s = np.where(mx == 0, 0.0, df / np.where(mx == 0, 1.0, mx))
+        v = mx
+
+        return (h, s, v)
+
+    @classmethod
+    def hsv_to_rgb_array(cls, h: np.ndarray, s: np.ndarray, v: np.ndarray):
+        """
+        将HSV坐标数组批量转换为RGB颜色(hsv_to_rgb的numpy向量化版本, 计算结果一致)
+
+        @param {numpy.ndarray} h - H坐标数组
+        @param {numpy.ndarray} s - S坐标数组
+        @param {numpy.ndarray} v - V坐标数组
+
+        @returns {numpy.ndarray} - 转换后形状为(..., 3)的RGB颜色数组(uint8)
+        """
+        h60 = h / 60.0
+        h60f = np.floor(h60)
+        hi = h60f.astype(np.int64) % 6
+        f = h60 - h60f
+        p = v * (1 - s)
+        q = v * (1 - f * s)
+        t = v * (1 - (1 - f) * s)
+        _conds = [hi == 0, hi == 1, hi == 2, hi == 3, hi == 4, hi == 5]
+        r = np.select(_conds, [v, q, p, p, t, v], default=0)
+        g = np.select(_conds, [t, v, v, q, p, p], default=0)
+        b = np.select(_conds, [p, p, t, v, v, q], default=0)
+
+        # astype 与 int() 一样向0截断
+        return np.stack(
+            [(r * 255).astype(np.int64), (g * 255).astype(np.int64), (b * 255).astype(np.int64)],
+            axis=-1
+        ).astype(np.uint8)
+
+    @classmethod
+    def hsv_cluster_array(cls, h: np.ndarray, s: np.ndarray, v: np.ndarray,
+                          h_split_num: int, s_split_num: int, v_split_num: int):
+        """
+        HSV坐标聚类算法(hsv_cluster的numpy向量化版本, 计算结果一致)
+        注：numpy.round与python的round一样采用四舍六入五成双的规则
+
+        @param {numpy.ndarray} h - H坐标数组
+        @param {numpy.ndarray} s - S坐标数组
+        @param {numpy.ndarray} v - V坐标数组
+        @param {int} h_split_num - 颜色坐标(H [0, 360])的分割数量(按360度平均切割数量)
+        @param {int} s_split_num - 饱和度坐标(S [0, 1])的分割数量
+        @param {int} v_split_num - 亮度坐标(V [0, 1])的分割数量
+
+        @returns {tuple} - 返回转换后的HSV坐标数组(h:numpy.ndarray, s:numpy.ndarray, v:numpy.ndarray)
+        """
+        # H坐标聚合，环形
+        df = 360.0 / h_split_num
+        _h = np.round(h / df) * df
+        _h[_h >= 360] = 0.0
+
+        # S坐标聚合，直线型，包含两个端点
+        if s_split_num <= 1:
+            _s = np.full(s.shape, 1.0)
+        else:
+            df = 1.0 / (s_split_num - 1)
+            _s = np.round(s / df) * df
+
+        if v_split_num <= 1:
+            _v = np.full(v.shape, 1.0)
+        else:
+            df = 1.0 / (v_split_num - 1)
+            _v = np.round(v / df) * df
+
+        return (_h, _s, _v)
+
 
 class JadeTypeDetect(PipelineProcesser):
     """
@@ -643,6 +964,11 @@ class JadeTypeDetect(PipelineProcesser):
             <labelmap>../test_data/tf_models/jade_type/labelmap.pbtxt</labelmap>
             <encoding>utf-8</encoding>
             <min_score type="float">0.8</min_score>
+            <!-- 并发请求合并批量识别的最大数量, 大于1才启用, 以及等待凑批的最长时间(秒) -->
+            <batch_size type="int">1</batch_size>
+            <batch_delay type="float">0.005</batch_delay>
+            <!-- 输入图片被缩小时, 截图短边小于该值则从原图截取, 单位为像素 -->
+            <min_crop_side type="int">299</min_crop_side>
         </JadeTypeDetect>
     """
     @classmethod
@@ -672,7 +998,7 @@ class JadeTypeDetect(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -683,7 +1009,7 @@ class JadeTypeDetect(PipelineProcesser):
                 {
                     'type': # {str} 识别到的对象分类, ''代表没有找到分类
                     'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                    'image': # {PIL.Image.Image} 通过截图处理后的图片对象
+                    'image': # {ImageCarrier} 通过截图处理后的图片载体
                     'score': # {float} 匹配分数
                 }
         """
@@ -703,6 +1029,11 @@ class PendantTypeDetect(PipelineProcesser):
             <encoding>utf-8</encoding>
             <min_score type="float">0.8</min_score>
             <cut_center_field type="float">0.7</cut_center_field>
+            <!-- 并发请求合并批量识别的最大数量, 大于1才启用, 以及等待凑批的最长时间(秒) -->
+            <batch_size type="int">1</batch_size>
+            <batch_delay type="float">0.005</batch_delay>
+            <!-- 输入图片被缩小时, 截图短边小于该值则从原图截取, 单位为像素 -->
+            <min_crop_side type="int">299</min_crop_side>
         </PendantTypeDetect>
     """
     @classmethod
@@ -732,7 +1063,7 @@ class PendantTypeDetect(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -743,7 +1074,7 @@ class PendantTypeDetect(PipelineProcesser):
                 {
                     'type': # {str} 识别到的对象分类, ''代表没有找到分类
                     'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                    'image': # {PIL.Image.Image} 通过截图处理后的图片对象
+                    'image': # {ImageCarrier} 通过截图处理后的图片载体
                     'score': # {float} 匹配分数
                 }
         """
@@ -762,6 +1093,9 @@ class BangleMaskDetect(PipelineProcesser):
             <labelmap>../test_data/tf_models/bangle_mask/labelmap.pbtxt</labelmap>
             <encoding>utf-8</encoding>
             <min_score type="float">0.8</min_score>
+            <!-- 并发请求合并批量识别的最大数量, 大于1才启用, 以及等待凑批的最长时间(秒) -->
+            <batch_size type="int">1</batch_size>
+            <batch_delay type="float">0.005</batch_delay>
         </BangleMaskDetect>
     """
     @classmethod
@@ -791,7 +1125,7 @@ class BangleMaskDetect(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -802,7 +1136,7 @@ class BangleMaskDetect(PipelineProcesser):
                 {
                     'type': # {str} 识别到的对象分类, ''代表没有找到分类
                     'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                    'image': # {PIL.Image.Image} 通过截图处理后的图片对象
+                    'image': # {ImageCarrier} 通过截图处理后的图片载体
                     'score': # {float} 匹配分数
                 }
         """
@@ -838,7 +1172,7 @@ class HistogramVetor(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -848,7 +1182,7 @@ class HistogramVetor(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier} 转换大小后的图片载体
                 'score': # {float} 匹配分数
                 'vertor': # {numpy.ndarray} 特征向量
             }
@@ -857,7 +1191,7 @@ class HistogramVetor(PipelineProcesser):
         _size = _config.get('image_size', 299)
 
         # 转换图片大小
-        _image = input_data['image']
+        _image = ImageCarrier.wrap(input_data['image']).image
         _image = _image.resize((_size, _size)).convert("RGB")
         _histogram = _image.histogram()
 
@@ -868,7 +1202,7 @@ class HistogramVetor(PipelineProcesser):
 
         # 返回特征变量
         input_data['vertor'] = np.array(_normalize)
-        input_data['image'] = _image
+        input_data['image'] = ImageCarrier(image=_image)
         return input_data
 
 
@@ -878,6 +1212,13 @@ class HSVClusterHistogramVetor(PipelineProcesser):
 
     @example 管道的processer_para配置如下
         <HSVClusterHistogramVetor>
+            <image_size type="int">299</image_size>
+            <h_split_num type="int">6</h_split_num>
+            <s_split_num type="int">4</s_split_num>
+            <v_split_num type="int">3</v_split_num>
+            <remove_line type="float">0.01</remove_line>
+            <!-- 计算引擎, numpy-向量化计算(默认), python-逐像素计算, 两者结果一致 -->
+            <engine>numpy</engine>
         </HSVClusterHistogramVetor>
     """
 
@@ -900,7 +1241,7 @@ class HSVClusterHistogramVetor(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -910,7 +1251,7 @@ class HSVClusterHistogramVetor(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier} 转换大小后的图片载体
                 'score': # {float} 匹配分数
                 'vertor': # {numpy.ndarray} 特征向量
             }
@@ -921,18 +1262,112 @@ class HSVClusterHistogramVetor(PipelineProcesser):
         _s_split_num = _config.get('s_split_num', 4)
         _v_split_num = _config.get('v_split_num', 3)
         _remove_line = _config.get('remove_line', 0.01)
+        _engine = _config.get('engine', 'numpy')
 
         # 转换图片大小
-        _image = input_data['image']
+        _image = ImageCarrier.wrap(input_data['image']).image
         _image = _image.resize((_size, _size)).convert("RGB")
 
+        if _engine == 'python':
+            _image, _normalize = cls._histogram_by_python(
+                _image, _h_split_num, _s_split_num, _v_split_num, _remove_line
+            )
+        else:
+            _image, _normalize = cls._histogram_by_numpy(
+                _image, _h_split_num, _s_split_num, _v_split_num, _remove_line
+            )
+
+        # 返回特征变量
+        input_data['vertor'] = np.array(_normalize)
+        input_data['image'] = ImageCarrier(image=_image)
+        return input_data
+
+    #############################
+    # 内部函数
+    #############################
+    @classmethod
+    def _histogram_by_numpy(cls, image, h_split_num: int, s_split_num: int, v_split_num: int,
+                            remove_line: float):
+        """
+        通过numpy向量化计算HSV聚类直方图
+
+        @param {PIL.Image.Image} image - 已转换大小的RGB图片对象
+        @param {int} h_split_num - H坐标的分割数量
+        @param {int} s_split_num - S坐标的分割数量
+        @param {int} v_split_num - V坐标的分割数量
+        @param {float} remove_line - 消除小值的比例
+
+        @returns {tuple} - (聚类颜色后的图片对象, 归一化后的直方图numpy.ndarray)
+        """
+        _dimension = h_split_num * s_split_num * v_split_num
+
+        # 转换为hsv坐标并执行聚类
+        _h, _s, _v = Tools.rgb_to_hsv_array(np.asarray(image))
+        _h, _s, _v = Tools.hsv_cluster_array(
+            _h, _s, _v, h_split_num, s_split_num, v_split_num
+        )
+
+        # 修改图片
+        _image = Image.fromarray(Tools.hsv_to_rgb_array(_h, _s, _v), mode='RGB')
+
+        # 删除黑色的点，减少背景的干扰
+        _keep = ~((_h == 0.0) & (_s == 0.0) & (_v == 0.0))
+        _h, _s, _v = _h[_keep], _s[_keep], _v[_keep]
+
+        # 计算每个像素的直方图索引
+        _h_index = np.round(_h / (360.0 / h_split_num)).astype(np.int64)
+        if s_split_num <= 1:
+            _s_index = np.zeros(_s.shape, dtype=np.int64)
+        else:
+            _s_index = np.round(_s / (1.0 / (s_split_num - 1))).astype(np.int64)
+
+        if v_split_num <= 1:
+            _v_index = np.zeros(_v.shape, dtype=np.int64)
+        else:
+            _v_index = np.round(_v / (1.0 / (v_split_num - 1))).astype(np.int64)
+
+        _index = _h_index * (s_split_num * v_split_num) + _s_index * v_split_num + _v_index
+
+        # 距离权重只与索引位置有关，先统计数量再乘以权重
+        _weights = np.abs(np.arange(_dimension, dtype=np.int64) - round(_dimension / 2))
+        _hsv_histogram = np.bincount(_index, minlength=_dimension) * _weights
+        _pix_count = int(_hsv_histogram.sum())
+
+        # 消除小值（让图片特征更明显）
+        _remove_mask = _hsv_histogram <= remove_line * _pix_count
+        _hsv_histogram[_remove_mask] = 0
+        _pix_count -= int(_remove_mask.sum())
+
+        # 对直方图进行归一化处理
+        return _image, _hsv_histogram.astype(np.float64) / _pix_count
+
+    @classmethod
+    def _histogram_by_python(cls, image, h_split_num: int, s_split_num: int, v_split_num: int,
+                             remove_line: float):
+        """
+        通过逐像素遍历计算HSV聚类直方图
+
+        @param {PIL.Image.Image} image - 已转换大小的RGB图片对象
+        @param {int} h_split_num - H坐标的分割数量
+        @param {int} s_split_num - S坐标的分割数量
+        @param {int} v_split_num - V坐标的分割数量
+        @param {float} remove_line - 消除小值的比例
+
+        @returns {tuple} - (聚类颜色后的图片对象, 归一化后的直方图list)
+        """
+        _image = image
+        _h_split_num = h_split_num
+        _s_split_num = s_split_num
+        _v_split_num = v_split_num
+        _remove_line = remove_line
+
         # 遍历图片每个像素修改颜色
         _dimension = _h_split_num * _s_split_num * _v_split_num
         _hsv_histogram = [0] * _dimension
         _pix_count = 0  # 有效的像素数量，用于归一化的时候处理(归一化比例)
         _pix = _image.load()
-        for _x in range(_size):
-            for _y in range(_size):
+        for _x in range(_image.size[0]):
+            for _y in range(_image.size[1]):
                 # 转换为hsv坐标
                 _hsv = Tools.rgb_to_hsv(_pix[_x, _y])
 
@@ -980,15 +1415,18 @@ class HSVClusterHistogramVetor(PipelineProcesser):
         _min = 0
         _normalize = [float(i) / (_max - _min) for i in _hsv_histogram]
 
-        # 返回特征变量
-        input_data['vertor'] = np.array(_normalize)
-        input_data['image'] = _image
-        return input_data
+        return _image, _normalize
 
 
 class SearchImageInputAdpter(PipelineProcesser):
     """
     图片搜索引擎输入适配处理器
+
+    @example 管道的processer_para配置如下(可不配置)
+        <SearchImageInputAdpter>
+            <!-- 输入图片的最大边长, 超过时缩小后再识别(JPEG图片使用draft模式解码), <=0代表不缩小 -->
+            <max_input_side type="int">1024</max_input_side>
+        </SearchImageInputAdpter>
     """
     @classmethod
     def processer_name(cls) -> str:
@@ -1007,7 +1445,8 @@ class SearchImageInputAdpter(PipelineProcesser):
         @param {object} input_data - 处理器输入数据值
             输入图片信息字典
             {
-                'image': # {bytes} 图片bytes对象
+                'image': # {bytes|numpy.ndarray|PIL.Image.Image|ImageCarrier} 图片bytes对象、RGB数组、图片对象或图片载体
+                    注: 启用管道多进程处理池的decode模式时传入的是RGB数组
                 'collection': # {str} 初始化时可以指定集合
             }
         @param {dict} context - 传递上下文，该字典信息将在整个管道处理过程中一直向下传递，可以在处理器中改变该上下文信息
@@ -1018,17 +1457,28 @@ class SearchImageInputAdpter(PipelineProcesser):
                 {
                     'type': # {str} 识别到的对象分类, ''代表没有找到分类
                     'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                    'image': # {PIL.Image.Image} 通过截图处理后的图片对象
+                    'image': # {ImageCarrier} 通过截图处理后的图片载体
                     'score': # {float} 匹配分数
+                    'source': # {ImageCarrier} 图片超过max_input_side被缩小时才有, 原图载体
+                    'source_box': # {tuple} 图片被缩小时才有, 当前图片在原图中的位置比例(ymin, xmin, ymax, xmax)
                 }
         """
+        _config = RunTool.get_global_var('PIPELINE_PROCESSER_PARA').get(cls.processer_name(), {})
+        _carrier = ImageCarrier.wrap(input_data['image'])  # 延迟解码
         _output = {
             'type': input_data.get('collection', ''),  # 初始化的数据集
             'sub_type': '',
-            'image': Image.open(BytesIO(input_data['image'])),
+            'image': _carrier,
             'score': 0.0
         }
 
+        # 大图缩小后再进行识别，原图保留用于截图
+        _image = _carrier.thumbnail(_config.get('max_input_side', 0))
+        if _image is not _carrier:
+            _output['image'] = _image
+            _output['source'] = _carrier
+            _output['source_box'] = (0.0, 0.0, 1.0, 1.0)
+
         return _output
 
 
@@ -1055,7 +1505,7 @@ class SearchImageOutputAdpter(PipelineProcesser):
             {
                 'type': # {str} 识别到的对象分类, ''代表没有找到分类
                 'sub_type': # {str} 识别到的对象子分类， ''代表没有子分类
-                'image': # {PIL.Image.Image} 图片对象
+                'image': # {ImageCarrier|PIL.Image.Image} 图片载体或图片对象
                 'score': # {float} 匹配分数
                 'vertor': # {numpy.ndarray} 特征向量
             }
@@ -1065,7 +1515,7 @@ class SearchImageOutputAdpter(PipelineProcesser):
         @returns {object} - 处理结果输出数据值, 标准输出
             {
                 'collection': {str} 匹配到的集合类型
-                'image': # {bytes} 图片bytes对象
+                'image': # {bytes} JPEG编码的图片bytes
                 'vertor': # {numpy.ndarray} 特征向量
             }
         """
@@ -1080,10 +1530,11 @@ class SearchImageOutputAdpter(PipelineProcesser):
             # 只使用主分类进行分类处理
             input_data['collection'] = input_data['type']
 
-        # 转换图片对象
-        _img_bytesio = BytesIO()
-        input_data['image'].save(_img_bytesio, format='JPEG')
-        input_data['image'] = _img_bytesio.getvalue()
+        # 转换为JPEG图片bytes，图片未经处理且上传的是JPEG图片时直接使用原始数据，不重新编码
+        _carrier = ImageCarrier.wrap(input_data['image'], format='JPEG')
+        if _carrier.image.format not in (None, 'JPEG'):
+            _carrier = ImageCarrier(image=_carrier.image, format='JPEG')
+        input_data['image'] = _carrier.bytes
 
         return input_data
 
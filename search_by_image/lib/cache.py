@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# Copyright 2019 黎慧剑
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+缓存处理
+@module cache
+@file cache.py
+"""
+
+import os
+import sys
+import copy
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+
+__MOUDLE__ = 'cache'  # 模块名
+__DESCRIPT__ = u'缓存处理'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = u'黎慧剑'  # 作者
+__PUBLISH__ = '2020.09.22'  # 发布日期
+
+
+class LRUCache(object):
+    """
+    线程安全的LRU缓存
+    支持按数量、存活时间(TTL)及内存预算淘汰，并可按标签批量失效
+
+    @example
+        _cache = LRUCache(max_size=1000, ttl=600, max_memory=100 * 1024 * 1024)
+        _version = _cache.version
+        ...  # 计算结果
+        _cache.set('key', _value, tags=['collection_a'], version=_version)
+        _cache.get('key')
+        _cache.invalidate_tag('collection_a')
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 0, max_memory: int = 0,
+                 size_fun=None, copy_value: bool = True):
+        """
+        构造函数
+
+        @param {int} max_size=10000 - 最大缓存数量，<=0代表不限制
+        @param {float} ttl=0 - 缓存存活时间，单位为秒，<=0代表不过期
+        @param {int} max_memory=0 - 缓存占用内存预算，单位为字节，<=0代表不限制
+        @param {function} size_fun=None - 计算缓存值占用内存大小的函数, fun(value) -> int
+            不传则使用sys.getsizeof
+        @param {bool} copy_value=True - 存入及取出时是否深拷贝缓存值，避免调用方修改影响缓存内容
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.size_fun = sys.getsizeof if size_fun is None else size_fun
+        self.copy_value = copy_value
+
+        self._lock = threading.RLock()
+        self._data = OrderedDict()  # key: (value, expire_time, size, tags)
+        self._tags = dict()  # tag: set(key)
+        self._memory = 0
+        self._version = 0  # 每次失效操作递增的版本号
+
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def version(self) -> int:
+        """
+        获取当前的失效版本号
+        在计算缓存值前获取，存入时送入set，可避免计算期间出现失效操作时存入过期的值
+        @property {int}
+        """
+        return self._version
+
+    @property
+    def stats(self) -> dict:
+        """
+        获取缓存统计信息
+        @property {dict}
+            count {int} - 缓存数量
+            memory {int} - 缓存占用内存大小
+            hits {int} - 命中次数
+            misses {int} - 未命中次数
+        """
+        with self._lock:
+            return {
+                'count': len(self._data), 'memory': self._memory,
+                'hits': self._hits, 'misses': self._misses
+            }
+
+    def get(self, key, default=None):
+        """
+        获取缓存值
+
+        @param {object} key - 缓存键值
+        @param {object} default=None - 缓存不存在时返回的默认值
+
+        @returns {object} - 缓存值
+        """
+        with self._lock:
+            _item = self._data.get(key, None)
+            if _item is None:
+                self._misses += 1
+                return default
+
+            if _item[1] > 0 and _item[1] < time.time():
+                # 已过期
+                self._remove(key)
+                self._misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self._hits += 1
+            _value = _item[0]
+
+        return copy.deepcopy(_value) if self.copy_value else _value
+
+    def set(self, key, value, tags: list = None, version: int = None) -> bool:
+        """
+        存入缓存值
+
+        @param {object} key - 缓存键值
+        @param {object} value - 缓存值
+        @param {list} tags=None - 缓存值的标签清单，用于批量失效
+        @param {int} version=None - 计算缓存值前获取的版本号，如果期间出现过失效操作则不存入
+
+        @returns {bool} - 是否存入成功
+        """
+        _value = copy.deepcopy(value) if self.copy_value else value
+        _size = self.size_fun(_value)
+        if self.max_memory > 0 and _size > self.max_memory:
+            # 单个值已超过内存预算
+            return False
+
+        _expire = time.time() + self.ttl if self.ttl > 0 else 0
+        _tags = tuple() if tags is None else tuple(tags)
+        with self._lock:
+            if version is not None and version != self._version:
+                return False
+
+            if key in self._data:
+                self._remove(key)
+
+            self._data[key] = (_value, _expire, _size, _tags)
+            self._memory += _size
+            for _tag in _tags:
+                self._tags.setdefault(_tag, set()).add(key)
+
+            # 按数量及内存淘汰最久未使用的缓存
+            while len(self._data) > 0 and (
+                (self.max_size > 0 and len(self._data) > self.max_size) or
+                (self.max_memory > 0 and self._memory > self.max_memory)
+            ):
+                self._remove(next(iter(self._data)))
+
+        return True
+
+    def delete(self, key):
+        """
+        删除指定缓存
+
+        @param {object} key - 缓存键值
+        """
+        with self._lock:
+            self._version += 1
+            if key in self._data:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        """
+        使指定标签的所有缓存失效
+
+        @param {object} tag - 标签
+        """
+        with self._lock:
+            self._version += 1
+            for _key in list(self._tags.get(tag, [])):
+                self._remove(_key)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._version += 1
+            self._data.clear()
+            self._tags.clear()
+            self._memory = 0
+
+    #############################
+    # 内部函数
+    #############################
+    def _remove(self, key):
+        """
+        删除缓存项(需在锁内调用)
+        """
+        _value, _expire, _size, _tags = self._data.pop(key)
+        self._memory -= _size
+        for _tag in _tags:
+            _keys = self._tags.get(_tag, None)
+            if _keys is not None:
+                _keys.discard(key)
+                if len(_keys) == 0:
+                    del self._tags[_tag]
+
+
+class MmapVectorStore(object):
+    """
+    基于内存映射文件的特征向量存储
+    使用开放寻址的固定槽位哈希表，文件可由多个工作进程同时映射共享，读写均不加锁:
+    写入时先写数据再写校验码，读取时校验不通过(未写完或被并发覆盖)视为未命中
+
+    文件格式:
+        文件头(64字节): magic(8) + 槽位数(uint32) + 向量维度(uint32) + 保留
+        槽位: key(32) + collection(64) + dim(uint32) + crc32(uint32) + vector(float64 * 向量维度)
+    """
+
+    MAGIC = b'SBIVEC01'
+    HEADER_SIZE = 64
+    KEY_SIZE = 32
+    COLLECTION_SIZE = 64
+
+    def __init__(self, path: str, dimension: int, slots: int = 100000, max_probe: int = 8):
+        """
+        构造函数
+
+        @param {str} path - 存储文件路径，文件不存在时创建
+        @param {int} dimension - 向量最大维度
+        @param {int} slots=100000 - 槽位数量
+        @param {int} max_probe=8 - 冲突时最多探测的槽位数量，都被占用时覆盖第一个槽位
+
+        @throws {RuntimeError} - 已有文件的格式与参数不一致时抛出异常
+        """
+        self.path = path
+        self.dimension = dimension
+        self.slots = slots
+        self.max_probe = max(1, min(max_probe, slots))
+        self.slot_size = self.KEY_SIZE + self.COLLECTION_SIZE + 8 + 8 * dimension
+        _file_size = self.HEADER_SIZE + self.slot_size * slots
+
+        # 创建文件, 多进程同时创建时只有一个进程写入文件头
+        _path = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(_path):
+            os.makedirs(_path, exist_ok=True)
+
+        try:
+            _fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_RDWR)
+            try:
+                # 先写文件头再扩展文件大小，其他进程以文件大小判断初始化是否完成
+                os.pwrite(
+                    _fd, self.MAGIC + struct.pack('<II', slots, dimension), 0
+                )
+                os.ftruncate(_fd, _file_size)
+            finally:
+                os.close(_fd)
+        except FileExistsError:
+            # 等待创建进程完成文件初始化
+            _deadline = time.time() + 10
+            while os.path.getsize(path) < _file_size and time.time() < _deadline:
+                time.sleep(0.01)
+
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        _magic = self._mm[0:8]
+        _slots, _dimension = struct.unpack('<II', self._mm[8:16])
+        if _magic != self.MAGIC or _slots != slots or _dimension != dimension:
+            self.close()
+            raise RuntimeError(
+                'vector cache file [%s] format not match: slots %d, dimension %d!' % (
+                    path, _slots, _dimension
+                )
+            )
+
+    def get(self, key: bytes):
+        """
+        获取缓存的特征向量
+
+        @param {bytes} key - 32字节的键值
+
+        @returns {tuple} - (collection:str, vertor:numpy.ndarray)，未命中返回None
+        """
+        for _offset in self._probe(key):
+            _slot = self._mm[_offset:_offset + self.slot_size]
+            if _slot[0:self.KEY_SIZE] != key:
+                continue
+
+            _pos = self.KEY_SIZE + self.COLLECTION_SIZE
+            _dim, _crc = struct.unpack('<II', _slot[_pos:_pos + 8])
+            if _dim > self.dimension:
+                return None
+
+            _data_end = _pos + 8 + 8 * _dim
+            if zlib.crc32(_slot[0:_pos + 4] + _slot[_pos + 8:_data_end]) != _crc:
+                # 数据未写完或已被覆盖
+                return None
+
+            _collection = _slot[self.KEY_SIZE:_pos].rstrip(b'\x00').decode('utf-8')
+            return _collection, np.frombuffer(_slot[_pos + 8:_data_end], dtype='<f8').copy()
+
+        return None
+
+    def set(self, key: bytes, collection: str, vertor):
+        """
+        存入特征向量
+
+        @param {bytes} key - 32字节的键值
+        @param {str} collection - 集合名
+        @param {numpy.ndarray} vertor - 特征向量
+
+        @returns {bool} - 是否存入成功(维度或集合名超出限制时不存入)
+        """
+        _vertor = np.asarray(vertor, dtype='<f8').ravel()
+        _collection = collection.encode('utf-8')
+        if _vertor.shape[0] > self.dimension or len(_collection) > self.COLLECTION_SIZE:
+            return False
+
+        # 优先使用相同键值或空的槽位
+        _target = None
+        _probes = self._probe(key)
+        for _offset in _probes:
+            _slot_key = self._mm[_offset:_offset + self.KEY_SIZE]
+            if _slot_key == key or _slot_key == b'\x00' * self.KEY_SIZE:
+                _target = _offset
+                break
+
+        if _target is None:
+            _target = _probes[0]
+
+        _pos = self.KEY_SIZE + self.COLLECTION_SIZE
+        _head = key + _collection.ljust(self.COLLECTION_SIZE, b'\x00') + \
+            struct.pack('<I', _vertor.shape[0])
+        _data = _vertor.tobytes()
+        _crc = zlib.crc32(_head + _data)
+
+        # 先作废校验码，写入数据后再写入正确的校验码
+        self._mm[_target + _pos + 4:_target + _pos + 8] = struct.pack('<I', (_crc + 1) & 0xFFFFFFFF)
+        self._mm[_target:_target + _pos + 4] = _head
+        self._mm[_target + _pos + 8:_target + _pos + 8 + len(_data)] = _data
+        self._mm[_target + _pos + 4:_target + _pos + 8] = struct.pack('<I', _crc)
+        return True
+
+    def close(self):
+        """
+        关闭存储文件
+        """
+        try:
+            self._mm.close()
+        finally:
+            self._file.close()
+
+    #############################
+    # 内部函数
+    #############################
+    def _probe(self, key: bytes) -> list:
+        """
+        获取键值的探测槽位偏移清单
+        """
+        _start = int.from_bytes(key[0:8], 'little') % self.slots
+        return [
+            self.HEADER_SIZE + ((_start + _i) % self.slots) * self.slot_size
+            for _i in range(self.max_probe)
+        ]
+
+
+class VectorCache(object):
+    """
+    图片特征向量缓存
+    按图片内容摘要、管道标识及初始集合缓存管道处理得到的(集合, 特征向量)，命中时可跳过管道处理
+
+    @example
+        _cache = VectorCache({'type': 'memory', 'max_size': 100000})
+        _key = _cache.make_key(image_data, 'JadeSearch', '')
+        _cache.set(_key, 'bangle', _vertor)
+        _collection, _vertor = _cache.get(_key)
+    """
+
+    def __init__(self, cache_config: dict, dimension: int = 0):
+        """
+        构造函数
+
+        @param {dict} cache_config - 缓存配置，server.xml的vector_cache配置
+            type {str} - 缓存后端类型, memory-进程内LRU缓存, mmap-内存映射文件(可多进程共享)
+            max_size {int} - memory类型的最大缓存数量，默认100000
+            max_memory {int} - memory类型的缓存占用内存预算(按向量字节数估算)，单位为字节，<=0代表不限制，默认268435456(256M)
+            path {str} - mmap类型的缓存文件路径
+            slots {int} - mmap类型的槽位数量，默认100000
+            max_probe {int} - mmap类型冲突时最多探测的槽位数量，默认8
+            dimension {int} - mmap类型的向量最大维度，不配置则使用dimension参数
+            namespace {str} - 缓存命名空间，模型更新后修改该值可使原有缓存失效，默认''
+        @param {int} dimension=0 - 默认的向量维度
+        """
+        self.cache_config = cache_config
+        self.type = cache_config.get('type', 'memory')
+        self.namespace = cache_config.get('namespace', '')
+        if self.type == 'mmap':
+            self.backend = MmapVectorStore(
+                cache_config['path'], cache_config.get('dimension', dimension),
+                slots=cache_config.get('slots', 100000),
+                max_probe=cache_config.get('max_probe', 8)
+            )
+        elif self.type == 'memory':
+            self.backend = LRUCache(
+                max_size=cache_config.get('max_size', 100000),
+                max_memory=cache_config.get('max_memory', 268435456),
+                size_fun=lambda _value: _value[1].nbytes + len(_value[0]) + 64,
+                copy_value=False
+            )
+        else:
+            raise AttributeError('vector cache type [%s] not support!' % self.type)
+
+    def make_key(self, image_data: bytes, pipeline: str, init_collection: str = '') -> bytes:
+        """
+        生成缓存键值
+
+        @param {bytes} image_data - 影像内容二进制数据
+        @param {str} pipeline - 处理管道标识
+        @param {str} init_collection='' - 初始集合名
+
+        @returns {bytes} - 32字节的键值
+        """
+        _hash = hashlib.sha256(image_data)
+        _hash.update(b'\x00'.join([
+            b'', self.namespace.encode('utf-8'), pipeline.encode('utf-8'),
+            init_collection.encode('utf-8')
+        ]))
+        return _hash.digest()
+
+    def get(self, key: bytes):
+        """
+        获取缓存的特征向量
+
+        @param {bytes} key - 缓存键值
+
+        @returns {tuple} - (collection:str, vertor:numpy.ndarray)，未命中返回None
+        """
+        _res = self.backend.get(key)
+        if _res is not None and self.type == 'memory':
+            _res = (_res[0], _res[1].copy())
+
+        return _res
+
+    def set(self, key: bytes, collection: str, vertor):
+        """
+        存入特征向量
+
+        @param {bytes} key - 缓存键值
+        @param {str} collection - 集合名
+        @param {numpy.ndarray} vertor - 特征向量
+        """
+        if self.type == 'memory':
+            self.backend.set(key, (collection, np.array(vertor)))
+        else:
+            self.backend.set(key, collection, vertor)
+
+    def close(self):
+        """
+        关闭缓存
+        """
+        if self.type == 'mmap':
+            self.backend.close()
+        else:
+            self.backend.clear()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# Copyright 2019 黎慧剑
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+图片载体
+@module image_carrier
+@file image_carrier.py
+"""
+
+import os
+import sys
+from io import BytesIO
+import numpy as np
+from PIL import Image
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+
+__MOUDLE__ = 'image_carrier'  # 模块名
+__DESCRIPT__ = u'图片载体'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = u'黎慧剑'  # 作者
+__PUBLISH__ = '2020.09.22'  # 发布日期
+
+
+class ImageCarrier(object):
+    """
+    图片载体，在管道处理器间传递同一份图片数据
+    图片的bytes、PIL图片对象及RGB数组三种形式按需转换并缓存:
+        1、从bytes创建时，只有使用图片对象或数组时才解码
+        2、从数组创建时，数组直接共享，不进行复制
+        3、获取bytes时，如果载体由原始bytes创建则直接返回原始数据，否则才进行编码
+
+    @example
+        _carrier = ImageCarrier.wrap(image_bytes)
+        _carrier.size  # 只读取图片头信息
+        _image_np = _carrier.array  # 解码后的RGB数组
+        _crop = ImageCarrier(image=_carrier.image.crop((0, 0, 100, 100)))
+        _crop.bytes  # 按需编码为JPEG
+    """
+
+    def __init__(self, data: bytes = None, image: Image.Image = None, array: np.ndarray = None,
+                 format: str = 'JPEG'):
+        """
+        构造函数，data、image、array至少需要送入一个
+
+        @param {bytes} data=None - 图片编码后的二进制数据
+        @param {PIL.Image.Image} image=None - 图片对象
+        @param {numpy.ndarray} array=None - 图片RGB数组，形状为(height, width, 3)
+        @param {str} format='JPEG' - 需要编码为bytes时使用的图片格式
+
+        @throws {AttributeError} - 没有送入图片数据时抛出异常
+        """
+        if data is None and image is None and array is None:
+            raise AttributeError('ImageCarrier need data, image or array!')
+
+        self.format = format
+        self._data = data
+        self._image = image
+        self._array = array
+
+    @classmethod
+    def wrap(cls, obj, format: str = 'JPEG'):
+        """
+        将图片数据包装为图片载体
+
+        @param {ImageCarrier|bytes|PIL.Image.Image|numpy.ndarray} obj - 图片数据
+        @param {str} format='JPEG' - 需要编码为bytes时使用的图片格式
+
+        @returns {ImageCarrier} - 图片载体，如果送入的已是图片载体则直接返回
+        """
+        if isinstance(obj, ImageCarrier):
+            return obj
+        elif isinstance(obj, np.ndarray):
+            return cls(array=obj, format=format)
+        elif isinstance(obj, Image.Image):
+            return cls(image=obj, format=format)
+        else:
+            return cls(data=bytes(obj), format=format)
+
+    @property
+    def image(self) -> Image.Image:
+        """
+        获取图片对象
+        @property {PIL.Image.Image}
+        """
+        if self._image is None:
+            if self._array is not None:
+                self._image = Image.fromarray(self._array)
+            else:
+                self._image = Image.open(BytesIO(self._data))
+
+        return self._image
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        获取图片的RGB数组(只读)
+        @property {numpy.ndarray} - 形状为(height, width, 3)的uint8数组
+        """
+        if self._array is None:
+            _image = self.image
+            if _image.mode != 'RGB':
+                _image = _image.convert('RGB')
+            self._array = np.asarray(_image)
+
+        return self._array
+
+    @property
+    def bytes(self) -> bytes:
+        """
+        获取图片编码后的二进制数据
+        @property {bytes}
+        """
+        if self._data is None:
+            _image = self.image
+            if self.format.upper() in ('JPEG', 'JPG') and _image.mode not in ('RGB', 'L'):
+                _image = _image.convert('RGB')
+
+            _bytesio = BytesIO()
+            _image.save(_bytesio, format=self.format)
+            self._data = _bytesio.getvalue()
+
+        return self._data
+
+    @property
+    def size(self) -> tuple:
+        """
+        获取图片大小
+        @property {tuple} - (width, height)
+        """
+        if self._image is None and self._array is not None:
+            return (self._array.shape[1], self._array.shape[0])
+
+        # 图片对象未加载数据时只读取了图片头信息
+        return self.image.size
+
+    def thumbnail(self, max_side: int):
+        """
+        获取按最大边长等比缩小的图片载体
+        载体由图片bytes创建时重新打开图片，JPEG图片通过draft模式在解码时直接按DCT缩放，
+        避免先完整解码大图再缩小
+
+        @param {int} max_side - 缩小后图片的最大边长
+
+        @returns {ImageCarrier} - 缩小后的图片载体，图片未超过最大边长时返回自身
+        """
+        _width, _height = self.size
+        if max_side <= 0 or max(_width, _height) <= max_side:
+            return self
+
+        if self._data is not None and self._array is None:
+            _image = Image.open(BytesIO(self._data))
+            if _image.format == 'JPEG':
+                # draft按2的幂次缩放，缩放后的大小不会小于指定大小
+                _scale = max_side / float(max(_width, _height))
+                _image.draft('RGB', (round(_width * _scale), round(_height * _scale)))
+            _image.thumbnail((max_side, max_side))
+        else:
+            _image = self.image.copy()
+            _image.thumbnail((max_side, max_side))
+
+        return ImageCarrier(image=_image, format=self.format)
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
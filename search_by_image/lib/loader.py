@@ -27,6 +27,7 @@ sys.path.append(os.path.abspath(os.path.join(
 from search_by_image.lib.search import SearchEngine
 from search_by_image.lib.pipeline import Pipeline
 from search_by_image.lib.restful_api import FlaskTool, SearchServer
+from search_by_image.lib.serving import ConcurrencyLimiter, ServingTool
 
 
 __MOUDLE__ = 'loader'  # 模块名
@@ -94,6 +95,18 @@ class ServerLoader(object):
             self.server_config['max_upload_size'] * 1024 * 1024
         )
 
+        # 请求并发限制
+        self.limiter = None
+        _limiter_config = self.server_config.get('limiter', None)
+        if _limiter_config is not None and _limiter_config.get('enable', False):
+            self.limiter = ConcurrencyLimiter(
+                max_concurrency=_limiter_config.get('max_concurrency', 16),
+                max_queue=_limiter_config.get('max_queue', 64),
+                queue_timeout=_limiter_config.get('queue_timeout', 5.0),
+                retry_after=_limiter_config.get('retry_after', 1)
+            )
+            ServingTool.install_limiter(self.app, self.limiter)
+
         # 装载搜索引擎服务
         self.search_engine = SearchEngine(self.server_config, logger=self.logger)
 
@@ -128,7 +141,8 @@ class ServerLoader(object):
 
     def start_restful_server(self):
         """
-        启动Restful Api服务
+        启动Restful Api服务(Flask自带服务)
+        注：gunicorn模式需在装载服务前启动，参考server.py的start_server
         """
         self.app.run(**self.server_config['flask'])
 
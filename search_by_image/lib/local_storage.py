@@ -0,0 +1,1234 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# Copyright 2019 黎慧剑
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+本地数据存储处理
+@module local_storage
+@file local_storage.py
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import sqlite3
+import weakref
+import threading
+import numpy as np
+from bson import ObjectId
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+from search_by_image.lib.storage import VectorStore, VectorMatch, DocStorage
+
+
+__MOUDLE__ = 'local_storage'  # 模块名
+__DESCRIPT__ = u'本地数据存储处理'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = u'黎慧剑'  # 作者
+__PUBLISH__ = '2020.09.25'  # 发布日期
+
+
+class LocalVectorCollection(object):
+    """
+    本地向量集合
+    向量及id按内存映射文件存储在集合目录下，删除的向量以id=-1标记
+
+    集合目录文件:
+        meta.json - 集合信息(数量、下一个id、索引信息)
+        vectors.npy - 向量数组(float32, 容量 * 维度)
+        ids.npy - 向量id数组(int64)
+        lists.npy - IVF索引中每个向量所属的聚类编号(int32)
+        centroids.npy - IVF索引的聚类中心
+
+    IVF索引在内存中按聚类保存所属向量的行号(倒排列表，装载及训练时根据lists.npy生成，插入时追加)，
+    查询时只访问最近的nprobe个聚类的行
+    """
+
+    def __init__(self, path: str, dimension: int, metric_type: str = 'L2', index_type: str = 'FLAT',
+                 nlist: int = 1024):
+        """
+        构造函数
+
+        @param {str} path - 集合目录
+        @param {int} dimension - 向量维度
+        @param {str} metric_type='L2' - 度量类型, L2-欧式距离(返回距离的平方), IP-内积
+        @param {str} index_type='FLAT' - 索引类型, FLAT-暴力搜索, IVF-倒排聚类搜索
+        @param {int} nlist=1024 - IVF索引的聚类数量
+        """
+        self.path = path
+        self.dimension = dimension
+        self.metric_type = metric_type
+        self.index_type = index_type
+        self.nlist = nlist
+        self.lock = threading.RLock()
+        self._train_lock = threading.Lock()  # 同一时间只进行一个训练
+        self._train_thread = None
+        self.vectors = None
+        self.ids = None
+        self.lists = None
+        self.centroids = None
+        self.inverted = None  # 倒排列表，每个聚类的行号缓冲数组(int64, 有效长度见inverted_sizes)
+        self.inverted_sizes = None  # 每个聚类倒排列表的有效长度
+
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+        _meta_file = os.path.join(path, 'meta.json')
+        if os.path.exists(_meta_file):
+            with open(_meta_file, 'r', encoding='utf-8') as _fid:
+                self.meta = json.loads(_fid.read())
+            if self.meta['dimension'] != dimension:
+                raise RuntimeError('local collection [%s] dimension [%d] not match [%d]!' % (
+                    path, self.meta['dimension'], dimension
+                ))
+        else:
+            self.meta = {
+                'dimension': dimension, 'count': 0, 'capacity': 0, 'next_id': 1,
+                'trained_count': 0
+            }
+            self._flush()
+
+        if self.meta['capacity'] > 0:
+            self.vectors = np.load(self._file('vectors'), mmap_mode='r+')
+            self.ids = np.load(self._file('ids'), mmap_mode='r+')
+            if self.meta['trained_count'] > 0:
+                self.lists = np.load(self._file('lists'), mmap_mode='r+')
+                self.centroids = np.load(self._file('centroids'))
+                self.inverted, self.inverted_sizes = self._build_inverted(
+                    self.lists[0:self.meta['count']], self.centroids.shape[0]
+                )
+
+    @property
+    def count(self) -> int:
+        """
+        获取已使用的向量行数(包含已删除的行)
+        @property {int}
+        """
+        return self.meta['count']
+
+    def insert(self, vectors) -> list:
+        """
+        插入向量
+
+        @param {numpy.ndarray} vectors - 要插入的向量数组(数量 * 维度)
+
+        @returns {list} - 插入向量的id清单
+        """
+        _vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        _num = _vectors.shape[0]
+        with self.lock:
+            self._ensure_capacity(self.meta['count'] + _num)
+            _start = self.meta['count']
+            _ids = np.arange(self.meta['next_id'], self.meta['next_id'] + _num, dtype=np.int64)
+            self.vectors[_start:_start + _num] = _vectors
+            self.ids[_start:_start + _num] = _ids
+            if self.centroids is not None:
+                _assigned = self._assign(_vectors)
+                self.lists[_start:_start + _num] = _assigned
+                self._append_inverted(
+                    self.inverted, self.inverted_sizes,
+                    np.arange(_start, _start + _num, dtype=np.int64), _assigned
+                )
+
+            self.meta['count'] += _num
+            self.meta['next_id'] += _num
+            self._flush()
+
+            if self.index_type == 'IVF' and self._need_train():
+                # 后台训练，不阻塞插入及查询
+                self.start_train()
+
+        return _ids.tolist()
+
+    def delete(self, ids: list):
+        """
+        删除向量
+
+        @param {list} ids - 要删除的id清单
+        """
+        with self.lock:
+            if self.ids is None:
+                return
+
+            _count = self.meta['count']
+            _mask = np.isin(self.ids[0:_count], np.asarray(ids, dtype=np.int64))
+            self.ids[0:_count][_mask] = -1
+            self._flush()
+
+    def search(self, queries, topk: int = 10, nprobe: int = 16) -> list:
+        """
+        搜索匹配向量
+
+        @param {numpy.ndarray} queries - 查询向量数组(数量 * 维度)
+        @param {int} topk=10 - 获取最近匹配的数量
+        @param {int} nprobe=16 - IVF索引查询的聚类数量
+
+        @returns {list} - 与查询向量顺序一致的匹配结果清单 [[VectorMatch, ...], ...]
+        """
+        _queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        with self.lock:
+            # 取得当前数据的快照，插入扩容时会替换为新的映射对象
+            _count = self.meta['count']
+            _vectors = self.vectors
+            _ids = self.ids
+            _centroids = self.centroids
+            if _centroids is not None and nprobe < _centroids.shape[0]:
+                # 倒排列表只会追加或替换缓冲数组，复制引用及有效长度即可
+                _inverted = list(self.inverted)
+                _sizes = self.inverted_sizes.copy()
+
+        if _count == 0:
+            return [[] for _i in range(_queries.shape[0])]
+
+        _res = []
+        for _query in _queries:
+            if _centroids is not None and nprobe < _centroids.shape[0]:
+                # 只在最近的nprobe个聚类的倒排列表中查找(按行号排序，与暴力搜索的顺序一致)
+                _probe = self._top(self._distance(_query, _centroids), nprobe)
+                _rows = np.sort(np.concatenate(
+                    [_inverted[_list][0:_sizes[_list]] for _list in _probe]
+                ))
+            else:
+                _rows = None
+
+            _res.append(self._search_rows(_query, _vectors, _ids, _count, _rows, topk))
+
+        return _res
+
+    def get(self, ids: list) -> list:
+        """
+        获取指定id的向量
+
+        @param {list} ids - 向量id清单
+
+        @returns {list} - 与id清单顺序一致的向量清单(numpy.ndarray)，id不存在时对应项为None
+        """
+        with self.lock:
+            _count = self.meta['count']
+            _vectors = self.vectors
+            _ids = self.ids
+
+        if _count == 0:
+            return [None for _id in ids]
+
+        _all_ids = _ids[0:_count]
+        _rows = np.nonzero(np.isin(_all_ids, np.asarray(ids, dtype=np.int64)))[0]
+        _row_map = dict(zip(_all_ids[_rows].tolist(), _rows.tolist()))
+        return [
+            np.array(_vectors[_row_map[_id]]) if _id in _row_map else None for _id in ids
+        ]
+
+    def start_train(self) -> threading.Thread:
+        """
+        启动后台线程训练IVF索引，已有训练在执行时不重复启动
+
+        @returns {threading.Thread} - 正在执行训练的线程
+        """
+        with self.lock:
+            if self._train_thread is None or not self._train_thread.is_alive():
+                self._train_thread = threading.Thread(
+                    target=self.train, name='LocalVectorTrain', daemon=True
+                )
+                self._train_thread.start()
+
+            return self._train_thread
+
+    def train(self, iterations: int = 20, sample_size: int = 256):
+        """
+        训练IVF索引(k-means聚类)并重新分配所有向量
+        聚类及分配计算不占用集合锁，只在最后替换索引时加锁，训练期间可正常插入及查询
+
+        @param {int} iterations=20 - 聚类迭代次数
+        @param {int} sample_size=256 - 每个聚类中心用于训练的样本数量
+        """
+        with self._train_lock:
+            with self.lock:
+                if self.ids is None:
+                    return
+
+                _count = self.meta['count']
+                _vectors = self.vectors
+                _valid = np.nonzero(self.ids[0:_count] >= 0)[0]
+                _nlist = min(self.nlist, len(_valid))
+                if _nlist == 0:
+                    return
+
+                _rand = np.random.RandomState(0)
+                _sample = _valid
+                if len(_sample) > _nlist * sample_size:
+                    _sample = _rand.choice(_sample, _nlist * sample_size, replace=False)
+
+                _data = np.asarray(_vectors[np.sort(_sample)], dtype=np.float32)
+
+            _centroids = _data[_rand.choice(len(_data), _nlist, replace=False)].copy()
+            for _i in range(iterations):
+                _assign = self._assign(_data, _centroids)
+                for _j in range(_nlist):
+                    _members = _data[_assign == _j]
+                    if len(_members) > 0:
+                        _centroids[_j] = _members.mean(axis=0)
+                    else:
+                        # 空聚类随机重新选择中心
+                        _centroids[_j] = _data[_rand.randint(len(_data))]
+
+            # 分配训练时已有的向量(已写入的向量不会变化，扩容替换文件不影响原映射对象)
+            _assigned = self._assign(_vectors[0:_count], _centroids)
+            _inverted, _sizes = self._build_inverted(_assigned, _nlist)
+
+            with self.lock:
+                if self.ids is None:
+                    # 集合已删除
+                    return
+
+                # 写入临时文件后替换，避免影响正在使用原文件查询的线程
+                _new_count = self.meta['count']
+                _lists = np.lib.format.open_memmap(
+                    self._file('lists.tmp'), mode='w+', dtype=np.int32,
+                    shape=(self.meta['capacity'],)
+                )
+                _lists[0:_count] = _assigned
+                if _new_count > _count:
+                    # 训练期间新插入的向量
+                    _new_assigned = self._assign(self.vectors[_count:_new_count], _centroids)
+                    _lists[_count:_new_count] = _new_assigned
+                    self._append_inverted(
+                        _inverted, _sizes, np.arange(_count, _new_count, dtype=np.int64),
+                        _new_assigned
+                    )
+                _lists.flush()
+                del _lists
+                os.replace(self._file('lists.tmp'), self._file('lists'))
+                np.save(self._file('centroids'), _centroids)
+
+                self.lists = np.load(self._file('lists'), mmap_mode='r+')
+                self.centroids = _centroids
+                self.inverted = _inverted
+                self.inverted_sizes = _sizes
+                self.meta['trained_count'] = len(_valid)
+                self._flush()
+
+    def drop(self):
+        """
+        删除集合的所有文件
+        """
+        with self.lock:
+            self.vectors = None
+            self.ids = None
+            self.lists = None
+            self.centroids = None
+            self.inverted = None
+            self.inverted_sizes = None
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    #############################
+    # 内部函数
+    #############################
+    def _file(self, name: str) -> str:
+        """
+        获取集合文件路径
+        """
+        return os.path.join(self.path, '%s.npy' % name)
+
+    def _need_train(self) -> bool:
+        """
+        判断是否需要(重新)训练IVF索引
+        数据量达到每个聚类平均39个向量时开始训练，数据量达到上次训练的2倍时重新训练
+        """
+        _count = self.meta['count']
+        if self.meta['trained_count'] == 0:
+            return _count >= self.nlist * 39
+
+        return _count >= self.meta['trained_count'] * 2
+
+    def _ensure_capacity(self, size: int):
+        """
+        确保存储容量，不足时按2倍扩容
+        """
+        if size <= self.meta['capacity']:
+            return
+
+        _capacity = max(1024, self.meta['capacity'])
+        while _capacity < size:
+            _capacity *= 2
+
+        _count = self.meta['count']
+        _new_files = {
+            'vectors': (np.float32, (_capacity, self.dimension), self.vectors),
+            'ids': (np.int64, (_capacity,), self.ids)
+        }
+        if self.lists is not None:
+            _new_files['lists'] = (np.int32, (_capacity,), self.lists)
+
+        for _name, (_dtype, _shape, _old) in _new_files.items():
+            _temp_file = self._file(_name + '.tmp')
+            _new = np.lib.format.open_memmap(_temp_file, mode='w+', dtype=_dtype, shape=_shape)
+            if _old is not None:
+                _new[0:_count] = _old[0:_count]
+            _new.flush()
+            del _new
+            os.replace(_temp_file, self._file(_name))
+
+        self.vectors = np.load(self._file('vectors'), mmap_mode='r+')
+        self.ids = np.load(self._file('ids'), mmap_mode='r+')
+        if self.lists is not None:
+            self.lists = np.load(self._file('lists'), mmap_mode='r+')
+        self.meta['capacity'] = _capacity
+
+    def _flush(self):
+        """
+        将数据及集合信息写入文件
+        """
+        for _array in (self.vectors, self.ids, self.lists):
+            if _array is not None:
+                _array.flush()
+
+        _temp_file = os.path.join(self.path, 'meta.json.tmp')
+        with open(_temp_file, 'w', encoding='utf-8') as _fid:
+            _fid.write(json.dumps(self.meta))
+        os.replace(_temp_file, os.path.join(self.path, 'meta.json'))
+
+    def _distance(self, query, vectors):
+        """
+        计算查询向量与多个向量的距离(越小越匹配)
+        L2返回欧式距离的平方，IP返回内积的负数
+        """
+        _vectors = np.asarray(vectors, dtype=np.float32)
+        if self.metric_type == 'IP':
+            return -(_vectors @ query)
+
+        _diff = _vectors - query
+        return np.einsum('ij,ij->i', _diff, _diff)
+
+    def _assign(self, vectors, centroids=None, max_elements: int = 4194304):
+        """
+        获取向量所属的聚类编号
+        按块计算，每块的距离矩阵(向量数 * 聚类数)不超过max_elements个元素
+        """
+        _centroids = self.centroids if centroids is None else centroids
+        _norms = (_centroids ** 2).sum(axis=1)[None, :]
+        _chunk_size = max(1, max_elements // max(1, _centroids.shape[0]))
+        _res = np.empty((len(vectors),), dtype=np.int32)
+        for _start in range(0, len(vectors), _chunk_size):
+            _end = min(_start + _chunk_size, len(vectors))
+            _vectors = np.asarray(vectors[_start:_end], dtype=np.float32)
+            if self.metric_type == 'IP':
+                _res[_start:_end] = np.argmax(_vectors @ _centroids.T, axis=1)
+            else:
+                # 向量自身的范数不影响排序，无需计算
+                _res[_start:_end] = np.argmin(_norms - 2 * (_vectors @ _centroids.T), axis=1)
+
+        return _res
+
+    def _build_inverted(self, assigned, nlist: int):
+        """
+        根据向量所属的聚类编号生成倒排列表
+
+        @param {numpy.ndarray} assigned - 从第0行开始每行向量所属的聚类编号
+        @param {int} nlist - 聚类数量
+
+        @returns {list, numpy.ndarray} - 每个聚类的行号缓冲数组清单, 每个聚类的有效长度
+        """
+        _inverted = [np.empty((0,), dtype=np.int64) for _i in range(nlist)]
+        _sizes = np.zeros((nlist,), dtype=np.int64)
+        self._append_inverted(
+            _inverted, _sizes, np.arange(len(assigned), dtype=np.int64), np.asarray(assigned)
+        )
+        return _inverted, _sizes
+
+    def _append_inverted(self, inverted: list, sizes, rows, assigned):
+        """
+        将行号追加到所属聚类的倒排列表
+        缓冲数组不足时按2倍扩容并替换为新数组，已取得原数组引用的查询不受影响
+
+        @param {list} inverted - 每个聚类的行号缓冲数组清单
+        @param {numpy.ndarray} sizes - 每个聚类的有效长度
+        @param {numpy.ndarray} rows - 要追加的行号
+        @param {numpy.ndarray} assigned - 行号对应的聚类编号
+        """
+        _order = np.argsort(assigned, kind='stable')
+        _counts = np.bincount(assigned, minlength=len(inverted))
+        _start = 0
+        for _list in np.nonzero(_counts)[0]:
+            _end = _start + _counts[_list]
+            _size = sizes[_list]
+            _new_size = _size + _end - _start
+            _buffer = inverted[_list]
+            if _new_size > len(_buffer):
+                _buffer = np.empty((max(16, _new_size * 2),), dtype=np.int64)
+                _buffer[0:_size] = inverted[_list][0:_size]
+                inverted[_list] = _buffer
+
+            _buffer[_size:_new_size] = rows[_order[_start:_end]]
+            sizes[_list] = _new_size
+            _start = _end
+
+    def _top(self, distances, topk: int):
+        """
+        获取距离最小的topk个位置(按距离排序)
+        """
+        if topk < len(distances):
+            _index = np.argpartition(distances, topk)[0:topk]
+        else:
+            _index = np.arange(len(distances))
+
+        return _index[np.argsort(distances[_index], kind='stable')]
+
+    def _search_rows(self, query, vectors, ids, count: int, rows, topk: int,
+                     chunk_size: int = 65536) -> list:
+        """
+        在指定行中暴力搜索匹配向量
+
+        @param {numpy.ndarray} query - 查询向量
+        @param {numpy.memmap} vectors - 向量数组
+        @param {numpy.memmap} ids - id数组
+        @param {int} count - 有效行数
+        @param {numpy.ndarray} rows - 要搜索的行号，None代表搜索所有行
+        @param {int} topk - 获取最近匹配的数量
+        @param {int} chunk_size=65536 - 分块计算的行数，避免一次占用过多内存
+
+        @returns {list} - 匹配结果 [VectorMatch, ...]
+        """
+        _best_dist = np.empty((0,), dtype=np.float32)
+        _best_rows = np.empty((0,), dtype=np.int64)
+        _total = count if rows is None else len(rows)
+        for _start in range(0, _total, chunk_size):
+            _end = min(_start + chunk_size, _total)
+            if rows is None:
+                _rows = np.arange(_start, _end)
+                _vectors = vectors[_start:_end]
+            else:
+                _rows = rows[_start:_end]
+                _vectors = vectors[_rows]
+
+            # 排除已删除的向量
+            _valid = ids[_rows] >= 0
+            _rows = _rows[_valid]
+            _dist = self._distance(query, _vectors[_valid])
+
+            _best_dist = np.concatenate([_best_dist, _dist])
+            _best_rows = np.concatenate([_best_rows, _rows])
+            _top = self._top(_best_dist, topk)
+            _best_dist = _best_dist[_top]
+            _best_rows = _best_rows[_top]
+
+        return [
+            VectorMatch(
+                int(ids[_row]), float(-_dist if self.metric_type == 'IP' else _dist)
+            ) for _row, _dist in zip(_best_rows, _best_dist)
+        ]
+
+
+class LocalVectorStore(VectorStore):
+    """
+    本地进程内的特征向量存储，可替代Milvus用于开发测试及小数据量场景
+    注：数据文件只能由一个进程打开使用
+    """
+
+    def __init__(self, milvus_para: dict, logger=None):
+        """
+        构造函数
+
+        @param {dict} milvus_para - 向量存储参数，server.xml的milvus配置
+            path {str} - 数据存放目录
+            dimension {int} - 向量维度
+            metric_type {str} - 度量类型, 支持L2、IP
+            index_type {str} - 索引类型, FLAT-暴力搜索, IVF-倒排聚类搜索, 默认FLAT
+            nlist {int} - IVF索引的聚类数量，默认1024
+        @param {bool} logger=None - 日志对象
+        """
+        self.logger = logger
+        self.path = milvus_para['path']
+        self.dimension = milvus_para.get('dimension', 2048)
+        self.metric_type = milvus_para.get('metric_type', 'L2')
+        self.index_type = milvus_para.get('index_type', 'FLAT')
+        self.nlist = milvus_para.get('nlist', 1024)
+        if self.metric_type not in ('L2', 'IP'):
+            raise AttributeError('local vector store not support metric_type [%s]!' % self.metric_type)
+
+        if self.index_type not in ('FLAT', 'IVF'):
+            raise AttributeError('local vector store not support index_type [%s]!' % self.index_type)
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._collections = dict()
+        for _name in os.listdir(self.path):
+            if os.path.exists(os.path.join(self.path, _name, 'meta.json')):
+                self._collections[_name] = self._open_collection(_name)
+
+    #############################
+    # 处理函数
+    #############################
+    def list_collection(self) -> list:
+        """
+        获取集合清单
+
+        @returns {list} - 返回集合清单
+        """
+        with self._lock:
+            return list(self._collections.keys())
+
+    def add_collections(self, collections: list):
+        """
+        新增集合
+
+        @param {list} collection - 集合名列表(str)
+        """
+        with self._lock:
+            for _collection in collections:
+                if _collection not in self._collections.keys():
+                    self._collections[_collection] = self._open_collection(_collection)
+                    self._log_debug('added local vector collection [%s]' % _collection)
+
+    def del_collections(self, collections: list, truncate: bool = False):
+        """
+        删除集合
+
+        @param {list} collections - 集合名列表(str)
+        @param {bool} truncate=False - 是否删除所有集合
+        """
+        with self._lock:
+            _clist = list(self._collections.keys()) if truncate else collections
+            for _collection in _clist:
+                _obj = self._collections.pop(_collection, None)
+                if _obj is not None:
+                    _obj.drop()
+                    self._log_debug('deleted local vector collection [%s]' % _collection)
+
+    def insert_vectors(self, collection: str, vectors: list) -> list:
+        """
+        插入向量
+
+        @param {str} collection - 集合名
+        @param {list} vectors - 多个要插入的向量列表
+
+        @returns {list} - 插入的每个向量的 id 列表
+        """
+        _ids = self._get_collection(collection).insert(vectors)
+        self._log_debug('insert local ids: %s' % str(_ids))
+        return _ids
+
+    def search_vectors(self, collection: str, vector, topk: int = 10, nprobe: int = 16):
+        """
+        搜索匹配变量
+
+        @param {str} collection - 集合名
+        @param {list} vector - 变量对象数组
+        @param {int} topk=10 - 获取最近匹配的数量
+        @param {int} nprobe=16 - IVF索引查询的聚类数量
+
+        @returns {list} - 与查询向量顺序一致的匹配结果清单
+        """
+        return self._get_collection(collection).search(vector, topk=topk, nprobe=nprobe)
+
+    def get_vectors(self, collection: str, ids: list) -> list:
+        """
+        获取指定id的原始向量
+
+        @param {str} collection - 集合名
+        @param {list} ids - 向量id清单
+
+        @returns {list} - 与id清单顺序一致的向量清单，id不存在时对应项为None
+        """
+        return self._get_collection(collection).get(ids)
+
+    def del_vectors(self, collection: str, ids: list):
+        """
+        删除向量
+
+        @param {str} collection - 集合名
+        @param {list} ids - 要删除的 id 列表
+        """
+        self._get_collection(collection).delete(ids)
+        self._log_debug('delete [%s] local ids: %s' % (collection, str(ids)))
+
+    def build_index(self, collection: str):
+        """
+        重新训练集合的IVF索引
+
+        @param {str} collection - 集合名
+        """
+        self._get_collection(collection).train()
+
+    #############################
+    # 内部函数
+    #############################
+    def _open_collection(self, collection: str) -> LocalVectorCollection:
+        """
+        打开集合(不存在则创建)
+        """
+        return LocalVectorCollection(
+            os.path.join(self.path, collection), self.dimension, metric_type=self.metric_type,
+            index_type=self.index_type, nlist=self.nlist
+        )
+
+    def _get_collection(self, collection: str) -> LocalVectorCollection:
+        """
+        获取集合对象
+
+        @throws {RuntimeError} - 集合不存在时抛出异常
+        """
+        _obj = self._collections.get(collection, None)
+        if _obj is None:
+            raise RuntimeError('local vector collection [%s] not exists!' % collection)
+
+        return _obj
+
+    #############################
+    # 日志输出相关函数
+    #############################
+    def _log_debug(self, msg: str, *args, **kwargs):
+        """
+        输出debug日志
+
+        @param {str} msg - 要输出的日志
+        """
+        if self.logger:
+            if 'extra' not in kwargs:
+                kwargs['extra'] = {'callFunLevel': 2}
+
+            self.logger.debug(msg, *args, **kwargs)
+
+
+class _ThreadConnections(object):
+    """
+    单个线程的数据库连接集合，对象被回收(线程结束)时关闭所有连接
+    """
+
+    def __init__(self):
+        self.conns = dict()  # key为数据库名, value为连接
+        self._finalizer = weakref.finalize(self, _ThreadConnections._close_conns, self.conns)
+
+    def close(self):
+        """
+        关闭所有连接
+        """
+        self._finalizer()
+
+    @staticmethod
+    def _close_conns(conns: dict):
+        for _conn in conns.values():
+            try:
+                _conn.close()
+            except sqlite3.Error:
+                pass
+        conns.clear()
+
+
+class LocalDocStorage(DocStorage):
+    """
+    基于SQLite的本地图片信息文档存储，可替代MongoDB用于单机部署及测试
+    每个数据库对应一个SQLite文件，每个集合对应一张表，文档以JSON存储:
+        _id - 文档id(ObjectId的16进制字符串), 主键
+        ids - 向量id, 建立索引
+        doc - 文档JSON
+    配置的索引字段通过json_extract表达式建立索引
+    """
+
+    TABLE_PREFIX = 'c_'
+
+    def __init__(self, connect_para: dict, index_fields: list = None):
+        """
+        构造函数
+
+        @param {dict} connect_para - 数据存储初始化参数，server.xml的mongodb配置
+            path {str} - 数据文件存放目录
+            timeout {float} - 数据库锁等待超时时间，单位为秒，默认30
+        @param {list} index_fields=None - 需要建立索引的文档字段清单
+        """
+        self.path = connect_para['path']
+        self.timeout = connect_para.get('timeout', 30)
+        self.index_fields = list()
+        for _field in ([] if index_fields is None else index_fields):
+            self.index_fields.append(self._check_field(_field))
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        # 每个线程使用独立的连接，线程结束时自动关闭
+        self._local = threading.local()
+        self._thread_conns = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def list_collection(self, database: str):
+        """
+        获取集合（表）清单
+
+        @param {str} database - 数据库名
+
+        @returns {list} - 清单名
+        """
+        _rows = self._get_conn(database).execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ?",
+            (self.TABLE_PREFIX + '%', )
+        ).fetchall()
+        return [_row[0][len(self.TABLE_PREFIX):] for _row in _rows]
+
+    def new_collections(self, database: str, collections: list):
+        """
+        新增集合(table)
+
+        @param {str} database - 数据库名
+        @param {list} collections - 集合名列表(str)
+        """
+        _conn = self._get_conn(database)
+        with _conn:
+            for _collection in collections:
+                _conn.execute(
+                    'CREATE TABLE IF NOT EXISTS %s (_id TEXT PRIMARY KEY, ids INTEGER, doc TEXT)' %
+                    self._table(_collection)
+                )
+
+        for _collection in collections:
+            self.create_indexes(database, _collection, ['ids', ] + self.index_fields)
+
+    def delete_collections(self, database: str, collections: list):
+        """
+        删除集合(table)
+
+        @param {str} database - 数据库名
+        @param {list} collections - 集合名列表(str)
+        """
+        _conn = self._get_conn(database)
+        with _conn:
+            for _collection in collections:
+                _conn.execute('DROP TABLE IF EXISTS %s' % self._table(_collection))
+
+    def collection_exists(self, database: str, collection: str) -> bool:
+        """
+        判断集合是否存在
+
+        @param {str} database - 数据库名
+        @param {str} collection - 要判断的集合
+
+        @returns {bool} - 是否存在
+        """
+        return collection in self.list_collection(database)
+
+    def create_indexes(self, database: str, collection: str, fields: list):
+        """
+        为集合的字段创建索引(已存在则不处理)
+        注：创建字段与_id的组合索引，与MongoStorage的处理一致
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} fields - 要创建索引的字段清单
+        """
+        _conn = self._get_conn(database)
+        with _conn:
+            for _field in fields:
+                if _field == '_id':
+                    # 主键已有索引
+                    continue
+
+                _conn.execute('CREATE INDEX IF NOT EXISTS %s ON %s(%s, _id)' % (
+                    self._index_name(collection, _field), self._table(collection),
+                    self._field_expr(_field)
+                ))
+                # 删除旧版本创建的单字段索引
+                _conn.execute('DROP INDEX IF EXISTS "idx_%s_%s"' % (
+                    collection.replace('"', '""'), _field
+                ))
+
+    def get_missing_indexes(self, database: str, collection: str, fields: list) -> list:
+        """
+        检查集合缺失索引的字段
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} fields - 应建立索引的字段清单
+
+        @returns {list} - 没有索引的字段清单
+        """
+        _rows = self._get_conn(database).execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name = ?",
+            (self.TABLE_PREFIX + collection, )
+        ).fetchall()
+        _indexes = set([_row[0] for _row in _rows])
+
+        return [
+            _field for _field in fields
+            if _field != '_id' and self._index_name(collection, _field)[1:-1] not in _indexes
+        ]
+
+    def insert_document(self, database: str, collection: str, doc: dict) -> str:
+        """
+        插入文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {dict} doc - 要插入文档记录, 插入后会添加_id字段(与pymongo的处理一致)
+
+        @returns {ObjectId} - 记录ID
+        """
+        return self.insert_documents(database, collection, [doc, ])[0]
+
+    def insert_documents(self, database: str, collection: str, docs: list) -> list:
+        """
+        批量插入文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} docs - 要插入文档记录清单
+
+        @returns {list} - 与docs顺序一致的记录ID清单
+        """
+        _rows = list()
+        for _doc in docs:
+            if '_id' not in _doc.keys():
+                _doc['_id'] = ObjectId()
+            _rows.append((str(_doc['_id']), _doc.get('ids', None), self._dumps(_doc)))
+
+        _conn = self._get_conn(database)
+        with _conn:
+            _conn.executemany(
+                'INSERT INTO %s (_id, ids, doc) VALUES (?, ?, ?)' % self._table(collection), _rows
+            )
+
+        return [_doc['_id'] for _doc in docs]
+
+    def search_by_id(self, database: str, collection: str, obj_id: str):
+        """
+        通过id获取文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} obj_id - 文档id
+
+        @returns {list} - 获取到的文档清单
+        """
+        return self._query(database, collection, '_id = ?', (str(obj_id), ), limit=1)
+
+    def delete_by_id(self, database: str, collection: str, obj_id: str):
+        """
+        通过id删除文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} obj_id - 文档id
+
+        @returns {int} - 删除的记录数
+        """
+        _conn = self._get_conn(database)
+        with _conn:
+            return _conn.execute(
+                'DELETE FROM %s WHERE _id = ?' % self._table(collection), (str(obj_id), )
+            ).rowcount
+
+    def delete_by_ids(self, database: str, collection: str, obj_ids: list) -> int:
+        """
+        通过id清单批量删除文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} obj_ids - 文档id清单
+
+        @returns {int} - 删除的记录数
+        """
+        _ids = [str(_id) for _id in obj_ids]
+        _count = 0
+        _conn = self._get_conn(database)
+        with _conn:
+            # 分批删除，避免超过SQLite的参数数量限制
+            for _start in range(0, len(_ids), 500):
+                _part = _ids[_start:_start + 500]
+                _count += _conn.execute(
+                    'DELETE FROM %s WHERE _id IN (%s)' % (
+                        self._table(collection), ','.join(['?'] * len(_part))
+                    ), _part
+                ).rowcount
+
+        return _count
+
+    def search_by_vector_id(self, database: str, collection: str, ids: list,
+                            fields: list = None) -> list:
+        """
+        通过向量id清单获取文档清单
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} ids - milvus_id清单
+        @param {list} fields=None - 要返回的字段清单(支持'a.b'形式的多级字段)
+            为None代表返回完整文档，指定时固定返回ids字段，除非指定否则不返回_id字段
+
+        @returns {list} - 获取到的文档清单
+        """
+        return list(self.iter_by_vector_id(database, collection, ids, fields=fields))
+
+    def iter_by_vector_id(self, database: str, collection: str, ids: list, fields: list = None):
+        """
+        通过向量id清单逐条获取文档(迭代器)
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} ids - milvus_id清单
+        @param {list} fields=None - 要返回的字段清单(支持'a.b'形式的多级字段)
+            为None代表返回完整文档，指定时固定返回ids字段，除非指定否则不返回_id字段
+
+        @returns {iterator} - 文档迭代器
+        """
+        if fields is not None:
+            fields = [self._check_field(_field) for _field in fields]
+
+        # 分批查询，避免超过SQLite的参数数量限制
+        for _start in range(0, len(ids), 500):
+            _part = list(ids[_start:_start + 500])
+            _cursor = self._get_conn(database).execute(
+                'SELECT _id, doc FROM %s WHERE ids IN (%s) ORDER BY rowid' % (
+                    self._table(collection), ','.join(['?'] * len(_part))
+                ), _part
+            )
+            for _row in _cursor:
+                _doc = self._loads(_row[0], _row[1])
+                yield _doc if fields is None else self._project(_doc, fields)
+
+    def search_by_field(self, database: str, collection: str, field_name: str, field_values: list,
+                        page_size: int = 0, page_num: int = 1) -> list:
+        """
+        根据指定域值查找数据
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        @param {int} page_size=15 - 分页每页大小, 如果不分页，传0
+        @param {int} page_num=1 - 第几页，从1开始
+
+        @returns {list} - 获取到的文档清单
+        """
+        _where, _para = self._field_filter(field_name, field_values)
+        if page_size <= 0:
+            return self._query(database, collection, _where, _para)
+
+        return self._query(
+            database, collection, _where, _para, limit=page_size, skip=page_size * (page_num - 1)
+        )
+
+    def delete_by_field(self, database: str, collection: str, field_name: str, field_values: list):
+        """
+        通过域值删除数据
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+
+        @returns {int} - 删除的记录数
+        """
+        _where, _para = self._field_filter(field_name, field_values)
+        _conn = self._get_conn(database)
+        with _conn:
+            return _conn.execute(
+                'DELETE FROM %s WHERE %s' % (self._table(collection), _where), _para
+            ).rowcount
+
+    def count_by_field(self, database: str, collection: str, field_name: str, field_values: list):
+        """
+        查询记录数量
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+
+        @returns {int} - 返回记录数
+        """
+        _where, _para = self._field_filter(field_name, field_values)
+        return self._get_conn(database).execute(
+            'SELECT COUNT(*) FROM %s WHERE %s' % (self._table(collection), _where), _para
+        ).fetchone()[0]
+
+    def search_with_skip(self, database: str, collection: str, field_name: str, field_values: list,
+                         skip: int, size: int):
+        """
+        获取指定条件记录，并指定跳过数量和获取记录大小
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        @param {int} skip - 要跳过的数量
+        @param {int} size - 要获取的大小
+        @returns {list} - 获取到的文档清单
+        """
+        _where, _para = self._field_filter(field_name, field_values)
+        return self._query(database, collection, _where, _para, limit=size, skip=skip)
+
+    def search_after(self, database: str, collection: str, field_name: str, field_values: list,
+                     after_id, size: int):
+        """
+        按_id顺序获取指定条件记录中_id大于after_id的记录(游标分页使用)
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        @param {ObjectId} after_id - 上一页最后一条记录的_id, 为None代表从头开始获取
+        @param {int} size - 要获取的大小
+        @returns {list} - 获取到的文档清单
+        """
+        _where, _para = self._field_filter(field_name, field_values)
+        if after_id is not None:
+            # ObjectId的16进制字符串定长，字符串顺序与ObjectId顺序一致
+            _where = '(%s) AND _id > ?' % _where
+            _para = list(_para) + [str(after_id), ]
+
+        return self._query(database, collection, _where, _para, limit=size, order_by='_id')
+
+    def close(self):
+        """
+        关闭所有数据库连接
+        """
+        with self._lock:
+            for _thread_conns in list(self._thread_conns):
+                _thread_conns.close()
+            self._local = threading.local()
+
+    #############################
+    # 内部函数
+    #############################
+    def _get_conn(self, database: str) -> sqlite3.Connection:
+        """
+        获取当前线程的数据库连接
+        """
+        _thread_conns = getattr(self._local, 'conns', None)
+        if _thread_conns is None:
+            # 只有线程局部变量持有该对象，线程结束后被回收时关闭连接
+            _thread_conns = _ThreadConnections()
+            self._local.conns = _thread_conns
+            with self._lock:
+                self._thread_conns.add(_thread_conns)
+
+        _conn = _thread_conns.conns.get(database, None)
+        if _conn is None:
+            _conn = sqlite3.connect(
+                os.path.join(self.path, '%s.db' % database), timeout=self.timeout,
+                check_same_thread=False
+            )
+            _conn.execute('PRAGMA journal_mode=WAL')
+            _thread_conns.conns[database] = _conn
+
+        return _conn
+
+    def _table(self, collection: str) -> str:
+        """
+        获取集合对应的表名(已加引号)
+        """
+        return '"%s%s"' % (self.TABLE_PREFIX, collection.replace('"', '""'))
+
+    def _index_name(self, collection: str, field: str) -> str:
+        """
+        获取字段与_id组合索引的索引名(已加引号)
+        """
+        return '"idx_%s_%s__id"' % (collection.replace('"', '""'), field)
+
+    def _check_field(self, field: str) -> str:
+        """
+        检查字段名是否合法(只允许字母、数字、下划线及多级字段的'.')
+
+        @throws {AttributeError} - 字段名不合法时抛出异常
+        """
+        if re.match(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$', field) is None:
+            raise AttributeError('field name [%s] not support!' % field)
+
+        return field
+
+    def _field_expr(self, field: str) -> str:
+        """
+        获取字段的查询表达式，ids字段直接使用表字段，其他字段使用json_extract
+        """
+        if field in ('ids', '_id'):
+            return field
+
+        return "json_extract(doc, '$.%s')" % self._check_field(field)
+
+    def _field_filter(self, field_name: str, field_values):
+        """
+        生成与MongoStorage一致的域值查询条件
+
+        @returns {str, list} - where条件, 参数清单
+        """
+        if field_name is None:
+            return '1 = 1', []
+
+        _expr = self._field_expr(field_name)
+        if type(field_values) == str:
+            return '%s = ?' % _expr, [field_values, ]
+
+        if len(field_values) == 0:
+            return '1 = 0', []
+
+        _values = [str(_v) if field_name == '_id' else _v for _v in field_values]
+        return '%s IN (%s)' % (_expr, ','.join(['?'] * len(_values))), _values
+
+    def _query(self, database: str, collection: str, where: str, para, limit: int = -1,
+               skip: int = 0, order_by: str = 'rowid') -> list:
+        """
+        查询文档(默认按插入顺序)
+
+        @returns {list} - 文档清单
+        """
+        _rows = self._get_conn(database).execute(
+            'SELECT _id, doc FROM %s WHERE %s ORDER BY %s LIMIT ? OFFSET ?' % (
+                self._table(collection), where, order_by
+            ), list(para) + [limit, skip]
+        ).fetchall()
+        return [self._loads(_row[0], _row[1]) for _row in _rows]
+
+    def _project(self, doc: dict, fields: list) -> dict:
+        """
+        按字段清单获取文档的部分字段(与MongoDB的projection一致)
+
+        @param {dict} doc - 完整文档
+        @param {list} fields - 要返回的字段清单
+
+        @returns {dict} - 只包含指定字段及ids字段的文档
+        """
+        _res = dict()
+        for _field in ['ids', ] + list(fields):
+            _keys = _field.split('.')
+            _src = doc
+            for _key in _keys[:-1]:
+                _src = _src.get(_key, None) if type(_src) == dict else None
+            if type(_src) != dict or _keys[-1] not in _src:
+                continue
+
+            _dest = _res
+            for _key in _keys[:-1]:
+                _dest = _dest.setdefault(_key, dict())
+            _dest[_keys[-1]] = _src[_keys[-1]]
+
+        return _res
+
+    def _dumps(self, doc: dict) -> str:
+        """
+        将文档转换为JSON(不包含_id)
+        """
+        _doc = dict(doc)
+        _doc.pop('_id', None)
+        return json.dumps(_doc, ensure_ascii=False)
+
+    def _loads(self, obj_id: str, doc: str) -> dict:
+        """
+        将JSON转换为文档，补充_id字段
+        """
+        _doc = json.loads(doc)
+        _doc['_id'] = ObjectId(obj_id)
+        return _doc
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -15,6 +15,7 @@
 import os
 import sys
 import json
+import asyncio
 import inspect
 import time
 import datetime
@@ -53,11 +54,7 @@ class Tools(object):
 
         @return {str} - 对应的节点id，找不到返回None
         """
-        for _key in pipeline_obj.pipeline.keys():
-            if pipeline_obj.pipeline[_key]['name'] == node_name:
-                return _key
-
-        return None
+        return pipeline_obj.compiled.node_ids.get(node_name, None)
 
 
 class PipelineProcesser(object):
@@ -117,6 +114,9 @@ class PipelineProcesser(object):
             3、异步执行的情况主动通知继续执行管道处理
 
         @returns {object} - 处理结果输出数据值，供下一个处理器处理，异步执行的情况返回None
+
+        注：I/O密集的处理器可以将execute定义为协程函数(async def)，通过AsyncPipeline执行时将直接在事件循环中等待，
+            不占用线程；协程处理器不支持通过Pipeline执行
         """
         raise NotImplementedError()
 
@@ -157,6 +157,56 @@ class PipelineRouter(object):
         raise NotImplementedError()
 
 
+class CompiledPipeline(object):
+    """
+    预编译的管道配置
+    管道配置JSON串只解析一次，并预先获取处理器和路由器插件类及节点名索引，可供多个管道执行对象共享
+    """
+
+    def __init__(self, name: str, pipeline_config: str):
+        """
+        构造函数
+
+        @param {str} name - 管道名称
+        @param {str} pipeline_config - 管道配置json字符串, 格式参考Pipeline的构造函数
+
+        @throws {AttributeError} - 找不到管道配置的处理器或路由器插件时抛出异常
+        """
+        self.name = name
+        self.pipeline_config = pipeline_config
+        self.pipeline = json.loads(pipeline_config)
+        self.node_ids = dict()  # 节点配置名与节点id的映射
+        self.processers = dict()  # 节点id与处理器类的映射
+        self.coroutines = dict()  # 节点id与处理器是否为协程处理器(execute为async def)的映射
+        self.routers = dict()  # 路由器名与路由器类的映射
+
+        for _node_id, _node_config in self.pipeline.items():
+            _node_name = _node_config.get('name', '')
+            if _node_name not in self.node_ids.keys():
+                # 同名节点以第一个为准
+                self.node_ids[_node_name] = _node_id
+
+            _processer = Pipeline.get_plugin('processer', _node_config['processor'])
+            if _processer is None:
+                raise AttributeError('Pipeline [%s] processer [%s] not found!' % (
+                    name, _node_config['processor']
+                ))
+            self.processers[_node_id] = _processer
+            self.coroutines[_node_id] = inspect.iscoroutinefunction(_processer.execute)
+
+            for _key in ('router', 'exception_router'):
+                _router_name = _node_config.get(_key, '')
+                if _router_name == '' or _router_name in self.routers.keys():
+                    continue
+
+                _router = Pipeline.get_plugin('router', _router_name)
+                if _router is None:
+                    raise AttributeError('Pipeline [%s] router [%s] not found!' % (
+                        name, _router_name
+                    ))
+                self.routers[_router_name] = _router
+
+
 class Pipeline(object):
     """
     管道控制框架
@@ -261,14 +311,15 @@ class Pipeline(object):
     #############################
     # 构造函数
     #############################
-    def __init__(self, name: str, pipeline_config: str, is_asyn=False, asyn_notify_fun=None,
+    def __init__(self, name: str, pipeline_config, is_asyn=False, asyn_notify_fun=None,
                  running_notify_fun=None, end_running_notify_fun=None,
-                 logger=None):
+                 logger=None, run_in_caller=False):
         """
         构造函数
 
         @param {str} name - 管道名称
-        @param {str} pipeline_config - 管道配置json字符串, 注意节点顺序必须是从1开始的连续整数
+        @param {str|CompiledPipeline} pipeline_config - 管道配置json字符串或预编译的管道配置对象,
+            注意节点顺序必须是从1开始的连续整数
             {
                 "1": {
                     "name": "节点配置名",
@@ -304,19 +355,27 @@ class Pipeline(object):
                 status {str} 执行状态，'S' - 成功，'E' - 出现异常
                 status_msg {str} 状态描述，当异常时送入异常信息
         @param {Simple_log.Logger} logger=None - 日志对象
+        @param {bool} run_in_caller=False - 同步管道是否直接在调用线程中执行节点处理(不启动新的运行线程)
+            注：异步管道(is_asyn=True)忽略该参数
         """
         self.logger = logger
         self.name = name
-        self.pipeline_config = pipeline_config
-        self.pipeline = json.loads(pipeline_config)
+        if isinstance(pipeline_config, CompiledPipeline):
+            self.compiled = pipeline_config
+        else:
+            self.compiled = CompiledPipeline(name, pipeline_config)
+        self.pipeline_config = self.compiled.pipeline_config
+        self.pipeline = self.compiled.pipeline
         self.is_asyn = is_asyn  # 是否异步
         self.asyn_notify_fun = asyn_notify_fun  # 异步结果通知函数
         self.running_notify_fun = running_notify_fun
         self.end_running_notify_fun = end_running_notify_fun
+        self.run_in_caller = run_in_caller
 
         # 管道状态
         self._status_lock = threading.Lock()
         self._status = 'init'
+        self._finished = threading.Event()  # 管道结束运行(非running状态)的通知事件
         self._context = dict()  # 通用上下文对象
         self._context['trace_list'] = list()  # 执行追踪列表
 
@@ -386,19 +445,28 @@ class Pipeline(object):
             self._context['trace_list'] = list()
             self._output = None
             self._status = 'running'
+            self._finished.clear()
         finally:
             self._status_lock.release()
 
-        # 启动任务执行线程
-        self._start_running_thread()
-
-        # 判断是否结束运行
         if self.is_asyn:
-            # 异步执行，不用等待
+            # 异步执行，启动任务执行线程后不用等待
+            self._start_running_thread()
             return None
 
-        while self.status in ('running'):
-            time.sleep(0.0002)
+        if self.run_in_caller:
+            # 直接在调用线程中执行
+            try:
+                self._running_thread_fun()
+            except:
+                # 异常信息已记录到管道状态中
+                pass
+        else:
+            # 启动任务执行线程
+            self._start_running_thread()
+
+        # 等待运行结束(同步管道中有异步处理器的情况，需等待处理器的反馈)
+        self._finished.wait()
 
         return self.status, self._output
 
@@ -547,6 +615,10 @@ class Pipeline(object):
         self._status_lock.acquire()
         try:
             self._status = status
+            if status == 'running':
+                self._finished.clear()
+            else:
+                self._finished.set()
         finally:
             self._status_lock.release()
 
@@ -567,7 +639,7 @@ class Pipeline(object):
             self._context['total'] = 1
             self._context['done'] = 0
 
-            _processer: PipelineProcesser = self.get_plugin('processer', _node_config['processor'])
+            _processer: PipelineProcesser = self.compiled.processers[node_id]
             self._context.update(_node_config.get('context', {}))
 
             # 通知开始运行节点
@@ -576,7 +648,10 @@ class Pipeline(object):
                 self.running_notify_fun(self.name, node_id, _node_config.get('name', ''))
 
             # 运行节点
-            if _processer.is_asyn():
+            if self.compiled.coroutines[node_id]:
+                raise RuntimeError('Coroutine processer [%s] only support AsyncPipeline!' %
+                                   _node_config['processor'])
+            elif _processer.is_asyn():
                 # 异步处理，发起执行后直接返回''
                 _processer.execute(self._current_input, self._context, self)
                 return ''
@@ -604,7 +679,7 @@ class Pipeline(object):
         _node_config = self.pipeline[node_id]
         _router_name = ''
         _router_para = {}
-        if status != 'S' and _node_config.get('exception_router', '') == '':
+        if status != 'S' and _node_config.get('exception_router', '') != '':
             _router_name = _node_config['exception_router']
             _router_para = _node_config.get('exception_router_para', {})
         elif status == 'S':
@@ -650,7 +725,7 @@ class Pipeline(object):
                 if _temp_id in self.pipeline.keys():
                     _next_id = _temp_id
             else:
-                _router: PipelineRouter = self.get_plugin('router', _router_name)
+                _router: PipelineRouter = self.compiled.routers[_router_name]
                 _next_id = _router.get_next(output, self._context, self, **_router_para)
 
             # 判断是否完结
@@ -699,9 +774,10 @@ class Pipeline(object):
                     # 设置上下文，执行下一个节点
                     self._context['node_id'] = _next_id
                     self._context['node_status'] = 'I'
-                    time.sleep(0.0001)
         except:
             # 如果在线程中出了异常，结束掉执行
+            self.log_error('Error: [Pipeline:%s] Running error: %s' %
+                           (self.name, traceback.format_exc()))
             self._context['node_status'] = 'E'
             self._set_status('exception')
             self._output = None
@@ -710,6 +786,202 @@ class Pipeline(object):
             self._thread_running = False
 
 
+class AsyncPipeline(Pipeline):
+    """
+    基于asyncio的管道控制框架
+    在事件循环中按顺序执行节点，等待节点处理时不占用线程，可在单个进程中并发执行大量管道:
+        协程处理器(execute为async def) - 直接在事件循环中await执行
+        同步处理器 - 通过线程池执行(run_in_executor)
+        异步处理器(is_asyn返回True) - 发起执行后等待asyn_node_feeback反馈结果
+
+    @example
+        _pipeline = AsyncPipeline('DemoSearch', compiled_pipeline)
+        _status, _output = await _pipeline.start_async(input_data, {})
+    """
+
+    def __init__(self, name: str, pipeline_config, executor=None, running_notify_fun=None,
+                 end_running_notify_fun=None, logger=None):
+        """
+        构造函数
+
+        @param {str} name - 管道名称
+        @param {str|CompiledPipeline} pipeline_config - 管道配置json字符串或预编译的管道配置对象, 参考Pipeline
+        @param {concurrent.futures.Executor} executor=None - 执行同步处理器的线程池，None代表使用事件循环的默认线程池
+        @param {function} running_notify_fun=None = 节点运行通知函数，参考Pipeline
+        @param {function} end_running_notify_fun=None = 节点运行完成通知函数，参考Pipeline
+        @param {Simple_log.Logger} logger=None - 日志对象
+        """
+        super().__init__(
+            name, pipeline_config, is_asyn=False, running_notify_fun=running_notify_fun,
+            end_running_notify_fun=end_running_notify_fun, logger=logger
+        )
+        self.executor = executor
+        self._loop = None
+        self._feeback_future = None  # 等待异步处理器反馈的Future对象
+
+    #############################
+    # 处理函数
+    #############################
+    async def start_async(self, input_data=None, context: dict = None):
+        """
+        执行管道(从第一个节点开始执行)
+
+        @param {object} input_data=None - 初始输入数据值
+        @param {dict} context=None - 初始上下文
+
+        @returns {str, object} - 返回 status, output
+
+        @throws {RuntimeError} - 当状态为running、pause时抛出异常
+        """
+        self._status_lock.acquire()
+        try:
+            if self._status in ('running', 'pause'):
+                _msg = 'Pipeline [%s] is running!' % self.name
+                self.log_error('Error: %s' % _msg)
+                raise RuntimeError(_msg)
+
+            # 初始化变量
+            self._current_input = input_data
+            self._context = dict() if context is None else context
+            self._context['node_id'] = "1"
+            self._context['node_status'] = 'I'
+            self._context['trace_list'] = list()
+            self._output = None
+            self._status = 'running'
+            self._finished.clear()
+        finally:
+            self._status_lock.release()
+
+        self._loop = asyncio.get_running_loop()
+        self._thread_running = True
+        try:
+            while self.status == 'running':
+                _next_id = await self._run_node_async(self._context['node_id'])
+                if _next_id is None:
+                    # 已经是最后一个节点
+                    break
+
+                # 设置上下文，执行下一个节点
+                self._context['node_id'] = _next_id
+                self._context['node_status'] = 'I'
+        except:
+            self.log_error('Error: [Pipeline:%s] Running error: %s' %
+                           (self.name, traceback.format_exc()))
+            self._context['node_status'] = 'E'
+            self._set_status('exception')
+            self._output = None
+        finally:
+            self._thread_running = False
+
+        return self.status, self._output
+
+    def start(self, input_data=None, context: dict = {}):
+        """
+        同步执行管道(在新的事件循环中执行)，不能在事件循环中调用
+
+        @param {object} input_data=None - 初始输入数据值
+        @param {dict} context={} - 初始上下文
+
+        @returns {str, object} - 返回 status, output
+        """
+        return asyncio.run(self.start_async(input_data=input_data, context=context))
+
+    def pause(self):
+        """
+        暂停管道执行(不支持)
+
+        @throws {RuntimeError} - 调用时抛出异常
+        """
+        raise RuntimeError('AsyncPipeline [%s] not support pause!' % self.name)
+
+    def resume(self):
+        """
+        从中断点重新执行(不支持)
+
+        @throws {RuntimeError} - 调用时抛出异常
+        """
+        raise RuntimeError('AsyncPipeline [%s] not support resume!' % self.name)
+
+    def asyn_node_feeback(self, node_id: str, output=None, status: str = 'S', status_msg: str = 'success', context: dict = {}):
+        """
+        异步节点执行结果反馈(可在任意线程中调用)
+
+        @param {str} node_id - 节点配置id
+        @param {object} output=None - 节点执行输出结果
+        @param {str} status='S' - 节点运行状态，'S' - 成功，'E' - 出现异常
+        @param {str} status_msg='success' - 运行状态描述
+        @param {dict} context={} - 要修改的上下文信息
+        """
+        if self._context['node_id'] != node_id or self._feeback_future is None:
+            _msg = '[Pipeline:%s] Not correct node id [%s]!' % (self.name, node_id)
+            self.log_error('Error: %s' % _msg)
+            raise AttributeError(_msg)
+
+        self._loop.call_soon_threadsafe(
+            self._set_feeback, self._feeback_future, (output, status, status_msg, context)
+        )
+
+    #############################
+    # 内部函数
+    #############################
+    def _set_feeback(self, future, feeback: tuple):
+        """
+        在事件循环中设置异步处理器的反馈结果
+        """
+        if not future.done():
+            future.set_result(feeback)
+
+    async def _run_node_async(self, node_id: str):
+        """
+        执行处理节点
+
+        @param {str} node_id - 要执行的节点ID
+
+        @returns {str} - 返回下一节点ID，返回None代表结束管道执行
+        """
+        _node_config = self.pipeline[node_id]
+        try:
+            self._context['node_id'] = node_id
+            self._context['node_status'] = 'R'
+            self._context['start_time'] = datetime.datetime.now()
+            self._context['total'] = 1
+            self._context['done'] = 0
+
+            _processer: PipelineProcesser = self.compiled.processers[node_id]
+            self._context.update(_node_config.get('context', {}))
+
+            # 通知开始运行节点
+            self.log_debug('[Pipeline:%s] Start running node [%s]' % (self.name, node_id))
+            if self.running_notify_fun is not None:
+                self.running_notify_fun(self.name, node_id, _node_config.get('name', ''))
+
+            # 运行节点
+            if self.compiled.coroutines[node_id]:
+                # 协程处理器
+                _output = await _processer.execute(self._current_input, self._context, self)
+            elif _processer.is_asyn():
+                # 异步处理器，发起执行后等待反馈
+                self._feeback_future = self._loop.create_future()
+                _processer.execute(self._current_input, self._context, self)
+                _output, _status, _status_msg, _context = await self._feeback_future
+                self._feeback_future = None
+                self._context.update(_context)
+                return self._run_router(node_id, output=_output, status=_status, status_msg=_status_msg)
+            else:
+                # 同步处理器，在线程池中执行
+                _output = await self._loop.run_in_executor(
+                    self.executor, _processer.execute, self._current_input, self._context, self
+                )
+
+            return self._run_router(node_id, output=_output, status='S', status_msg='success')
+        except:
+            self._feeback_future = None
+            _status_msg = traceback.format_exc()
+            self.log_error('Error: [Pipeline:%s] Running node [%s] error: %s' %
+                           (self.name, node_id, _status_msg))
+            return self._run_router(node_id, output=None, status='E', status_msg=_status_msg)
+
+
 if __name__ == '__main__':
     # 当程序自己独立运行时执行的操作
     # 打印版本信息
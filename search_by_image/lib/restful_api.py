@@ -23,7 +23,6 @@ import inspect
 import traceback
 import uuid
 import datetime
-from io import BytesIO
 from functools import wraps
 from flask import Flask, request, jsonify
 from werkzeug.routing import Rule
@@ -177,6 +176,7 @@ class SearchServer(object):
             interface_seq_id : (可选)客户端序号，客户端可传入该值来支持异步调用
             pipeline : 指定使用的管道名(可选择pipeline_config配置中的管道)
             collection : 指定要搜索的分类，如不指定传入''字符串
+            fields : (可选)要返回的图片信息字段，通过逗号分隔，不传代表使用result_fields配置
 
         @return {str} - 返回回答的json字符串
             status : 处理状态
@@ -213,15 +213,14 @@ class SearchServer(object):
                 _ret_json['msg'] = 'No file upload!'
                 return jsonify(_ret_json)
 
-            # 处理文件为二进制
-            _file = request.files['file']
-            _img_bytesio = BytesIO()
-            _file.save(_img_bytesio)
+            # 直接读取上传文件的二进制数据
+            _image_data = request.files['file'].read()
 
             # 执行查询处理
             _ret_json['match_images'] = _loader.search_engine.search(
-                _img_bytesio.getvalue(), request.form['pipeline'],
-                init_collection=request.form.get('collection', '')
+                _image_data, request.form['pipeline'],
+                init_collection=request.form.get('collection', ''),
+                fields=request.form.get('fields', None)
             )
         except:
             if _loader.logger:
@@ -245,6 +244,7 @@ class SearchServer(object):
                 interface_seq_id : (可选)客户端序号，客户端可传入该值来支持异步调用
                 pipeline : 指定使用的管道名(可选择pipeline_config配置中的管道)
                 collection : 指定要搜索的分类，如不指定传入''字符串
+                fields : (可选)要返回的图片信息字段数组(或逗号分隔的字符串)，不传代表使用result_fields配置
             }
 
         @return {str} - 返回回答的json字符串
@@ -285,7 +285,8 @@ class SearchServer(object):
             # 执行查询处理
             _ret_json['match_images'] = _loader.search_engine.search(
                 _image, request.json['pipeline'],
-                init_collection=request.json.get('collection', '')
+                init_collection=request.json.get('collection', ''),
+                fields=request.json.get('fields', None)
             )
         except:
             if _loader.logger:
@@ -309,6 +310,7 @@ class SearchServer(object):
                 interface_seq_id : (可选)客户端序号，客户端可传入该值来支持异步调用
                 pipeline : 指定使用的管道名(可选择pipeline_config配置中的管道)
                 collection : 指定要搜索的分类，如不指定传入''字符串
+                fields : (可选)要返回的图片信息字段数组(或逗号分隔的字符串)，不传代表使用result_fields配置
             }
 
         @return {str} - 返回回答的json字符串
@@ -340,13 +342,92 @@ class SearchServer(object):
         try:
             _ret_json['interface_seq_id'] = request.json.get('interface_seq_id', '')
 
-            # 下载图片信息
-            _image = urllib.request.urlopen(request.json['url']).read()
+            # 下载图片并执行查询处理(下载在后台事件循环中执行，不占用线程)
+            _ret_json['match_images'] = _loader.search_engine.search_by_url(
+                request.json['url'], request.json['pipeline'],
+                init_collection=request.json.get('collection', ''),
+                fields=request.json.get('fields', None)
+            )
+        except:
+            if _loader.logger:
+                _loader.logger.error(
+                    'Exception: %s' % traceback.format_exc(),
+                    extra={'callFunLevel': 1}
+                )
+            _ret_json['status'] = '20001'
+            _ret_json['msg'] = '上传文件异常'
+
+        return jsonify(_ret_json)
+
+    @classmethod
+    @FlaskTool.log
+    def SearchBatch(cls, methods=['POST']):
+        """
+        通过上传多个Base64文件编码方式批量搜索相似图片 (/api/SearchServer/SearchBatch)
+            传入JSON信息如下：
+            {
+                files : 要搜索的文件Base64编码字符串数组，数量不能超过search_config的max_batch_size配置
+                interface_seq_id : (可选)客户端序号，客户端可传入该值来支持异步调用
+                pipeline : 指定使用的管道名(可选择pipeline_config配置中的管道)
+                collection : 指定要搜索的分类，如不指定传入''字符串
+                fields : (可选)要返回的图片信息字段数组(或逗号分隔的字符串)，不传代表使用result_fields配置
+            }
+
+        @return {str} - 返回回答的json字符串
+            status : 处理状态
+                00000 - 成功
+                10001 - 没有指定上传文件
+                10002 - 上传文件数量超过search_config的max_batch_size配置
+                2XXXX - 处理失败
+            msg : 处理状态对应的描述
+            match_images_list: 与files顺序一致的匹配图片数组清单, 每个数组的格式与SearchByBase64的match_images一致
+                [
+                    [
+                        {
+                            图片导入时的字典信息,
+                            ...
+                            'ids': {str} - Milvus的id
+                            'score': {float} - 匹配分数
+                            'distance': {float} - 欧氏距离
+                            'collection': {str} - 图片分类
+                        },
+                        ...
+                    ],
+                    ...
+                ]
+        """
+        _ret_json = {
+            'interface_seq_id': '',
+            'status': '00000',
+            'msg': 'success',
+            'match_images_list': []
+        }
+        _loader = RunTool.get_global_var('SER_LOADER')
+        try:
+            _ret_json['interface_seq_id'] = request.json.get('interface_seq_id', '')
+
+            _files = request.json.get('files', [])
+            if len(_files) == 0:
+                _ret_json['status'] = '10001'
+                _ret_json['msg'] = 'No file upload!'
+                return jsonify(_ret_json)
+
+            _max_batch_size = _loader.search_engine.max_batch_size
+            if _max_batch_size > 0 and len(_files) > _max_batch_size:
+                _ret_json['status'] = '10002'
+                _ret_json['msg'] = 'Too many files, max batch size is %d!' % _max_batch_size
+                return jsonify(_ret_json)
+
+            # Base64转为二进制
+            _images = [
+                base64.b64decode(re.sub('^data:.*;base64,', '', _file)) for _file in _files
+            ]
 
             # 执行查询处理
-            _ret_json['match_images'] = _loader.search_engine.search(
-                _image, request.json['pipeline'],
-                init_collection=request.json.get('collection', '')
+            _ret_json['match_images_list'] = _loader.search_engine.search_batch(
+                _images, request.json['pipeline'],
+                init_collection=request.json.get('collection', ''),
+                fields=request.json.get('fields', None)
             )
         except:
             if _loader.logger:
@@ -395,14 +476,12 @@ class SearchServer(object):
                 _ret_json['msg'] = 'No file upload!'
                 return jsonify(_ret_json)
 
-            # 处理文件为二进制
-            _file = request.files['file']
-            _img_bytesio = BytesIO()
-            _file.save(_img_bytesio)
+            # 直接读取上传文件的二进制数据
+            _image_data = request.files['file'].read()
 
             # 执行导入处理
             _loader.search_engine.image_to_search_db(
-                _img_bytesio.getvalue(), json.loads(request.form['image_doc']),
+                _image_data, json.loads(request.form['image_doc']),
                 request.form['pipeline'],
                 init_collection=request.form.get('collection', '')
             )
@@ -535,6 +614,11 @@ class SearchServer(object):
                 00000 - 成功
                 2XXXX - 处理失败
             msg : 处理状态对应的描述
+            removed : 删除数量统计
+                {
+                    total : 删除的图片总数,
+                    collections : {集合名: 删除的图片数, ...}
+                }
         """
         _ret_json = {
             'interface_seq_id': '',
@@ -546,7 +630,7 @@ class SearchServer(object):
             _ret_json['interface_seq_id'] = request.json.get('interface_seq_id', '')
 
             # 执行删除处理
-            _ret_json['images'] = _loader.search_engine.remove_images(
+            _ret_json['removed'] = _loader.search_engine.remove_images(
                 request.json.get('field_name', None), request.json.get('field_values', None),
                 request.json.get('collection', '')
             )
@@ -574,6 +658,8 @@ class SearchServer(object):
                 field_values : 要查询的条件清单，如果传入数组代表使用in条件，如果传入字符串代表使用=条件
                 page_size ：分页大小
                 page_num : 第几页 ，从1开始
+                cursor : (可选)分页游标，送该参数时使用游标分页(忽略page_num)，获取第一页送null或空字符串,
+                    获取下一页送上一次返回的next_cursor
             }
 
         @return {str} - 返回回答的json字符串
@@ -590,6 +676,7 @@ class SearchServer(object):
                     },
                     ...
                 ]
+            next_cursor: 使用游标分页时返回的下一页游标，没有更多数据时返回null
         """
         _ret_json = {
             'interface_seq_id': '',
@@ -602,11 +689,19 @@ class SearchServer(object):
             _ret_json['interface_seq_id'] = request.json.get('interface_seq_id', '')
 
             # 执行查询处理
-            _ret_json['images'] = _loader.search_engine.get_images(
-                request.json.get('field_name', None), request.json.get('field_values', None),
-                request.json.get('collection', ''),
-                request.json.get('page_size', 15), request.json.get('page_num', 1)
-            )
+            if 'cursor' in request.json.keys():
+                _ret_json['images'], _ret_json['next_cursor'] = \
+                    _loader.search_engine.get_images_by_cursor(
+                        request.json.get('field_name', None), request.json.get('field_values', None),
+                        request.json.get('collection', ''),
+                        request.json.get('page_size', 15), request.json['cursor']
+                )
+            else:
+                _ret_json['images'] = _loader.search_engine.get_images(
+                    request.json.get('field_name', None), request.json.get('field_values', None),
+                    request.json.get('collection', ''),
+                    request.json.get('page_size', 15), request.json.get('page_num', 1)
+                )
 
             for _item in _ret_json['images']:
                 # 删除非json字段
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# Copyright 2019 黎慧剑
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+批量推理调度
+@module scheduler
+@file scheduler.py
+"""
+
+import os
+import sys
+import time
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+
+__MOUDLE__ = 'scheduler'  # 模块名
+__DESCRIPT__ = u'批量推理调度'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = u'黎慧剑'  # 作者
+__PUBLISH__ = '2020.09.20'  # 发布日期
+
+
+class MicroBatchScheduler(object):
+    """
+    微批量调度器
+    多个线程并发提交的单个处理请求，由后台线程在等待时间或批量大小达到上限时合并为一批执行，
+    执行完成后再将结果分发给各个提交者
+
+    @example
+        def batch_fun(items: list) -> list:
+            return [item * 2 for item in items]
+
+        _scheduler = MicroBatchScheduler('demo', batch_fun, batch_size=8, batch_delay=0.005)
+        _result = _scheduler.submit(1)  # 阻塞等待返回 2
+    """
+
+    def __init__(self, name: str, batch_fun, batch_size: int = 8, batch_delay: float = 0.005,
+                 logger=None):
+        """
+        构造函数
+
+        @param {str} name - 调度器名称，用于日志及线程命名
+        @param {function} batch_fun - 批量执行函数，函数定义为 fun(items:list) -> list
+            返回的结果清单必须与传入的清单长度及顺序一致
+        @param {int} batch_size=8 - 每批最大处理数量
+        @param {float} batch_delay=0.005 - 收到第一个请求后等待凑批的最长时间，单位为秒
+        @param {Logger} logger=None - 日志对象
+        """
+        self.name = name
+        self.batch_fun = batch_fun
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = max(0.0, batch_delay)
+        self.logger = logger
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name='MicroBatchScheduler-%s' % name, daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, item, timeout: float = None):
+        """
+        提交处理请求并等待结果返回
+
+        @param {object} item - 要处理的单个请求数据
+        @param {float} timeout=None - 等待超时时间，单位为秒，None代表一直等待
+
+        @returns {object} - 对应的处理结果
+
+        @throws {Exception} - 请求执行出现异常时抛出对应异常(整批执行失败时会逐个重试，只有失败的请求抛出异常)
+        """
+        return self.submit_async(item).result(timeout=timeout)
+
+    def submit_async(self, item) -> Future:
+        """
+        提交处理请求，不等待结果
+
+        @param {object} item - 要处理的单个请求数据
+
+        @returns {concurrent.futures.Future} - 获取结果的Future对象
+
+        @throws {RuntimeError} - 调度器已关闭时抛出异常
+        """
+        if self._closed:
+            raise RuntimeError('MicroBatchScheduler [%s] is closed!' % self.name)
+
+        _future = Future()
+        self._queue.put((item, _future))
+        return _future
+
+    def close(self):
+        """
+        关闭调度器，已提交的请求会处理完成后再退出
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    #############################
+    # 内部函数
+    #############################
+    def _run(self):
+        """
+        后台凑批执行线程
+        """
+        while True:
+            _first = self._queue.get()
+            if _first is None:
+                break
+
+            # 在等待时间内尽量凑够一批
+            _batch = [_first]
+            _stop = False
+            _deadline = time.time() + self.batch_delay
+            while len(_batch) < self.batch_size:
+                _remain = _deadline - time.time()
+                try:
+                    if _remain <= 0:
+                        _item = self._queue.get_nowait()
+                    else:
+                        _item = self._queue.get(timeout=_remain)
+                except queue.Empty:
+                    break
+
+                if _item is None:
+                    _stop = True
+                    break
+
+                _batch.append(_item)
+
+            self._execute_batch(_batch)
+            if _stop:
+                break
+
+    def _execute_batch(self, batch: list):
+        """
+        执行一批请求并分发结果
+
+        @param {list} batch - 请求清单, [(item, future), ...]
+        """
+        # 去掉已被取消的请求
+        _batch = [_req for _req in batch if _req[1].set_running_or_notify_cancel()]
+        if len(_batch) == 0:
+            return
+
+        try:
+            _results = self._run_batch_fun([_req[0] for _req in _batch])
+        except Exception as e:
+            if len(_batch) == 1:
+                self._log_error('MicroBatchScheduler [%s] execute batch error: %s' % (
+                    self.name, traceback.format_exc()))
+                _batch[0][1].set_exception(e)
+                return
+
+            # 整批失败时逐个重新执行，避免单个请求的异常影响同批次的其他请求
+            self._log_error('MicroBatchScheduler [%s] execute batch error, retry one by one: %s' % (
+                self.name, traceback.format_exc()))
+            for _req in _batch:
+                try:
+                    _req[1].set_result(self._run_batch_fun([_req[0]])[0])
+                except Exception as _item_error:
+                    self._log_error('MicroBatchScheduler [%s] execute item error: %s' % (
+                        self.name, traceback.format_exc()))
+                    _req[1].set_exception(_item_error)
+            return
+
+        for _req, _result in zip(_batch, _results):
+            _req[1].set_result(_result)
+
+    def _run_batch_fun(self, items: list) -> list:
+        """
+        执行批量处理函数并检查返回结果数量
+
+        @param {list} items - 请求数据清单
+
+        @returns {list} - 处理结果清单
+
+        @throws {RuntimeError} - 返回结果数量与请求数量不一致时抛出异常
+        """
+        _results = self.batch_fun(items)
+        if len(_results) != len(items):
+            raise RuntimeError(
+                'MicroBatchScheduler [%s] batch result size [%d] not match request size [%d]!' % (
+                    self.name, len(_results), len(items)
+                )
+            )
+        return _results
+
+    def _log_error(self, msg: str):
+        """
+        输出error日志
+        """
+        if self.logger is not None:
+            self.logger.error(msg)
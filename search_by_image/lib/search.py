@@ -16,13 +16,26 @@ import os
 import sys
 import copy
 import json
+import time
+import base64
+import asyncio
+import heapq
+import hashlib
+import threading
+import itertools
 import traceback
+import concurrent.futures
+import numpy as np
+from bson import ObjectId
 from HiveNetLib.base_tools.file_tool import FileTool
 # 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
 sys.path.append(os.path.abspath(os.path.join(
     os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
-from search_by_image.lib.pipeline import Pipeline
-from search_by_image.lib.storage import MongoStorage, MilvusIns
+from search_by_image.lib.pipeline import Pipeline, CompiledPipeline, AsyncPipeline
+from search_by_image.lib.storage import MongoStorage, MilvusIns, VectorStore, DocStorage, VectorMatch
+from search_by_image.lib.local_storage import LocalVectorStore, LocalDocStorage
+from search_by_image.lib.cache import LRUCache, VectorCache
+from search_by_image.lib.worker_pool import PipelineWorkerPool
 
 
 __MOUDLE__ = 'search'  # 模块名
@@ -43,11 +56,100 @@ class SearchEngine(object):
         self.search_config = copy.deepcopy(server_config['search_config'])
         self.pipeline_config = copy.deepcopy(server_config['pipeline']['pipeline_config'])
         self.app_name = self.search_config['app_name']
+
+        # 搜索结果返回的图片信息字段, 管道配置优先于默认配置
+        self.result_fields = self._split_fields(self.search_config.get('result_fields', ''))
+        self.pipeline_result_fields = dict()
+        _pipeline_result_fields = server_config['pipeline'].get('result_fields', None)
+        if type(_pipeline_result_fields) == dict:
+            for _name, _fields in _pipeline_result_fields.items():
+                self.pipeline_result_fields[_name] = self._split_fields(_fields)
         self.database = server_config['mongodb'].get('authSource', self.app_name)
 
+        # 批量搜索单次请求的最大图片数量，<=0代表不限制
+        self.max_batch_size = self.search_config.get('max_batch_size', 32)
+
+        # 管道未识别出集合时并发搜索的候选集合数量，<=1代表不启用
+        self.fanout_collections = self.search_config.get('fanout_collections', 0)
+        self.fanout_executor = None
+        if self.fanout_collections > 1:
+            self.fanout_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.search_config.get('fanout_workers', 4),
+                thread_name_prefix='SearchFanout'
+            )
+
+        # 重排序参数: 按 topk * rerank_multiple 的数量用rerank_nprobe近似查询，再按原始向量精确计算距离排序
+        self.metric_type = server_config['milvus'].get('metric_type', 'L2')
+        self.rerank_multiple = self.search_config.get('rerank_multiple', 0)
+        self.rerank_nprobe = self.search_config.get('rerank_nprobe', self.search_config['nprobe'])
+        self.rerank_cache = None
+        if self.rerank_multiple > 1 and self.search_config.get('rerank_cache_size', 0) > 0:
+            # 原始向量缓存，减少获取向量的调用
+            self.rerank_cache = LRUCache(
+                max_size=self.search_config['rerank_cache_size'], copy_value=False
+            )
+
+        # 预编译管道配置，处理请求时只需创建管道执行对象
+        self.pipelines = dict()
+        for _name, _config in self.pipeline_config.items():
+            self.pipelines[_name] = CompiledPipeline(_name, _config)
+
+        # 通过Url搜索时下载图片的协程管道(UrlImageFetch处理器)，首次使用时编译，在后台事件循环中执行
+        self.url_fetch_context = {
+            'fetch_timeout': self.search_config.get('url_fetch_timeout', 30),
+            'fetch_max_size': self.search_config.get('url_max_size', 20971520)
+        }
+        self.url_fetch_pipeline = None
+        self._async_loop = None
+        self._async_loop_lock = threading.Lock()
+
+        # 管道多进程处理池，启用后管道在各工作进程中执行，图片及特征向量通过共享内存传递
+        self.worker_pool = None
+        _pool_config = server_config.get('worker_pool', None)
+        if _pool_config is not None and _pool_config.get('enable', False):
+            self.worker_pool = PipelineWorkerPool(
+                server_config, workers=_pool_config.get('workers', 2),
+                decode=_pool_config.get('decode', False),
+                max_input_side=_pool_config.get('max_input_side', 0),
+                start_method=_pool_config.get('start_method', 'spawn'),
+                task_timeout=_pool_config.get('task_timeout', 60), logger=self.logger
+            )
+            # 等待工作进程装载管道，装载失败直接抛出异常
+            try:
+                if not self.worker_pool.wait_ready(timeout=_pool_config.get('init_timeout', 300)):
+                    raise RuntimeError('PipelineWorkerPool initialize timeout!')
+            except Exception:
+                self.worker_pool.close()
+                raise
+
         # 数据存储对象
-        self.mongo_db = MongoStorage(server_config['mongodb'])
-        self.milvus_db = MilvusIns(server_config['milvus'], logger=logger)
+        self.mongo_db = self._create_doc_storage(server_config)
+        self.milvus_db = self._create_vector_store(server_config)
+
+        # 查询结果缓存
+        self.result_cache = None
+        _cache_config = server_config.get('result_cache', None)
+        if _cache_config is not None and _cache_config.get('enable', False):
+            self.result_cache = LRUCache(
+                max_size=_cache_config.get('max_size', 10000),
+                ttl=_cache_config.get('ttl', 600),
+                max_memory=_cache_config.get('max_memory', 0),
+                size_fun=lambda _value: len(json.dumps(_value, ensure_ascii=False, default=str))
+            )
+
+        # 特征向量缓存
+        self.vector_cache = None
+        _cache_config = server_config.get('vector_cache', None)
+        if _cache_config is not None and _cache_config.get('enable', False):
+            _cache_config = copy.deepcopy(_cache_config)
+            if _cache_config.get('path', '') != '' and not os.path.isabs(_cache_config['path']):
+                # 相对路径按执行路径处理
+                _cache_config['path'] = os.path.join(
+                    server_config.get('execute_path', os.getcwd()), _cache_config['path']
+                )
+            self.vector_cache = VectorCache(
+                _cache_config, dimension=server_config['milvus'].get('dimension', 0)
+            )
 
         # 创建milvus和mongodb要使用的集合
         self._create_collections()
@@ -56,60 +158,223 @@ class SearchEngine(object):
     # 图片搜索
     #############################
 
-    def search(self, image_data: bytes, pipeline: str, init_collection: str = '') -> list:
+    def search(self, image_data: bytes, pipeline: str, init_collection: str = '',
+               fields: list = None) -> list:
         """
         搜索指定图片的相似图片信息
 
         @param {bytes} image_data - 影像内容二进制数据
         @param {str} pipeline - 处理管道标识
         @param {str} init_collection='' - 默认集合名，用于传入管道进行处理
+        @param {list|str} fields=None - 要返回的图片信息字段清单(str时通过逗号分隔)
+            为None代表使用管道或默认的result_fields配置，都没有配置时返回完整的图片信息
 
         @returns {list} - 返回相似图片文档信息
         """
+        _fields = self._get_result_fields(pipeline, fields)
+        if self.result_cache is None:
+            return self._search(
+                image_data, pipeline, init_collection=init_collection, fields=_fields
+            )[1]
+
+        # 优先从缓存获取查询结果
+        _cache_key = self._get_search_cache_key(image_data, pipeline, init_collection, _fields)
+        _res = self.result_cache.get(_cache_key)
+        if _res is not None:
+            return _res
+
+        _version = self.result_cache.version
+        _collections, _res = self._search(
+            image_data, pipeline, init_collection=init_collection, fields=_fields
+        )
+        self.result_cache.set(_cache_key, _res, tags=_collections, version=_version)
+        return _res
+
+    async def search_async(self, image_data: bytes, pipeline: str, init_collection: str = '',
+                           fields: list = None) -> list:
+        """
+        搜索指定图片的相似图片信息(协程模式)
+        管道通过AsyncPipeline在事件循环中执行，特征向量及图片信息的查询在事件循环的默认线程池中执行
+
+        @param {bytes} image_data - 影像内容二进制数据
+        @param {str} pipeline - 处理管道标识
+        @param {str} init_collection='' - 默认集合名，用于传入管道进行处理
+        @param {list|str} fields=None - 要返回的图片信息字段清单，参考search函数
+
+        @returns {list} - 返回相似图片文档信息
+        """
+        _fields = self._get_result_fields(pipeline, fields)
+        _cache_key = None
+        if self.result_cache is not None:
+            # 优先从缓存获取查询结果
+            _cache_key = self._get_search_cache_key(image_data, pipeline, init_collection, _fields)
+            _res = self.result_cache.get(_cache_key)
+            if _res is not None:
+                return _res
+
+            _version = self.result_cache.version
+
         # 获取当前图片的特征向量
-        _collection, _vertor = self._get_image_vertor(
-            image_data, self._get_pipeline(pipeline), init_collection=init_collection
+        _use_default = (self.fanout_executor is None)
+        _vertor_key, _cached = self._get_cached_vertor(
+            image_data, pipeline, init_collection, use_default=_use_default
         )
+        if _cached is None:
+            if self.worker_pool is not None:
+                _status, _output = await asyncio.get_running_loop().run_in_executor(
+                    None, self.worker_pool.run_pipeline, pipeline, image_data, init_collection
+                )
+            else:
+                _pipeline_obj = AsyncPipeline(pipeline, self.pipelines[pipeline], logger=self.logger)
+                _status, _output = await _pipeline_obj.start_async(
+                    {'image': image_data, 'collection': init_collection}, {}
+                )
+            _cached = self._deal_pipeline_output(
+                _status, _output, _vertor_key, use_default=_use_default
+            )
 
-        # 查询匹配的特征向量
-        _ids = self.milvus_db.search_vectors(
-            f'{self.app_name}_{_collection}', [_vertor.tolist(), ], topk=self.search_config['topk'],
-            nprobe=self.search_config['nprobe']
+        _collections, _res = await asyncio.get_running_loop().run_in_executor(
+            None, self._search_by_vertor, _cached[0], _cached[1], _fields
         )
 
-        if len(_ids) == 0:
-            # 没有找到任何匹配项
-            return []
+        if _cache_key is not None:
+            self.result_cache.set(_cache_key, _res, tags=_collections, version=_version)
 
-        # 选取匹配项
-        _ids_dict = {}
-        for _match in _ids[0]:
-            _score = 1.0 / (1.0 + _match.distance)
-            if _score >= self.search_config['match_score']:
-                _ids_dict[_match.id] = {
-                    'score': _score,
-                    'distance': _match.distance
+        return _res
+
+    def search_by_url(self, url: str, pipeline: str, init_collection: str = '',
+                      fields: list = None) -> list:
+        """
+        下载Url的图片并搜索相似图片信息
+        在后台事件循环中执行search_url_async，调用线程等待执行结果
+
+        @param {str} url - 图片的Url地址
+        @param {str} pipeline - 处理管道标识
+        @param {str} init_collection='' - 默认集合名，用于传入管道进行处理
+        @param {list|str} fields=None - 要返回的图片信息字段清单，参考search函数
+
+        @returns {list} - 返回相似图片文档信息
+        """
+        return self._run_coroutine(
+            self.search_url_async(url, pipeline, init_collection=init_collection, fields=fields)
+        )
+
+    async def search_url_async(self, url: str, pipeline: str, init_collection: str = '',
+                               fields: list = None) -> list:
+        """
+        下载Url的图片并搜索相似图片信息(协程模式)
+        通过UrlImageFetch协程处理器下载图片，下载过程不占用线程，下载后按search_async处理
+
+        @param {str} url - 图片的Url地址
+        @param {str} pipeline - 处理管道标识
+        @param {str} init_collection='' - 默认集合名，用于传入管道进行处理
+        @param {list|str} fields=None - 要返回的图片信息字段清单，参考search函数
+
+        @returns {list} - 返回相似图片文档信息
+
+        @throws {AttributeError} - 未装载UrlImageFetch处理器插件时抛出异常
+        @throws {RuntimeError} - 下载图片失败时抛出异常
+        """
+        if self.url_fetch_pipeline is None:
+            self.url_fetch_pipeline = CompiledPipeline('UrlImageFetch', json.dumps({
+                '1': {
+                    'name': 'UrlImageFetch', 'processor': 'UrlImageFetch',
+                    'context': self.url_fetch_context
                 }
+            }))
 
-        # 查询图片信息
-        _images = self.mongo_db.search_by_vector_id(
-            self.database, _collection, list(_ids_dict.keys())
+        _pipeline_obj = AsyncPipeline(
+            'UrlImageFetch', self.url_fetch_pipeline, logger=self.logger
         )
+        _status, _output = await _pipeline_obj.start_async(
+            {'url': url, 'collection': init_collection}, {}
+        )
+        if _status != 'success':
+            _status_msg = _status
+            if len(_pipeline_obj.trace_list) > 0:
+                _status_msg = _pipeline_obj.trace_list[-1]['status_msg']
+            raise RuntimeError('Fetch image from url [%s] error: %s' % (url, _status_msg))
 
-        # 补充距离信息
-        for _index in range(len(_images)):
-            # 转换为相似度
-            _id = _images[_index]['ids']
-            _images[_index]['score'] = _ids_dict[_id]['score']
-            _images[_index]['distance'] = _ids_dict[_id]['distance']
-            _images[_index]['collection'] = _collection
-            # 删除_id这个非json对象
-            del _images[_index]['_id']
+        return await self.search_async(
+            _output['image'], pipeline, init_collection=init_collection, fields=fields
+        )
 
-        # 进行排序
-        _images.sort(key=lambda x: x['distance'])
+    def search_batch(self, images: list, pipeline: str, init_collection: str = '',
+                     fields: list = None) -> list:
+        """
+        批量搜索多张图片的相似图片信息
+        注：每张图片与search函数一样优先使用查询结果缓存，管道未识别出集合时并发搜索候选集合;
+            其余图片按管道识别出的集合对特征向量进行分组，每个集合只执行一次Milvus查询和一次MongoDB查询
 
-        return _images
+        @param {list} images - 影像内容二进制数据清单(bytes)
+        @param {str} pipeline - 处理管道标识
+        @param {str} init_collection='' - 默认集合名，用于传入管道进行处理
+        @param {list|str} fields=None - 要返回的图片信息字段清单，参考search函数
+
+        @returns {list} - 返回与images顺序一致的相似图片文档信息清单，每项为search函数的返回值
+
+        @throws {AttributeError} - 图片数量超过max_batch_size配置时抛出异常
+        """
+        if self.max_batch_size > 0 and len(images) > self.max_batch_size:
+            raise AttributeError('batch size [%d] exceeds max_batch_size [%d]!' % (
+                len(images), self.max_batch_size
+            ))
+
+        _pipeline_obj = self._get_pipeline(pipeline)
+        _fields = self._get_result_fields(pipeline, fields)
+        _use_default = (self.fanout_executor is None)
+        _version = None if self.result_cache is None else self.result_cache.version
+
+        # 获取每张图片的特征向量，并按集合分组
+        _res = [[] for _i in range(len(images))]
+        _cache_keys = [None for _i in range(len(images))]
+        _groups = dict()
+        for _index in range(len(images)):
+            if self.result_cache is not None:
+                # 优先从缓存获取查询结果
+                _cache_keys[_index] = self._get_search_cache_key(
+                    images[_index], pipeline, init_collection, _fields
+                )
+                _cached = self.result_cache.get(_cache_keys[_index])
+                if _cached is not None:
+                    _res[_index] = _cached
+                    continue
+
+            _collection, _vertor = self._get_image_vertor(
+                images[_index], _pipeline_obj, init_collection=init_collection,
+                use_default=_use_default
+            )
+            if _collection == '':
+                # 管道未识别出集合，与search一样并发搜索候选集合
+                _collections, _res[_index] = self._search_by_vertor(
+                    _collection, _vertor, fields=_fields
+                )
+                if _cache_keys[_index] is not None:
+                    self.result_cache.set(
+                        _cache_keys[_index], _res[_index], tags=_collections, version=_version
+                    )
+                continue
+
+            _groups.setdefault(_collection, []).append((_index, _vertor.tolist()))
+
+        # 按集合批量查询
+        for _collection, _items in _groups.items():
+            _ids = self._search_vectors(_collection, [_item[1] for _item in _items])
+
+            if len(_ids) == 0:
+                # 没有找到任何匹配项
+                _images_list = [[] for _item in _items]
+            else:
+                _images_list = self._get_match_images(_collection, _ids, fields=_fields)
+
+            for _item, _images in zip(_items, _images_list):
+                _res[_item[0]] = _images
+                if _cache_keys[_item[0]] is not None:
+                    self.result_cache.set(
+                        _cache_keys[_item[0]], _images, tags=[_collection, ], version=_version
+                    )
+
+        return _res
 
     #############################
     # 搜索库处理函数
@@ -131,7 +396,8 @@ class SearchEngine(object):
             init_collection=init_collection
         )
 
-    def import_images(self, path: str, pipeline: str, encoding: str = 'utf-8'):
+    def import_images(self, path: str, pipeline: str, encoding: str = 'utf-8', bulk: bool = False,
+                      workers: int = None, batch_size: int = None):
         """
         将指定路径的图片导入搜索库
 
@@ -141,22 +407,37 @@ class SearchEngine(object):
             注：json中可以通过添加collection域指定该图片的所属分类集合名
         @param {str} pipeline - 处理管道标识
         @param {str} encoding='utf-8' - json文件的编码
+        @param {bool} bulk=False - 是否使用批量导入模式(多线程执行管道处理，批量写入Milvus和MongoDB)
+        @param {int} workers=None - 批量导入模式的管道处理线程数，不传则使用search_config的import_workers配置
+        @param {int} batch_size=None - 批量导入模式每批写入的记录数，不传则使用search_config的import_batch_size配置
+
+        @returns {dict} - 导入统计信息
+            total {int} - 处理的图片数量
+            success {int} - 导入成功数量
+            failed {int} - 导入失败数量
+            use {float} - 执行耗时(秒)
         """
-        _pipeline_obj = self._get_pipeline(pipeline)
         _file_list = FileTool.get_filelist(path, regex_str=r'^((?!\.json$).)*$', is_fullname=True)
+        if bulk:
+            return self._bulk_import_images(
+                _file_list, pipeline, encoding=encoding,
+                workers=self.search_config.get('import_workers', 4) if workers is None else workers,
+                batch_size=self.search_config.get(
+                    'import_batch_size', 2000) if batch_size is None else batch_size
+            )
+
+        _start_time = time.time()
+        _stat = {'total': 0, 'success': 0, 'failed': 0, 'use': 0.0}
+        _pipeline_obj = self._get_pipeline(pipeline)
         for _file in _file_list:
             try:
                 # 获取图片的信息字典
-                _ext = FileTool.get_file_ext(_file)
-                _json_file = _file[0: -len(_ext)] + 'json'
-                if not os.path.exists(_json_file):
-                    self.log_debug('Json file not exists, not imported: [%s]!' % _file)
+                _image_doc = self._load_image_doc(_file, encoding=encoding)
+                if _image_doc is None:
                     continue
 
-                with open(_json_file, 'r', encoding=encoding) as _fid:
-                    _image_doc = json.loads(_fid.read())
-
                 # 导入图片
+                _stat['total'] += 1
                 _collection = _image_doc.get('collection', '')
                 with open(_file, 'rb') as _fid:
                     self._image_to_search_db(
@@ -164,10 +445,15 @@ class SearchEngine(object):
                     )
 
                 # 输出日志
+                _stat['success'] += 1
                 self.log_debug('image [%s] imported success' % _file)
             except:
+                _stat['failed'] += 1
                 self.log_debug('image [%s] import error: %s' % (_file, traceback.format_exc()))
 
+        _stat['use'] = time.time() - _start_time
+        return _stat
+
     def get_images(self, field_name: str, field_values: list, collection: str = '',
                    page_size: int = 15, page_num: int = 1) -> list:
         """
@@ -225,6 +511,8 @@ class SearchEngine(object):
                     )
 
                     _get_size -= len(_temp_res)
+                    # 后续集合从头开始获取
+                    _skip = 0
 
                 # 补充所属集合信息
                 for _index in range(len(_temp_res)):
@@ -235,30 +523,143 @@ class SearchEngine(object):
         # 返回结果
         return _res
 
-    def remove_images(self, field_name: str, field_values: list, collection: str = ''):
+    def get_images_by_cursor(self, field_name: str, field_values: list, collection: str = '',
+                             page_size: int = 15, cursor: str = None):
         """
-        删除已导入的图片信息
+        通过游标分页获取图片信息
+        按集合配置顺序及集合内的_id顺序获取，每次通过_id范围查询续取，不受翻页深度影响
 
         @param {str} field_name - image_doc字典的字段名，如果不需要筛选传None
         @param {list|str} field_values - 要匹配的字段值清单,list时用in模式，str时用=模式
         @param {str} collection='' - 是否指定分类
+        @param {int} page_size=15 - 分页每页大小，必须大于0
+        @param {str} cursor=None - 上一次查询返回的游标, 为None代表获取第一页
+
+        @returns {list, str} - 返回 image_doc字典清单, 下一页游标(没有更多数据时返回None)
+
+        @throws {AttributeError} - 分页大小小于1或游标格式错误时抛出异常
         """
-        _images = self.get_images(
-            field_name, field_values, collection=collection,
-            page_size=0
-        )
-        for _image_doc in _images:
-            # 删除特征向量
-            self.milvus_db.del_vectors(
-                f"{self.app_name}_{_image_doc['collection']}", [_image_doc['ids'], ]
-            )
+        if page_size <= 0:
+            # 游标分页必须分页获取
+            raise AttributeError('page_size [%s] must be greater than 0!' % str(page_size))
 
-            # 删除mongodb
-            self.mongo_db.delete_by_id(
-                self.database, _image_doc['collection'], str(_image_doc['_id'])
+        if collection != '':
+            _collections = [collection, ]
+        else:
+            _collections = [
+                _collection.strip() for _collection in self.search_config['collections'].split(',')
+            ]
+
+        # 解析游标，定位续取的集合及开始的_id
+        _start_index = 0
+        _after_id = None
+        if cursor is not None and cursor != '':
+            _collection, _after_id = self._decode_cursor(cursor)
+            if _collection not in _collections:
+                raise AttributeError('cursor collection [%s] not match!' % _collection)
+            _start_index = _collections.index(_collection)
+
+        _res = []
+        _last = None
+        for _index in range(_start_index, len(_collections)):
+            _get_size = page_size - len(_res)
+            if _get_size <= 0:
+                break
+
+            _collection = _collections[_index]
+            _temp_res = self.mongo_db.search_after(
+                self.database, _collection, field_name, field_values,
+                _after_id, _get_size
             )
+            # 后续集合从头开始获取
+            _after_id = None
+
+            if len(_temp_res) > 0:
+                _last = (_collection, _temp_res[-1]['_id'])
+
+            # 补充所属集合信息
+            for _doc in _temp_res:
+                _doc['collection'] = _collection
+
+            _res.extend(_temp_res)
+
+        # 取满一页才有下一页游标
+        _next_cursor = None
+        if len(_res) >= page_size and _last is not None:
+            _next_cursor = self._encode_cursor(*_last)
+
+        return _res, _next_cursor
+
+    def remove_images(self, field_name: str, field_values: list, collection: str = '',
+                      batch_size: int = 1000) -> dict:
+        """
+        删除已导入的图片信息
+        按集合通过游标分批获取匹配的图片信息，每批通过一次向量删除及一次文档删除完成
 
-            self.log_debug('delete image_doc success: %s' % str(_image_doc))
+        @param {str} field_name - image_doc字典的字段名，如果不需要筛选传None
+        @param {list|str} field_values - 要匹配的字段值清单,list时用in模式，str时用=模式
+        @param {str} collection='' - 是否指定分类
+        @param {int} batch_size=1000 - 每批删除的数量，必须大于0
+
+        @returns {dict} - 删除数量统计
+            {
+                'total': 删除的图片总数,
+                'collections': {集合名: 删除的图片数, ...}
+            }
+
+        @throws {AttributeError} - 每批删除数量小于1时抛出异常
+        """
+        if batch_size <= 0:
+            raise AttributeError('batch_size [%s] must be greater than 0!' % str(batch_size))
+
+        if collection != '':
+            _collections = [collection, ]
+        else:
+            _collections = [
+                _collection.strip() for _collection in self.search_config['collections'].split(',')
+            ]
+
+        _counts = dict()
+        _total = 0
+        for _collection in _collections:
+            _deleted = 0
+            _after_id = None
+            try:
+                while True:
+                    _images = self.mongo_db.search_after(
+                        self.database, _collection, field_name, field_values,
+                        _after_id, batch_size
+                    )
+                    if len(_images) == 0:
+                        break
+
+                    _after_id = _images[-1]['_id']
+
+                    # 先删除特征向量再删除文档，中途异常时可以按相同条件重新删除
+                    self.milvus_db.del_vectors(
+                        f"{self.app_name}_{_collection}", [_doc['ids'] for _doc in _images]
+                    )
+                    _deleted += self.mongo_db.delete_by_ids(
+                        self.database, _collection, [_doc['_id'] for _doc in _images]
+                    )
+                    self.log_debug('delete [%s] image_doc batch success: %d' % (
+                        _collection, len(_images)))
+
+                    if len(_images) < batch_size:
+                        break
+            finally:
+                if _deleted > 0:
+                    # 删除中途出现异常也要让已删除部分的缓存失效
+                    self._invalidate_cache(_collection)
+
+            if _deleted > 0:
+                _counts[_collection] = _deleted
+                _total += _deleted
+
+        return {
+            'total': _total,
+            'collections': _counts
+        }
 
     def clear_search_db(self):
         """
@@ -283,10 +684,358 @@ class SearchEngine(object):
         # 重新创建集合
         self._create_collections()
 
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+        if self.rerank_cache is not None:
+            self.rerank_cache.clear()
+
     #############################
     # 内部函数
     #############################
 
+    def _search(self, image_data: bytes, pipeline: str, init_collection: str = '',
+                fields: list = None):
+        """
+        搜索指定图片的相似图片信息(不使用缓存)
+
+        @param {bytes} image_data - 影像内容二进制数据
+        @param {str} pipeline - 处理管道标识
+        @param {str} init_collection='' - 默认集合名，用于传入管道进行处理
+        @param {list} fields=None - 要返回的图片信息字段清单, None代表返回完整的图片信息
+
+        @returns {list, list} - 返回 查询的集合名清单, 相似图片文档信息
+        """
+        # 获取当前图片的特征向量
+        _collection, _vertor = self._get_image_vertor(
+            image_data, self._get_pipeline(pipeline), init_collection=init_collection,
+            use_default=(self.fanout_executor is None)
+        )
+
+        return self._search_by_vertor(_collection, _vertor, fields=fields)
+
+    def _search_by_vertor(self, collection: str, vertor, fields: list = None):
+        """
+        通过特征向量搜索相似图片信息(不使用缓存)
+
+        @param {str} collection - 管道识别的集合名, ''代表未识别出集合(并发搜索候选集合)
+        @param {numpy.ndarray} vertor - 特征向量
+        @param {list} fields=None - 要返回的图片信息字段清单, None代表返回完整的图片信息
+
+        @returns {list, list} - 返回 查询的集合名清单, 相似图片文档信息
+        """
+        if collection == '':
+            # 管道未识别出集合，并发搜索候选集合
+            _collections = self._get_fanout_collections()
+            return _collections, self._search_fanout(_collections, vertor, fields=fields)
+
+        # 查询匹配的特征向量
+        _ids = self._search_vectors(collection, [vertor.tolist(), ])
+
+        if len(_ids) == 0:
+            # 没有找到任何匹配项
+            return [collection, ], []
+
+        return [collection, ], self._get_match_images(collection, _ids, fields=fields)[0]
+
+    def _search_vectors(self, collection: str, vertors: list) -> list:
+        """
+        在集合中查询匹配的特征向量，启用重排序时按原始向量精确计算距离后重新排序
+
+        @param {str} collection - 集合名(不含app_name前缀)
+        @param {list} vertors - 查询向量清单
+
+        @returns {list} - 与查询向量顺序一致的匹配结果清单，每组匹配结果为按匹配度排序的匹配项清单，
+            匹配项包含id和distance属性
+        """
+        _topk = self.search_config['topk']
+        if self.rerank_multiple <= 1:
+            return self.milvus_db.search_vectors(
+                f'{self.app_name}_{collection}', vertors, topk=_topk,
+                nprobe=self.search_config['nprobe']
+            )
+
+        # 用较小的nprobe多取候选项
+        _query_results = self.milvus_db.search_vectors(
+            f'{self.app_name}_{collection}', vertors, topk=_topk * self.rerank_multiple,
+            nprobe=self.rerank_nprobe
+        )
+        if len(_query_results) == 0:
+            return _query_results
+
+        # 一次性获取所有候选项的原始向量
+        _stored = self._get_stored_vectors(
+            collection, list(set([_match.id for _matchs in _query_results for _match in _matchs]))
+        )
+
+        # 精确计算距离并重新排序
+        _res = []
+        for _vertor, _matchs in zip(vertors, _query_results):
+            _ids = [_match.id for _match in _matchs if _match.id in _stored]
+            if len(_ids) == 0:
+                _res.append([])
+                continue
+
+            _matrix = np.stack([_stored[_id] for _id in _ids])
+            _query = np.asarray(_vertor, dtype=_matrix.dtype)
+            if self.metric_type == 'IP':
+                _distances = _matrix.dot(_query)
+                _order = np.argsort(-_distances, kind='stable')[0:_topk]
+            else:
+                # L2与Milvus一致使用欧式距离的平方
+                _diff = _matrix - _query
+                _distances = np.einsum('ij,ij->i', _diff, _diff)
+                _order = np.argsort(_distances, kind='stable')[0:_topk]
+
+            _res.append([VectorMatch(_ids[_i], float(_distances[_i])) for _i in _order])
+
+        return _res
+
+    def _get_stored_vectors(self, collection: str, ids: list) -> dict:
+        """
+        获取已入库的原始向量(优先从缓存获取)
+
+        @param {str} collection - 集合名(不含app_name前缀)
+        @param {list} ids - 向量id清单
+
+        @returns {dict} - 向量字典, key为向量id, value为numpy.ndarray, 不存在的id不返回
+        """
+        _res = dict()
+        _miss_ids = ids
+        if self.rerank_cache is not None:
+            _miss_ids = []
+            for _id in ids:
+                _vertor = self.rerank_cache.get((collection, _id))
+                if _vertor is None:
+                    _miss_ids.append(_id)
+                else:
+                    _res[_id] = _vertor
+
+        if len(_miss_ids) > 0:
+            _vertors = self.milvus_db.get_vectors(f'{self.app_name}_{collection}', _miss_ids)
+            for _id, _vertor in zip(_miss_ids, _vertors):
+                if _vertor is None:
+                    continue
+
+                _vertor = np.asarray(_vertor, dtype=np.float32)
+                _res[_id] = _vertor
+                if self.rerank_cache is not None:
+                    self.rerank_cache.set((collection, _id), _vertor)
+
+        return _res
+
+    def _get_search_cache_key(self, image_data: bytes, pipeline: str, init_collection: str,
+                              fields: list) -> tuple:
+        """
+        获取查询结果缓存的key
+
+        @returns {tuple} - 缓存key
+        """
+        return (
+            hashlib.sha256(image_data).hexdigest(), pipeline, init_collection,
+            self.search_config['topk'], self.search_config['nprobe'],
+            self.search_config['match_score'],
+            None if fields is None else tuple(fields)
+        )
+
+    def _get_fanout_collections(self) -> list:
+        """
+        获取并发搜索的候选集合清单
+        默认集合优先，其余按collections的配置顺序，取前fanout_collections个
+
+        @returns {list} - 候选集合清单
+        """
+        _collections = [self.search_config['default_collection'], ]
+        for _collection in self.search_config['collections'].split(','):
+            _collection = _collection.strip()
+            if _collection != '' and _collection not in _collections:
+                _collections.append(_collection)
+
+        return _collections[0: self.fanout_collections]
+
+    def _search_fanout(self, collections: list, vertor, fields: list = None) -> list:
+        """
+        在多个集合中并发搜索相似图片，并按距离合并为一个topk结果
+
+        @param {list} collections - 要搜索的集合清单
+        @param {numpy.ndarray} vertor - 特征向量
+        @param {list} fields=None - 要返回的图片信息字段清单, None代表返回完整的图片信息
+
+        @returns {list} - 相似图片文档信息(已按匹配度排序)
+        """
+        _topk = self.search_config['topk']
+
+        # 并发查询各集合的匹配向量
+        _futures = [
+            self.fanout_executor.submit(
+                self._search_vectors, _collection, [vertor.tolist(), ]
+            ) for _collection in collections
+        ]
+        _match_lists = []
+        for _collection, _future in zip(collections, _futures):
+            _ids = _future.result()
+            if len(_ids) > 0:
+                _match_lists.append([(_collection, _match) for _match in _ids[0]])
+
+        # 各集合结果已按匹配度排序(L2距离升序，IP内积降序)，通过堆合并取全局的topk
+        _groups = dict()
+        for _collection, _match in itertools.islice(
+            heapq.merge(
+                *_match_lists, key=lambda _item: self._distance_order(_item[1].distance)
+            ), _topk
+        ):
+            _groups.setdefault(_collection, []).append(_match)
+
+        # 并发获取各集合的图片信息
+        _futures = [
+            self.fanout_executor.submit(
+                self._get_match_images, _collection, [_matchs, ], fields=fields
+            ) for _collection, _matchs in _groups.items()
+        ]
+
+        return list(heapq.merge(
+            *[_future.result()[0] for _future in _futures],
+            key=lambda _image: self._distance_order(_image['distance'])
+        ))
+
+    def _distance_order(self, distance: float) -> float:
+        """
+        获取按匹配度从高到低排序的排序值
+        L2距离越小越匹配，IP的距离为内积，越大越匹配
+
+        @param {float} distance - 匹配项的距离
+
+        @returns {float} - 排序值(越小越匹配)
+        """
+        return -distance if self.metric_type == 'IP' else distance
+
+    def _create_doc_storage(self, server_config: dict) -> DocStorage:
+        """
+        根据mongodb配置的type创建图片信息文档存储对象
+
+        @param {dict} server_config - 服务配置
+
+        @returns {DocStorage} - 文档存储对象
+        """
+        _mongo_para = copy.deepcopy(server_config['mongodb'])
+        _type = _mongo_para.pop('type', 'mongodb')
+        _path = _mongo_para.pop('path', '')
+        if _type == 'mongodb':
+            return MongoStorage(_mongo_para)
+        elif _type == 'local':
+            if not os.path.isabs(_path):
+                _path = os.path.join(server_config.get('execute_path', os.getcwd()), _path)
+            return LocalDocStorage(
+                {'path': _path, 'timeout': _mongo_para.get('timeout', 30)},
+                index_fields=self._get_index_fields()
+            )
+        else:
+            raise AttributeError('doc storage type [%s] not support!' % _type)
+
+    def _get_index_fields(self) -> list:
+        """
+        获取search_config配置的需建立索引的图片信息字段清单
+
+        @returns {list} - 字段清单
+        """
+        _index_fields = self._split_fields(self.search_config.get('index_fields', ''))
+        return [] if _index_fields is None else _index_fields
+
+    def _split_fields(self, fields) -> list:
+        """
+        将逗号分隔的字段配置转换为字段清单
+
+        @param {str|list} fields - 字段配置
+
+        @returns {list} - 字段清单，没有配置字段时返回None
+        """
+        if fields is None:
+            return None
+
+        if type(fields) == str:
+            fields = fields.split(',')
+
+        _fields = [_field.strip() for _field in fields if _field.strip() != '']
+        return None if len(_fields) == 0 else _fields
+
+    def _get_result_fields(self, pipeline: str, fields=None) -> list:
+        """
+        获取搜索结果要返回的图片信息字段清单
+        优先级为: 请求指定 > 管道配置 > search_config的默认配置
+
+        @param {str} pipeline - 处理管道标识
+        @param {list|str} fields=None - 请求指定的字段清单
+
+        @returns {list} - 字段清单, None代表返回完整的图片信息
+        """
+        if fields is not None:
+            return self._split_fields(fields)
+
+        if pipeline in self.pipeline_result_fields.keys():
+            return self.pipeline_result_fields[pipeline]
+
+        return self.result_fields
+
+    def _encode_cursor(self, collection: str, last_id) -> str:
+        """
+        生成分页游标
+
+        @param {str} collection - 最后一条记录所在集合
+        @param {ObjectId} last_id - 最后一条记录的_id
+
+        @returns {str} - 游标字符串(url安全的base64编码)
+        """
+        _cursor = json.dumps([collection, str(last_id)], ensure_ascii=False)
+        return base64.urlsafe_b64encode(_cursor.encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor: str):
+        """
+        解析分页游标
+
+        @param {str} cursor - 游标字符串
+
+        @returns {str, ObjectId} - 集合名, 最后一条记录的_id
+
+        @throws {AttributeError} - 游标格式错误时抛出异常
+        """
+        try:
+            _collection, _last_id = json.loads(
+                base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            )
+            return _collection, ObjectId(_last_id)
+        except Exception:
+            raise AttributeError('cursor [%s] format error!' % cursor)
+
+    def _create_vector_store(self, server_config: dict) -> VectorStore:
+        """
+        根据milvus配置的type创建特征向量存储对象
+
+        @param {dict} server_config - 服务配置
+
+        @returns {VectorStore} - 特征向量存储对象
+        """
+        _milvus_para = copy.deepcopy(server_config['milvus'])
+        _type = _milvus_para.get('type', 'milvus')
+        if _type == 'milvus':
+            return MilvusIns(_milvus_para, logger=self.logger)
+        elif _type == 'local':
+            if not os.path.isabs(_milvus_para['path']):
+                _milvus_para['path'] = os.path.join(
+                    server_config.get('execute_path', os.getcwd()), _milvus_para['path']
+                )
+            return LocalVectorStore(_milvus_para, logger=self.logger)
+        else:
+            raise AttributeError('vector store type [%s] not support!' % _type)
+
+    def _invalidate_cache(self, collection: str):
+        """
+        使指定集合相关的缓存失效
+
+        @param {str} collection - 集合名
+        """
+        if self.result_cache is not None:
+            self.result_cache.invalidate_tag(collection)
+
     def _get_pipeline(self, pipeline: str) -> Pipeline:
         """
         获取可用的管道对象
@@ -296,34 +1045,171 @@ class SearchEngine(object):
         @returns {Pipeline} - 返回管道对象
         """
         return Pipeline(
-            pipeline, self.pipeline_config[pipeline], is_asyn=False, logger=self.logger
+            pipeline, self.pipelines[pipeline], is_asyn=False, logger=self.logger,
+            run_in_caller=True
         )
 
-    def _get_image_vertor(self, image_data: bytes, pipeline_obj: Pipeline, init_collection: str = ''):
+    def _run_coroutine(self, coro):
+        """
+        在后台事件循环中执行协程并等待结果
+        事件循环在首次使用时启动(多进程服务在fork后各自启动)，所有请求共享同一个事件循环线程
+
+        @param {coroutine} coro - 要执行的协程对象
+
+        @returns {object} - 协程的返回结果
+        """
+        with self._async_loop_lock:
+            if self._async_loop is None:
+                self._async_loop = asyncio.new_event_loop()
+                _loop_thread = threading.Thread(
+                    target=self._async_loop.run_forever, name='Thread-SearchEngine-AsyncLoop'
+                )
+                _loop_thread.setDaemon(True)
+                _loop_thread.start()
+
+        return asyncio.run_coroutine_threadsafe(coro, self._async_loop).result()
+
+    def _get_image_vertor(self, image_data: bytes, pipeline_obj: Pipeline, init_collection: str = '',
+                          use_default: bool = True):
         """
         获取影像的特征向量
 
         @param {bytes} image_data - 影像内容二进制数据
         @param {Pipeline} pipeline_obj - 可用管道对象
         @param {str} init_collection='' - 指定默认的分类
+        @param {bool} use_default=True - 管道未识别出分类时是否返回默认分类，为False时返回''
 
         @returns {str, numpy.ndarray} - 匹配到的影像分类, 特征向量
         """
-        _input = {
-            'image': image_data,
-            'collection': init_collection
-        }
-
-        _status, _output = pipeline_obj.start(
-            _input, {}
+        _cache_key, _cached = self._get_cached_vertor(
+            image_data, pipeline_obj.name, init_collection, use_default=use_default
         )
+        if _cached is not None:
+            # 已缓存的图片直接返回，无需执行管道处理
+            return _cached
+
+        if self.worker_pool is not None:
+            # 由工作进程执行管道处理
+            _status, _output = self.worker_pool.run_pipeline(
+                pipeline_obj.name, image_data, init_collection
+            )
+        else:
+            _input = {
+                'image': image_data,
+                'collection': init_collection
+            }
 
-        if _status != 'success':
-            raise RuntimeError('Pipeline run error: status [%s]!' % _status)
+            _status, _output = pipeline_obj.start(
+                _input, {}
+            )
 
-        _collection = self.search_config['default_collection'] if _output['collection'] == '' else _output['collection']
+        return self._deal_pipeline_output(_status, _output, _cache_key, use_default=use_default)
 
-        return _collection, _output['vertor']
+    def _get_cached_vertor(self, image_data: bytes, pipeline: str, init_collection: str = '',
+                           use_default: bool = True):
+        """
+        从特征向量缓存获取影像的特征向量
+
+        @param {bytes} image_data - 影像内容二进制数据
+        @param {str} pipeline - 处理管道标识
+        @param {str} init_collection='' - 指定默认的分类
+        @param {bool} use_default=True - 未识别出分类时是否返回默认分类
+
+        @returns {bytes, tuple} - 返回 缓存key(未启用缓存为None), (影像分类, 特征向量)(未命中为None)
+        """
+        if self.vector_cache is None:
+            return None, None
+
+        _cache_key = self.vector_cache.make_key(image_data, pipeline, init_collection)
+        _cached = self.vector_cache.get(_cache_key)
+        if _cached is not None and _cached[0] == '' and use_default:
+            _cached = (self.search_config['default_collection'], _cached[1])
+
+        return _cache_key, _cached
+
+    def _deal_pipeline_output(self, status: str, output: dict, cache_key: bytes = None,
+                              use_default: bool = True):
+        """
+        处理管道的执行结果，获取影像分类及特征向量
+
+        @param {str} status - 管道执行状态
+        @param {dict} output - 管道输出结果
+        @param {bytes} cache_key=None - 特征向量缓存key，为None代表不缓存
+        @param {bool} use_default=True - 未识别出分类时是否返回默认分类
+
+        @returns {str, numpy.ndarray} - 匹配到的影像分类, 特征向量
+
+        @throws {RuntimeError} - 管道执行失败时抛出异常
+        """
+        if status != 'success':
+            raise RuntimeError('Pipeline run error: status [%s]!' % status)
+
+        # 缓存管道的原始识别结果，未识别出分类时缓存''
+        _collection = output['collection']
+        if cache_key is not None:
+            self.vector_cache.set(cache_key, _collection, output['vertor'])
+
+        if _collection == '' and use_default:
+            _collection = self.search_config['default_collection']
+
+        return _collection, output['vertor']
+
+    def _get_match_images(self, collection: str, query_results, fields: list = None) -> list:
+        """
+        根据Milvus的查询结果获取匹配的图片信息
+
+        @param {str} collection - 查询的集合名
+        @param {list} query_results - Milvus的查询结果，每个查询向量对应一组匹配结果
+        @param {list} fields=None - 要返回的图片信息字段清单, None代表返回完整的图片信息
+
+        @returns {list} - 与查询向量顺序一致的相似图片文档信息清单(已按匹配度排序)
+        """
+        # 选取匹配项
+        _match_list = []
+        _all_ids = set()
+        for _query_result in query_results:
+            _ids_dict = {}
+            for _match in _query_result:
+                _score = 1.0 / (1.0 + _match.distance)
+                if _score >= self.search_config['match_score']:
+                    _ids_dict[_match.id] = {
+                        'score': _score,
+                        'distance': _match.distance
+                    }
+            _match_list.append(_ids_dict)
+            _all_ids.update(_ids_dict.keys())
+
+        if len(_all_ids) == 0:
+            return [[] for _i in range(len(_match_list))]
+
+        # 一次性查询所有图片信息
+        _docs = dict()
+        for _doc in self.mongo_db.iter_by_vector_id(
+            self.database, collection, list(_all_ids), fields=fields
+        ):
+            # 删除_id这个非json对象
+            _doc.pop('_id', None)
+            _docs[_doc['ids']] = _doc
+
+        # 补充距离信息
+        _res = []
+        for _ids_dict in _match_list:
+            _images = []
+            for _id, _match in _ids_dict.items():
+                if _id not in _docs:
+                    continue
+
+                _image = copy.copy(_docs[_id])
+                _image['score'] = _match['score']
+                _image['distance'] = _match['distance']
+                _image['collection'] = collection
+                _images.append(_image)
+
+            # 进行排序
+            _images.sort(key=lambda x: self._distance_order(x['distance']))
+            _res.append(_images)
+
+        return _res
 
     def _image_to_search_db(self, image_data: bytes, image_doc: dict, pipeline_obj: Pipeline, init_collection: str = ''):
         """
@@ -348,7 +1234,151 @@ class SearchEngine(object):
 
         # 将影像信息存入MongoDB
         image_doc['ids'] = _vids[0]
-        return self.mongo_db.insert_document(self.database, _collection, image_doc), _collection
+        _id = self.mongo_db.insert_document(self.database, _collection, image_doc)
+        self._invalidate_cache(_collection)
+        return _id, _collection
+
+    def _load_image_doc(self, file: str, encoding: str = 'utf-8'):
+        """
+        获取图片文件对应的信息字典
+
+        @param {str} file - 图片文件路径
+        @param {str} encoding='utf-8' - json文件的编码
+
+        @returns {dict} - 图片信息字典，json文件不存在时返回None
+        """
+        _ext = FileTool.get_file_ext(file)
+        _json_file = file[0: -len(_ext)] + 'json'
+        if not os.path.exists(_json_file):
+            self.log_debug('Json file not exists, not imported: [%s]!' % file)
+            return None
+
+        with open(_json_file, 'r', encoding=encoding) as _fid:
+            return json.loads(_fid.read())
+
+    def _bulk_import_images(self, file_list: list, pipeline: str, encoding: str = 'utf-8',
+                            workers: int = 4, batch_size: int = 2000) -> dict:
+        """
+        批量导入图片
+        管道处理通过线程池并行执行，特征向量及信息字典按集合缓存，达到批量大小后一次性写入
+
+        @param {list} file_list - 要导入的图片文件清单
+        @param {str} pipeline - 处理管道标识
+        @param {str} encoding='utf-8' - json文件的编码
+        @param {int} workers=4 - 管道处理线程数
+        @param {int} batch_size=2000 - 每批写入的记录数
+
+        @returns {dict} - 导入统计信息，格式与import_images的返回值一致
+        """
+        _start_time = time.time()
+        _stat = {'total': 0, 'success': 0, 'failed': 0, 'use': 0.0}
+        _progress_interval = self.search_config.get('import_progress_interval', 1000)
+        _workers = max(1, workers)
+        _batch_size = max(1, batch_size)
+        _local = threading.local()  # 每个线程使用独立的管道对象
+        _buffers = dict()  # 待写入的数据缓存, key为集合名，value为(file, vertor, image_doc)清单
+
+        def _get_vertor(file: str):
+            # 在线程池中执行的管道处理函数
+            _image_doc = self._load_image_doc(file, encoding=encoding)
+            if _image_doc is None:
+                return None
+
+            _pipeline_obj = getattr(_local, 'pipeline_obj', None)
+            if _pipeline_obj is None:
+                _pipeline_obj = self._get_pipeline(pipeline)
+                _local.pipeline_obj = _pipeline_obj
+
+            with open(file, 'rb') as _fid:
+                _collection, _vertor = self._get_image_vertor(
+                    _fid.read(), _pipeline_obj, init_collection=_image_doc.get('collection', '')
+                )
+
+            return _collection, _vertor.tolist(), _image_doc
+
+        def _flush(collection: str):
+            # 将集合的缓存数据一次性写入
+            _items = _buffers.pop(collection, [])
+            if len(_items) == 0:
+                return
+
+            _vids = None
+            try:
+                _vids = self.milvus_db.insert_vectors(
+                    f'{self.app_name}_{collection}', [_item[1] for _item in _items]
+                )
+                _docs = []
+                for _i in range(len(_items)):
+                    _items[_i][2]['ids'] = _vids[_i]
+                    _docs.append(_items[_i][2])
+
+                self.mongo_db.insert_documents(self.database, collection, _docs)
+                _stat['success'] += len(_items)
+                self._invalidate_cache(collection)
+            except:
+                self.log_error('bulk import [%s] %d images error: %s' % (
+                    collection, len(_items), traceback.format_exc()
+                ))
+                if _vids is not None:
+                    # 图片信息写入失败，删除已写入的向量，避免产生没有图片信息的向量
+                    try:
+                        self.milvus_db.del_vectors(f'{self.app_name}_{collection}', _vids)
+                    except:
+                        self.log_error('bulk import [%s] delete %d orphan vectors error: %s' % (
+                            collection, len(_vids), traceback.format_exc()
+                        ))
+                _stat['failed'] += len(_items)
+
+        def _done(future, file: str):
+            # 处理管道执行结果
+            try:
+                _ret = future.result()
+                if _ret is None:
+                    # 没有信息字典，不导入
+                    return
+
+                _stat['total'] += 1
+                _buffers.setdefault(_ret[0], []).append((file, _ret[1], _ret[2]))
+                if len(_buffers[_ret[0]]) >= _batch_size:
+                    _flush(_ret[0])
+            except:
+                _stat['total'] += 1
+                _stat['failed'] += 1
+                self.log_debug('image [%s] import error: %s' % (file, traceback.format_exc()))
+
+            if _progress_interval > 0 and _stat['total'] % _progress_interval == 0:
+                _use = time.time() - _start_time
+                self.log_info('bulk import progress: %d/%d, success %d, failed %d, %.2f images/s' % (
+                    _stat['total'], len(file_list), _stat['success'], _stat['failed'],
+                    _stat['total'] / _use if _use > 0 else 0.0
+                ))
+
+        # 限制同时提交的任务数量，避免大目录时占用过多内存
+        _max_pending = _workers * 4
+        with concurrent.futures.ThreadPoolExecutor(max_workers=_workers) as _executor:
+            _pending = dict()
+            for _file in file_list:
+                _pending[_executor.submit(_get_vertor, _file)] = _file
+                if len(_pending) >= _max_pending:
+                    _finished, _ = concurrent.futures.wait(
+                        _pending.keys(), return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for _future in _finished:
+                        _done(_future, _pending.pop(_future))
+
+            for _future in concurrent.futures.as_completed(list(_pending.keys())):
+                _done(_future, _pending.pop(_future))
+
+        # 写入剩余的缓存数据
+        for _collection in list(_buffers.keys()):
+            _flush(_collection)
+
+        _stat['use'] = time.time() - _start_time
+        self.log_info('bulk import finished: total %d, success %d, failed %d, use %.2fs, %.2f images/s' % (
+            _stat['total'], _stat['success'], _stat['failed'], _stat['use'],
+            _stat['total'] / _stat['use'] if _stat['use'] > 0 else 0.0
+        ))
+        return _stat
 
     def _create_collections(self):
         """
@@ -367,6 +1397,32 @@ class SearchEngine(object):
         self.milvus_db.add_collections(_milvus_collections)
         self.mongo_db.new_collections(self.database, _mongo_collections)
 
+        # 创建向量id及配置的查询字段索引，并检查索引是否完整
+        _index_fields = ['ids', ] + self._get_index_fields()
+        for _collection in _mongo_collections:
+            self.mongo_db.create_indexes(self.database, _collection, _index_fields)
+
+        self.check_indexes()
+
+    def check_indexes(self) -> dict:
+        """
+        检查图片信息集合是否缺失向量id及配置的查询字段索引，缺失时输出错误日志
+
+        @returns {dict} - 缺失索引的集合及字段, key为集合名, value为缺失索引的字段清单
+        """
+        _index_fields = ['ids', ] + self._get_index_fields()
+        _missing = dict()
+        for _collection in self.search_config['collections'].split(','):
+            _collection = _collection.strip()
+            _fields = self.mongo_db.get_missing_indexes(self.database, _collection, _index_fields)
+            if len(_fields) > 0:
+                _missing[_collection] = _fields
+                self.log_error('collection [%s] missing indexes on fields: %s' % (
+                    _collection, str(_fields)
+                ))
+
+        return _missing
+
     #############################
     # 日志输出相关函数
     #############################
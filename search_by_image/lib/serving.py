@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# Copyright 2019 黎慧剑
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+生产服务运行支持
+@module serving
+@file serving.py
+"""
+
+import os
+import sys
+import threading
+import warnings
+from flask import Flask, request, jsonify, g
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+
+__MOUDLE__ = 'serving'  # 模块名
+__DESCRIPT__ = u'生产服务运行支持'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = u'黎慧剑'  # 作者
+__PUBLISH__ = '2020.09.20'  # 发布日期
+
+
+class ConcurrencyLimiter(object):
+    """
+    请求并发限制器
+    同时处理的请求数达到上限时，新请求进入等待队列；等待队列已满或等待超时的请求直接拒绝
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 64, queue_timeout: float = 5.0,
+                 retry_after: int = 1):
+        """
+        构造函数
+
+        @param {int} max_concurrency=16 - 最大同时处理的请求数
+        @param {int} max_queue=64 - 最大等待处理的请求数
+        @param {float} queue_timeout=5.0 - 请求最长等待时间，单位为秒
+        @param {int} retry_after=1 - 拒绝请求时建议客户端重试的间隔，单位为秒
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._rejected = 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        获取限制器的统计信息
+        @property {dict} - {'active': 处理中的请求数, 'waiting': 等待中的请求数, 'rejected': 累计拒绝数}
+        """
+        with self._lock:
+            return {
+                'active': self._active,
+                'waiting': self._waiting,
+                'rejected': self._rejected
+            }
+
+    def acquire(self) -> bool:
+        """
+        获取请求处理许可
+
+        @returns {bool} - 是否获取成功，返回False代表应拒绝请求
+        """
+        _acquired = self._semaphore.acquire(blocking=False)
+        if not _acquired:
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    self._rejected += 1
+                    return False
+                self._waiting += 1
+
+            try:
+                _acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+
+        with self._lock:
+            if _acquired:
+                self._active += 1
+            else:
+                self._rejected += 1
+
+        return _acquired
+
+    def release(self):
+        """
+        释放请求处理许可
+        """
+        with self._lock:
+            self._active -= 1
+        self._semaphore.release()
+
+
+class ServingTool(object):
+    """
+    生产服务工具类，提供请求并发限制及预派生(pre-fork)多进程服务启动功能
+    """
+
+    @classmethod
+    def install_limiter(cls, app: Flask, limiter: ConcurrencyLimiter, path_prefix: str = '/api/'):
+        """
+        为Flask应用安装请求并发限制，被拒绝的请求返回429状态及Retry-After头
+
+        @param {Flask} app - Flask应用
+        @param {ConcurrencyLimiter} limiter - 并发限制器
+        @param {str} path_prefix='/api/' - 需要限制的请求路径前缀
+        """
+        def _before_request():
+            if not request.path.startswith(path_prefix):
+                return None
+
+            if not limiter.acquire():
+                _resp = jsonify({
+                    'interface_seq_id': '',
+                    'status': '20002',
+                    'msg': '服务繁忙，请稍后重试'
+                })
+                _resp.status_code = 429
+                _resp.headers['Retry-After'] = str(limiter.retry_after)
+                return _resp
+
+            g.limiter_acquired = True
+            return None
+
+        def _teardown_request(exc):
+            # 请求处理出现异常也会执行
+            if g.pop('limiter_acquired', False):
+                limiter.release()
+
+        app.before_request(_before_request)
+        app.teardown_request(_teardown_request)
+
+    @classmethod
+    def run_gunicorn(cls, app_factory, server_config: dict):
+        """
+        以gunicorn预派生多进程模式启动服务
+        各工作进程启动后才调用app_factory装载服务，模型在每个工作进程中只加载一次
+
+        @param {function} app_factory - 创建Flask应用的函数, fun() -> Flask
+        @param {dict} server_config - 服务配置, 使用flask的host/port配置及gunicorn配置
+            gunicorn : gunicorn运行参数，支持gunicorn的所有配置项，常用参数如下
+                workers : int, 工作进程数，默认2
+                worker_class : 工作进程类型，默认gthread
+                threads : int, 每个工作进程的线程数，默认4
+                timeout : int, 工作进程处理超时时间，单位为秒，默认120
+
+        @throws {RuntimeError} - 没有安装gunicorn或配置不适用于多进程运行时抛出异常
+        """
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise RuntimeError('server_mode [gunicorn] need gunicorn, please install it first!')
+
+        _options = {
+            'bind': '%s:%d' % (
+                server_config['flask'].get('host', '0.0.0.0'),
+                server_config['flask'].get('port', 5000)
+            ),
+            'workers': 2,
+            'worker_class': 'gthread',
+            'threads': 4,
+            'timeout': 120,
+            'preload_app': False
+        }
+        _options.update(server_config.get('gunicorn', None) or {})
+        cls.check_gunicorn_config(server_config, _options)
+
+        class GunicornApplication(BaseApplication):
+            """
+            gunicorn应用
+            """
+
+            def load_config(self):
+                for _key, _value in _options.items():
+                    if _key in self.cfg.settings and _value is not None:
+                        self.cfg.set(_key.lower(), _value)
+
+            def load(self):
+                return app_factory()
+
+        GunicornApplication().run()
+
+    @classmethod
+    def check_gunicorn_config(cls, server_config: dict, options: dict):
+        """
+        检查服务配置是否适用于gunicorn模式运行
+
+        @param {dict} server_config - 服务配置
+        @param {dict} options - gunicorn运行参数
+
+        @throws {RuntimeError} - 配置不适用时抛出异常
+        """
+        # 请求并发限制: 每个工作进程同时进入Flask的请求数不超过线程数，超出部分在gunicorn的连接队列中等待，
+        # 必须保留空闲线程才能返回429，否则限制器永远不会生效
+        _limiter_config = server_config.get('limiter', None) or {}
+        if _limiter_config.get('enable', False):
+            _worker_class = options.get('worker_class', 'sync')
+            _threads = None
+            if _worker_class == 'gthread':
+                _threads = options.get('threads', 1)
+            elif _worker_class == 'sync':
+                _threads = 1
+
+            _limit = _limiter_config.get('max_concurrency', 16) + _limiter_config.get('max_queue', 64)
+            if _threads is not None and _limit >= _threads:
+                raise RuntimeError(
+                    'limiter max_concurrency + max_queue [%d] must be less than gunicorn threads [%d]!' % (
+                        _limit, _threads)
+                )
+
+        if options.get('workers', 1) <= 1:
+            return
+
+        # 多个工作进程的情况
+        if server_config['milvus'].get('type', 'milvus') == 'local':
+            raise RuntimeError(
+                'milvus type [local] can only be opened by one process, gunicorn workers must be 1!'
+            )
+
+        _result_cache = server_config.get('result_cache', None) or {}
+        if _result_cache.get('enable', False):
+            warnings.warn(
+                'result_cache is per process, imports in one gunicorn worker will not invalidate '
+                'the cache of other workers!', RuntimeWarning
+            )
+
+        _vector_cache = server_config.get('vector_cache', None) or {}
+        if _vector_cache.get('enable', False) and _vector_cache.get('type', 'memory') == 'memory':
+            warnings.warn(
+                'vector_cache type [memory] is per process, use type [mmap] to share it between '
+                'gunicorn workers!', RuntimeWarning
+            )
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -15,8 +15,14 @@
 import os
 import sys
 import copy
+import time
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+import grpc
 import milvus as mv
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
 from gridfs import GridFS
 from bson import ObjectId
 # 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
@@ -31,7 +37,236 @@ __AUTHOR__ = u'黎慧剑'  # 作者
 __PUBLISH__ = '2020.08.26'  # 发布日期
 
 
-class MongoStorage(object):
+class DocStorage(object):
+    """
+    图片信息文档存储的接口类，具体存储实现需继承该类并实现相应函数
+    注：查询返回的文档需包含_id(bson.ObjectId)及ids(向量id)字段
+    """
+
+    def list_collection(self, database: str):
+        """
+        获取集合（表）清单
+
+        @param {str} database - 数据库名
+
+        @returns {list} - 清单名
+        """
+        raise NotImplementedError()
+
+    def new_collections(self, database: str, collections: list):
+        """
+        新增集合(table)
+
+        @param {str} database - 数据库名
+        @param {list} collections - 集合名列表(str)
+        """
+        raise NotImplementedError()
+
+    def delete_collections(self, database: str, collections: list):
+        """
+        删除集合(table)
+
+        @param {str} database - 数据库名
+        @param {list} collections - 集合名列表(str)
+        """
+        raise NotImplementedError()
+
+    def collection_exists(self, database: str, collection: str) -> bool:
+        """
+        判断集合是否存在
+
+        @param {str} database - 数据库名
+        @param {str} collection - 要判断的集合
+
+        @returns {bool} - 是否存在
+        """
+        raise NotImplementedError()
+
+    def create_indexes(self, database: str, collection: str, fields: list):
+        """
+        为集合的字段创建索引(已存在则不处理)
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} fields - 要创建索引的字段清单
+        """
+        raise NotImplementedError()
+
+    def get_missing_indexes(self, database: str, collection: str, fields: list) -> list:
+        """
+        检查集合缺失索引的字段
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} fields - 应建立索引的字段清单
+
+        @returns {list} - 没有索引的字段清单
+        """
+        raise NotImplementedError()
+
+    def insert_document(self, database: str, collection: str, doc: dict) -> str:
+        """
+        插入文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {dict} doc - 要插入文档记录
+
+        @returns {str} - 记录ID
+        """
+        raise NotImplementedError()
+
+    def insert_documents(self, database: str, collection: str, docs: list) -> list:
+        """
+        批量插入文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} docs - 要插入文档记录清单
+
+        @returns {list} - 与docs顺序一致的记录ID清单
+        """
+        raise NotImplementedError()
+
+    def search_by_id(self, database: str, collection: str, obj_id: str):
+        """
+        通过id获取文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} obj_id - 文档id
+        """
+        raise NotImplementedError()
+
+    def delete_by_id(self, database: str, collection: str, obj_id: str):
+        """
+        通过id删除文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} obj_id - 文档id
+        """
+        raise NotImplementedError()
+
+    def delete_by_ids(self, database: str, collection: str, obj_ids: list) -> int:
+        """
+        通过id清单批量删除文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} obj_ids - 文档id清单
+
+        @returns {int} - 删除的记录数
+        """
+        raise NotImplementedError()
+
+    def search_by_vector_id(self, database: str, collection: str, ids: list,
+                            fields: list = None) -> list:
+        """
+        通过向量id清单获取文档清单
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} ids - milvus_id清单
+        @param {list} fields=None - 要返回的字段清单(支持'a.b'形式的多级字段)
+            为None代表返回完整文档，指定时固定返回ids字段，除非指定否则不返回_id字段
+
+        @returns {list} - 获取到的文档清单
+        """
+        raise NotImplementedError()
+
+    def iter_by_vector_id(self, database: str, collection: str, ids: list, fields: list = None):
+        """
+        通过向量id清单逐条获取文档(迭代器)
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} ids - milvus_id清单
+        @param {list} fields=None - 要返回的字段清单(支持'a.b'形式的多级字段)
+            为None代表返回完整文档，指定时固定返回ids字段，除非指定否则不返回_id字段
+
+        @returns {iterator} - 文档迭代器
+        """
+        raise NotImplementedError()
+
+    def search_by_field(self, database: str, collection: str, field_name: str, field_values: list,
+                        page_size: int = 0, page_num: int = 1) -> list:
+        """
+        根据指定域值查找数据
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        @param {int} page_size=15 - 分页每页大小, 如果不分页，传0
+        @param {int} page_num=1 - 第几页，从1开始
+
+        @returns {list} - 获取到的文档清单
+        """
+        raise NotImplementedError()
+
+    def delete_by_field(self, database: str, collection: str, field_name: str, field_values: list):
+        """
+        通过域值删除数据
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        """
+        raise NotImplementedError()
+
+    def count_by_field(self, database: str, collection: str, field_name: str, field_values: list):
+        """
+        查询记录数量
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+
+        @returns {int} - 返回记录数
+        """
+        raise NotImplementedError()
+
+    def search_with_skip(self, database: str, collection: str, field_name: str, field_values: list,
+                         skip: int, size: int):
+        """
+        获取指定条件记录，并指定跳过数量和获取记录大小
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        @param {int} skip - 要跳过的数量
+        @param {int} size - 要获取的大小
+        @returns {list} - 获取到的文档清单
+        """
+        raise NotImplementedError()
+
+    def search_after(self, database: str, collection: str, field_name: str, field_values: list,
+                     after_id, size: int):
+        """
+        按_id顺序获取指定条件记录中_id大于after_id的记录(游标分页使用)
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        @param {ObjectId} after_id - 上一页最后一条记录的_id, 为None代表从头开始获取
+        @param {int} size - 要获取的大小
+        @returns {list} - 获取到的文档清单
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        关闭存储对象
+        """
+        pass
+
+
+class MongoStorage(DocStorage):
     """
     MongoDB的存储驱动
     """
@@ -100,6 +335,39 @@ class MongoStorage(object):
             return True
         return False
 
+    def create_indexes(self, database: str, collection: str, fields: list):
+        """
+        为集合的字段创建索引(已存在则不处理)
+        注：创建字段与_id的组合索引，按字段查询并按_id排序的游标分页(search_after)可直接通过索引获取
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} fields - 要创建索引的字段清单
+        """
+        for _field in self.get_missing_indexes(database, collection, fields):
+            self.db[database][collection].create_index(
+                [(_field, ASCENDING), ('_id', ASCENDING)], background=True
+            )
+
+    def get_missing_indexes(self, database: str, collection: str, fields: list) -> list:
+        """
+        检查集合缺失索引的字段
+        注：以字段、_id为前两个键的组合索引才视为可用索引，_id字段固定有索引
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} fields - 应建立索引的字段清单
+
+        @returns {list} - 没有索引的字段清单
+        """
+        _indexed = set(['_id', ])
+        for _info in self.db[database][collection].index_information().values():
+            _keys = [_key[0] for _key in _info['key']]
+            if len(_keys) > 1 and _keys[1] == '_id':
+                _indexed.add(_keys[0])
+
+        return [_field for _field in fields if _field not in _indexed]
+
     def insert_file(self, database: str, collection: str, filename: str, file_data: bytes) -> str:
         """
         保存文件
@@ -178,6 +446,18 @@ class MongoStorage(object):
         """
         return self.db[database][collection].insert_one(doc).inserted_id
 
+    def insert_documents(self, database: str, collection: str, docs: list) -> list:
+        """
+        批量插入文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} docs - 要插入文档记录清单
+
+        @returns {list} - 与docs顺序一致的记录ID清单
+        """
+        return self.db[database][collection].insert_many(docs, ordered=False).inserted_ids
+
     def search_by_id(self, database: str, collection: str, obj_id: str):
         """
         通过id获取文档
@@ -198,18 +478,54 @@ class MongoStorage(object):
         """
         return self.db[database][collection].delete_many({"_id": ObjectId(obj_id)})
 
-    def search_by_vector_id(self, database: str, collection: str, ids: list) -> list:
+    def delete_by_ids(self, database: str, collection: str, obj_ids: list) -> int:
+        """
+        通过id清单批量删除文档
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} obj_ids - 文档id清单
+
+        @returns {int} - 删除的记录数
+        """
+        return self.db[database][collection].delete_many(
+            {"_id": {"$in": [ObjectId(_id) for _id in obj_ids]}}
+        ).deleted_count
+
+    def search_by_vector_id(self, database: str, collection: str, ids: list,
+                            fields: list = None) -> list:
         """
         通过向量id清单获取文档清单
 
         @param {str} database - 数据库名
         @param {str} collection - 集合名（table）
         @param {list} ids - milvus_id清单
+        @param {list} fields=None - 要返回的字段清单(支持'a.b'形式的多级字段)
+            为None代表返回完整文档，指定时固定返回ids字段，除非指定否则不返回_id字段
 
         @returns {list} - 获取到的文档清单
         """
-        _res = self.db[database][collection].find({"ids": {"$in": ids}})
-        return list(_res)
+        return list(self.iter_by_vector_id(database, collection, ids, fields=fields))
+
+    def iter_by_vector_id(self, database: str, collection: str, ids: list, fields: list = None):
+        """
+        通过向量id清单逐条获取文档(迭代器)
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {list} ids - milvus_id清单
+        @param {list} fields=None - 要返回的字段清单(支持'a.b'形式的多级字段)
+            为None代表返回完整文档，指定时固定返回ids字段，除非指定否则不返回_id字段
+
+        @returns {iterator} - 文档迭代器
+        """
+        _projection = None
+        if fields is not None:
+            _projection = {'_id': False, 'ids': True}
+            for _field in fields:
+                _projection[_field] = True
+
+        return self.db[database][collection].find({"ids": {"$in": ids}}, projection=_projection)
 
     def search_by_field(self, database: str, collection: str, field_name: str, field_values: list,
                         page_size: int = 0, page_num: int = 1) -> list:
@@ -297,12 +613,333 @@ class MongoStorage(object):
 
         return list(_res)
 
+    def search_after(self, database: str, collection: str, field_name: str, field_values: list,
+                     after_id, size: int):
+        """
+        按_id顺序获取指定条件记录中_id大于after_id的记录(游标分页使用)
+
+        @param {str} database - 数据库名
+        @param {str} collection - 集合名（table）
+        @param {str} field_name - 域名，如果为None则代表不加条件查询
+        @param {list|str} field_values - 要查找的域值，如果是list则用in模式, 如果为字符则为=模式
+        @param {ObjectId} after_id - 上一页最后一条记录的_id, 为None代表从头开始获取
+        @param {int} size - 要获取的大小
+        @returns {list} - 获取到的文档清单
+        """
+        _filter = dict()
+        if field_name is not None:
+            _filter[field_name] = field_values if type(field_values) == str else {
+                "$in": field_values}
+        if after_id is not None:
+            _filter['_id'] = {'$gt': after_id}
+
+        _res = self.db[database][collection].find(
+            filter=_filter).sort('_id', ASCENDING).limit(size)
+
+        return list(_res)
+
+
+class MilvusConnectionPool(object):
+    """
+    Milvus的连接池
+    连接对象长期持有并在线程间复用，取出时按间隔进行健康检查，出现异常的连接直接丢弃并在下次获取时重建
+    """
+
+    def __init__(self, milvus_para: dict, logger=None):
+        """
+        构造函数
+
+        @param {dict} milvus_para - Milvus服务连接参数，server.xml的milvus配置
+            host {str} - Milvus服务器地址
+            port {int} - Milvus服务器端口
+            pool {str} - 每个连接对象内部使用的pymilvus连接模式，默认Singleton
+            pool_size {int} - 连接池最大连接数，默认10
+            pool_timeout {float} - 获取连接的超时时间，单位为秒，默认30
+            health_check_interval {float} - 连接空闲超过该时间(秒)后，取出时先进行健康检查，默认60
+        @param {bool} logger=None - 日志对象
+        """
+        self.logger = logger
+        self.milvus_para = milvus_para
+        self.pool_size = max(1, self.milvus_para.get('pool_size', 10))
+        self.pool_timeout = self.milvus_para.get('pool_timeout', 30)
+        self.health_check_interval = self.milvus_para.get('health_check_interval', 60)
+
+        self._idle = deque()  # 空闲连接, (Milvus, 最后使用时间)
+        self._created = 0  # 已创建的连接数
+        self._cond = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        """
+        获取当前已创建的连接数
+        @property {int}
+        """
+        return self._created
+
+    def acquire(self) -> mv.Milvus:
+        """
+        从连接池获取连接
+
+        @returns {Milvus} - 可用的Milvus连接对象
+
+        @throws {RuntimeError} - 超时获取不到连接时抛出异常
+        """
+        _deadline = time.time() + self.pool_timeout
+        _client = None
+        _last_used = 0
+        with self._cond:
+            while True:
+                if len(self._idle) > 0:
+                    # 优先使用最近使用过的连接
+                    _client, _last_used = self._idle.pop()
+                    break
+
+                if self._created < self.pool_size:
+                    # 占用一个新建连接的名额
+                    self._created += 1
+                    break
+
+                _remain = _deadline - time.time()
+                if _remain <= 0:
+                    raise RuntimeError('get milvus connection from pool timeout!')
+
+                self._cond.wait(_remain)
+
+        try:
+            if _client is not None and time.time() - _last_used >= self.health_check_interval:
+                if not self._is_healthy(_client):
+                    self._log_info('milvus connection health check failed, reconnect')
+                    self._close_client(_client)
+                    _client = None
+
+            if _client is None:
+                _client = self._new_client()
+
+            return _client
+        except:
+            # 创建连接失败，释放名额
+            self.release(None, broken=True)
+            raise
+
+    def release(self, client: mv.Milvus, broken: bool = False):
+        """
+        将连接放回连接池
+
+        @param {Milvus} client - 要放回的连接对象
+        @param {bool} broken=False - 连接是否已损坏，损坏的连接将被关闭且不放回连接池
+        """
+        with self._cond:
+            if broken:
+                self._created -= 1
+            else:
+                self._idle.append((client, time.time()))
+
+            self._cond.notify()
+
+        if broken and client is not None:
+            self._close_client(client)
+
+    @contextmanager
+    def connection(self):
+        """
+        获取连接的上下文管理，执行出现异常时丢弃该连接
+
+        @example
+            with pool.connection() as _milvus:
+                _milvus.list_collections()
+        """
+        _client = self.acquire()
+        try:
+            yield _client
+        except:
+            self.release(_client, broken=True)
+            raise
+        else:
+            self.release(_client)
+
+    def close(self):
+        """
+        关闭连接池的所有空闲连接
+        """
+        with self._cond:
+            _idle = list(self._idle)
+            self._idle.clear()
+            self._created -= len(_idle)
+            self._cond.notify_all()
+
+        for _client, _last_used in _idle:
+            self._close_client(_client)
+
+    #############################
+    # 内部函数
+    #############################
+    def _new_client(self) -> mv.Milvus:
+        """
+        创建新的Milvus连接对象
+        """
+        return mv.Milvus(
+            host=self.milvus_para['host'], port=self.milvus_para['port'],
+            pool=self.milvus_para.get('pool', 'Singleton')
+        )
+
+    def _is_healthy(self, client: mv.Milvus) -> bool:
+        """
+        检查连接是否可用
+        """
+        try:
+            _status, _ = client.server_status(timeout=5)
+            return _status.code == 0
+        except:
+            return False
+
+    def _close_client(self, client: mv.Milvus):
+        """
+        关闭连接对象
+        """
+        try:
+            client.close()
+        except:
+            self._log_debug('close milvus connection error: %s' % traceback.format_exc())
+
+    def _log_info(self, msg: str, *args, **kwargs):
+        """
+        输出info日志
+
+        @param {str} msg - 要输出的日志
+        """
+        if self.logger:
+            if 'extra' not in kwargs:
+                kwargs['extra'] = {'callFunLevel': 2}
+
+            self.logger.info(msg, *args, **kwargs)
+
+    def _log_debug(self, msg: str, *args, **kwargs):
+        """
+        输出debug日志
+
+        @param {str} msg - 要输出的日志
+        """
+        if self.logger:
+            if 'extra' not in kwargs:
+                kwargs['extra'] = {'callFunLevel': 2}
+
+            self.logger.debug(msg, *args, **kwargs)
+
+
+class VectorMatch(object):
+    """
+    向量匹配结果，与Milvus查询结果的匹配项一致，包含id和distance属性
+    """
+
+    __slots__ = ('id', 'distance')
+
+    def __init__(self, id: int, distance: float):
+        """
+        构造函数
+
+        @param {int} id - 匹配的向量id
+        @param {float} distance - 距离(L2为欧式距离的平方，IP为内积)
+        """
+        self.id = id
+        self.distance = distance
+
+    def __repr__(self):
+        return '(id:%s, distance:%s)' % (str(self.id), str(self.distance))
+
+
+class VectorStore(object):
+    """
+    特征向量存储的接口类，具体存储实现需继承该类并实现相应函数
+    """
+
+    def list_collection(self) -> list:
+        """
+        获取集合清单
+
+        @returns {list} - 返回集合清单
+        """
+        raise NotImplementedError()
+
+    def add_collections(self, collections: list):
+        """
+        新增集合，已存在的集合不处理
+
+        @param {list} collection - 集合名列表(str)
+        """
+        raise NotImplementedError()
+
+    def del_collections(self, collections: list, truncate: bool = False):
+        """
+        删除集合
+
+        @param {list} collections - 集合名列表(str)
+        @param {bool} truncate=False - 是否删除所有集合
+        """
+        raise NotImplementedError()
+
+    def insert_vectors(self, collection: str, vectors: list) -> list:
+        """
+        插入向量
+
+        @param {str} collection - 集合名
+        @param {list} vectors - 多个要插入的向量列表
+
+        @returns {list} - 插入的每个向量的 id 列表
+        """
+        raise NotImplementedError()
+
+    def search_vectors(self, collection: str, vector, topk: int = 10, nprobe: int = 16):
+        """
+        搜索匹配变量
+
+        @param {str} collection - 集合名
+        @param {list} vector - 变量对象数组
+        @param {int} topk=10 - 获取最近匹配的数量
+        @param {int} nprobe=16 - 查的单元数量(cell number of probe)
+
+        @returns {list} - 与查询向量顺序一致的匹配结果清单，每组匹配结果为按匹配度排序的匹配项清单，
+            匹配项包含id和distance属性
+        """
+        raise NotImplementedError()
+
+    def get_vectors(self, collection: str, ids: list) -> list:
+        """
+        获取指定id的原始向量
+
+        @param {str} collection - 集合名
+        @param {list} ids - 向量id清单
+
+        @returns {list} - 与id清单顺序一致的向量清单，id不存在时对应项为None
+        """
+        raise NotImplementedError()
+
+    def del_vectors(self, collection: str, ids: list):
+        """
+        删除向量
+
+        @param {str} collection - 集合名
+        @param {list} ids - 要删除的 id 列表
+
+        @throws {RuntimeError} - 删除失败时抛出异常(调用方据此不删除对应的文档)
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        关闭存储对象
+        """
+        pass
 
-class MilvusIns(object):
+
+class MilvusIns(VectorStore):
     """
     Milvus的操作类
     """
 
+    # 出现连接异常时可以重试的只读函数
+    # 注：insert等写入函数超时时服务端可能已执行完成，重试会重复写入，因此不重试
+    RETRY_FUNS = ('search', 'get_entity_by_id', 'has_collection', 'server_status', 'list_collections')
+
     def __init__(self, milvus_para: dict, logger=None):
         """
         构造函数
@@ -315,6 +952,10 @@ class MilvusIns(object):
         self.index_file_size = self.milvus_para.get('index_file_size', 1024)
         self.dimension = self.milvus_para.get('dimension', 2048)
         self.metric_type = eval('mv.MetricType.%s' % self.milvus_para.get('metric_type', 'L2'))
+        self.retry_times = self.milvus_para.get('retry_times', 1)
+
+        # 长期持有的连接池，所有线程共享
+        self.pool = MilvusConnectionPool(self.milvus_para, logger=logger)
 
     #############################
     # 工具函数
@@ -329,16 +970,21 @@ class MilvusIns(object):
         if status.code != 0:
             raise RuntimeError('execute milvus.%s error: %s' % (fun_name, str(status)))
 
-    def get_milvus(self) -> mv.Milvus:
+    def get_milvus(self):
         """
-        获取可用的milvus连接对象
+        从连接池获取可用的milvus连接对象(上下文管理)
 
-        @returns {Milvus} - 返回要使用的Milvus对象
+        @example
+            with self.get_milvus() as _milvus:
+                _milvus.list_collections()
         """
-        return mv.Milvus(
-            host=self.milvus_para['host'], port=self.milvus_para['port'],
-            pool=self.milvus_para.get('pool', 'SingletonThread')
-        )
+        return self.pool.connection()
+
+    def close(self):
+        """
+        关闭连接池
+        """
+        self.pool.close()
 
     #############################
     # 处理函数
@@ -349,11 +995,10 @@ class MilvusIns(object):
 
         @returns {list} - 返回集合清单
         """
-        with self.get_milvus() as _milvus:
-            _status, _list = _milvus.list_collections()
-            self.confirm_milvus_status(_status, 'list_collections')
+        _status, _list = self._call('list_collections')
+        self.confirm_milvus_status(_status, 'list_collections')
 
-            return _list
+        return _list
 
     def add_collections(self, collections: list):
         """
@@ -416,11 +1061,10 @@ class MilvusIns(object):
 
         @returns {list} - 插入的每个向量的 milvus id 列表
         """
-        with self.get_milvus() as _milvus:
-            _status, _milvus_ids = _milvus.insert(collection_name=collection, records=vectors)
-            self.confirm_milvus_status(_status, 'insert')
-            self._log_debug('insert _milvus_ids: %s' % str(_milvus_ids))
-            return _milvus_ids
+        _status, _milvus_ids = self._call('insert', collection_name=collection, records=vectors)
+        self.confirm_milvus_status(_status, 'insert')
+        self._log_debug('insert _milvus_ids: %s' % str(_milvus_ids))
+        return _milvus_ids
 
     def search_vectors(self, collection: str, vector, topk: int = 10, nprobe: int = 16):
         """
@@ -433,12 +1077,24 @@ class MilvusIns(object):
 
         @returns {list} - 返回匹配上的特征向量清单
         """
-        with self.get_milvus() as _milvus:
-            _search_param = {'nprobe': nprobe}
-            _status, _milvus_ids = _milvus.search(collection_name=collection, query_records=vector,
-                                                  top_k=topk, params=_search_param)
-            self.confirm_milvus_status(_status, 'search')
-            return _milvus_ids
+        _search_param = {'nprobe': nprobe}
+        _status, _milvus_ids = self._call('search', collection_name=collection, query_records=vector,
+                                          top_k=topk, params=_search_param)
+        self.confirm_milvus_status(_status, 'search')
+        return _milvus_ids
+
+    def get_vectors(self, collection: str, ids: list) -> list:
+        """
+        获取指定id的原始向量
+
+        @param {str} collection - 集合名
+        @param {list} ids - 向量id清单
+
+        @returns {list} - 与id清单顺序一致的向量清单，id不存在时对应项为None
+        """
+        _status, _vectors = self._call('get_entity_by_id', collection_name=collection, ids=ids)
+        self.confirm_milvus_status(_status, 'get_entity_by_id')
+        return [None if len(_vector) == 0 else _vector for _vector in _vectors]
 
     def del_vectors(self, collection: str, ids: list):
         """
@@ -446,10 +1102,65 @@ class MilvusIns(object):
 
         @param {str} collection - 集合名
         @param {list} ids - 要删除的 milvus id 列表
+
+        @throws {RuntimeError} - Milvus删除失败时抛出异常
         """
-        with self.get_milvus() as _milvus:
-            _milvus.delete_entity_by_id(collection_name=collection, id_array=ids)
-            self._log_debug('delete [%s] _milvus_ids: %s' % (collection, str(ids)))
+        _status = self._call('delete_entity_by_id', collection_name=collection, id_array=ids)
+        self.confirm_milvus_status(_status, 'delete_entity_by_id')
+        self._log_debug('delete [%s] _milvus_ids: %s' % (collection, str(ids)))
+
+    #############################
+    # 内部函数
+    #############################
+    def _call(self, fun_name: str, *args, **kwargs):
+        """
+        使用连接池的连接执行Milvus函数
+        RETRY_FUNS中的只读函数出现连接异常时丢弃连接并使用新连接重试，其他函数直接抛出异常
+
+        @param {str} fun_name - Milvus对象的函数名
+        @param {args} - 函数的固定入参
+        @param {kwargs} - 函数的kv入参
+
+        @returns {object} - 函数的执行结果
+        """
+        _retry = 0
+        _can_retry = fun_name in self.RETRY_FUNS
+        while True:
+            try:
+                with self.get_milvus() as _milvus:
+                    _res = getattr(_milvus, fun_name)(*args, **kwargs)
+                    if _can_retry and _retry < self.retry_times and self._is_transport_error(_res):
+                        # 客户端将通讯异常转换为错误状态返回，抛出异常使连接池丢弃该连接
+                        raise ConnectionError('execute milvus.%s transport error: %s' % (
+                            fun_name, str(_res)
+                        ))
+
+                    return _res
+            except (mv.ConnectError, grpc.RpcError, ConnectionError, TimeoutError):
+                if not _can_retry or _retry >= self.retry_times:
+                    raise
+
+                _retry += 1
+                self._log_info('execute milvus.%s error, retry %d: %s' % (
+                    fun_name, _retry, traceback.format_exc()
+                ))
+
+    def _is_transport_error(self, result) -> bool:
+        """
+        判断Milvus函数的返回结果是否为通讯异常(服务不可用或请求超时)
+
+        @param {object} result - Milvus函数的返回结果, Status或第一项为Status的tuple
+
+        @returns {bool} - 是否通讯异常
+        """
+        _status = result[0] if type(result) == tuple and len(result) > 0 else result
+        if not isinstance(_status, mv.Status):
+            return False
+
+        if _status.code in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED):
+            return True
+
+        return _status.code == mv.Status.UNEXPECTED_ERROR and _status.message == 'Request timeout'
 
     #############################
     # 日志输出相关函数
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# Copyright 2019 黎慧剑
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+管道多进程处理池
+@module worker_pool
+@file worker_pool.py
+"""
+
+import os
+import sys
+import time
+import itertools
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+import numpy as np
+from HiveNetLib.base_tools.run_tool import RunTool
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+from search_by_image.lib.pipeline import Pipeline, CompiledPipeline
+from search_by_image.lib.image_carrier import ImageCarrier
+
+
+__MOUDLE__ = 'worker_pool'  # 模块名
+__DESCRIPT__ = u'管道多进程处理池'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = u'黎慧剑'  # 作者
+__PUBLISH__ = '2020.09.20'  # 发布日期
+
+
+class PipelineWorkerPool(object):
+    """
+    管道多进程处理池
+    每个工作进程独立装载管道插件(模型)，图片数据及返回的特征向量通过共享内存传递，不经过序列化:
+        1、前端进程创建共享内存，写入图片数据(解码后的RGB数组或原始图片bytes)，并预留特征向量的空间
+        2、通过任务队列将共享内存名及数据格式发送给工作进程
+        3、工作进程从共享内存读取图片执行管道，将特征向量写入共享内存的预留空间后通知前端进程
+        4、前端进程读取特征向量后释放共享内存
+
+    @example
+        _pool = PipelineWorkerPool(server_config, workers=4)
+        _status, _output = _pool.run_pipeline('JadeSearch', image_bytes, init_collection='')
+    """
+
+    def __init__(self, server_config: dict, workers: int = 2, decode: bool = False,
+                 max_input_side: int = 0, start_method: str = 'spawn', task_timeout: float = 60,
+                 monitor_interval: float = 1.0, logger=None):
+        """
+        构造函数
+
+        @param {dict} server_config - 服务配置，使用execute_path、pipeline和milvus的dimension配置
+        @param {int} workers=2 - 工作进程数
+        @param {bool} decode=False - 是否在前端进程将图片解码为RGB数组(numpy.ndarray)后传递给管道
+            为False时直接传递原始图片bytes，由管道自行解码(例如SearchImageInputAdpter的draft模式缩小解码)
+        @param {int} max_input_side=0 - decode为True时，解码前将图片按最大边长缩小(JPEG使用draft模式解码)，
+            <=0代表不缩小; 注意缩小后管道无法再从原图截图
+        @param {str} start_method='spawn' - 工作进程的启动方式，可选spawn、forkserver、fork
+        @param {float} task_timeout=60 - 等待管道处理结果的超时时间，单位为秒
+        @param {float} monitor_interval=1.0 - 检查工作进程存活状态的间隔时间，单位为秒
+            工作进程异常退出时，其正在处理的任务直接返回失败，并重新启动该工作进程
+        @param {Logger} logger=None - 日志对象
+        """
+        self.workers = max(1, workers)
+        self.decode = decode
+        self.max_input_side = max_input_side
+        self.task_timeout = task_timeout
+        self.logger = logger
+        self.dimension = server_config['milvus']['dimension']
+
+        self.monitor_interval = monitor_interval
+
+        # 工作进程只需要管道相关配置
+        self._worker_config = {
+            'execute_path': server_config['execute_path'],
+            'pipeline': server_config['pipeline']
+        }
+
+        self._context = multiprocessing.get_context(start_method)
+        self._task_queue = self._context.Queue()
+        # 结果队列使用同步发送的SimpleQueue: Queue通过后台线程发送，工作进程在发送过程中异常退出
+        # 会使共享的写锁无法释放，导致重新启动的工作进程无法返回结果
+        self._result_queue = self._context.SimpleQueue()
+        self._futures = dict()
+        self._running = dict()  # 工作进程正在处理的任务, key为任务id, value为工作进程pid
+        self._ready_pids = set()  # 已完成装载的工作进程pid
+        self._init_pids = set()  # 已处理装载结果(装载完成、装载失败或装载前退出)的工作进程pid
+        self._dead_pids = set()  # 已退出的工作进程pid
+        self._init_errors = list()  # 工作进程装载失败的错误信息
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._closed = False
+
+        self._processes = list()
+        for _index in range(self.workers):
+            self._processes.append(self._start_worker(_index))
+
+        # 结果分发线程
+        self._ready = threading.Semaphore(0)
+        self._thread = threading.Thread(
+            target=self._result_loop, name='PipelineWorkerPool-Result', daemon=True
+        )
+        self._thread.start()
+
+        # 工作进程监控线程
+        self._monitor_event = threading.Event()
+        self._monitor = threading.Thread(
+            target=self._monitor_loop, name='PipelineWorkerPool-Monitor', daemon=True
+        )
+        self._monitor.start()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """
+        等待所有工作进程完成管道装载
+
+        @param {float} timeout=None - 超时时间，单位为秒，None代表一直等待
+
+        @returns {bool} - 是否所有工作进程已完成装载，等待超时返回False
+
+        @throws {RuntimeError} - 工作进程装载管道失败或装载完成前退出时抛出异常
+        """
+        _end = None if timeout is None else time.time() + timeout
+        for _i in range(self.workers):
+            _remain = None if _end is None else max(0.0, _end - time.time())
+            if not self._ready.acquire(timeout=_remain):
+                return False
+
+            if len(self._init_errors) > 0:
+                raise RuntimeError(
+                    'PipelineWorker initialize error: %s' % self._init_errors[0]
+                )
+
+        return True
+
+    def run_pipeline(self, pipeline: str, image_data: bytes, init_collection: str = ''):
+        """
+        在工作进程中执行管道处理
+
+        @param {str} pipeline - 处理管道标识
+        @param {bytes} image_data - 影像内容二进制数据
+        @param {str} init_collection='' - 默认集合名，用于传入管道进行处理
+
+        @returns {str, dict} - 返回 管道状态, 管道输出 {'collection': 集合名, 'vertor': 特征向量}
+            管道状态不为success时管道输出为None
+
+        @throws {RuntimeError} - 处理池已关闭时抛出异常
+        @throws {concurrent.futures.TimeoutError} - 等待超时抛出异常
+        """
+        if self._closed:
+            raise RuntimeError('PipelineWorkerPool is closed!')
+
+        if self.decode:
+            _image = ImageCarrier(data=image_data).thumbnail(self.max_input_side).array
+            _format = ('array', _image.shape)
+            _size = _image.nbytes
+        else:
+            _image = image_data
+            _format = ('bytes', len(image_data))
+            _size = len(image_data)
+
+        # 特征向量的存放位置按8字节对齐，预留空间按维度 * 8字节(float64)计算
+        _offset = (_size + 7) // 8 * 8
+        _shm = shared_memory.SharedMemory(create=True, size=_offset + self.dimension * 8)
+        try:
+            if self.decode:
+                _view = np.ndarray(_image.shape, dtype=np.uint8, buffer=_shm.buf)
+                _view[:] = _image
+                del _view
+            else:
+                _shm.buf[0:_size] = _image
+
+            _task_id = next(self._task_ids)
+            _future = Future()
+            with self._lock:
+                self._futures[_task_id] = _future
+
+            # 送入任务截止时间，工作进程不处理前端已放弃等待的任务
+            self._task_queue.put(
+                (_task_id, pipeline, init_collection, _shm.name, _format, _offset,
+                 time.time() + self.task_timeout)
+            )
+
+            try:
+                _status, _collection, _vertor_format, _msg = _future.result(timeout=self.task_timeout)
+            finally:
+                with self._lock:
+                    self._futures.pop(_task_id, None)
+
+            if _status != 'success':
+                self._log_error('PipelineWorkerPool run pipeline [%s] error: %s' % (pipeline, _msg))
+                return _status, None
+
+            _vertor = np.ndarray(
+                _vertor_format[0], dtype=_vertor_format[1], buffer=_shm.buf, offset=_offset
+            ).copy()
+            return _status, {
+                'collection': _collection,
+                'vertor': _vertor
+            }
+        finally:
+            _shm.close()
+            _shm.unlink()
+
+    def close(self):
+        """
+        关闭处理池(等待工作进程处理完已提交的任务后退出)
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._monitor_event.set()
+        self._monitor.join()
+        for _i in range(len(self._processes)):
+            self._task_queue.put(None)
+
+        for _process in self._processes:
+            _process.join()
+
+        self._result_queue.put(None)
+        self._thread.join()
+
+    #############################
+    # 内部函数
+    #############################
+    def _start_worker(self, index: int):
+        """
+        启动工作进程
+
+        @param {int} index - 工作进程序号
+
+        @returns {multiprocessing.Process} - 工作进程对象
+        """
+        _process = self._context.Process(
+            target=_worker_main, args=(self._worker_config, self._task_queue, self._result_queue),
+            name='PipelineWorker-%d' % index, daemon=True
+        )
+        _process.start()
+        return _process
+
+    def _result_loop(self):
+        """
+        接收工作进程的处理结果并分发
+        """
+        while True:
+            _msg = self._result_queue.get()
+            if _msg is None:
+                break
+
+            if _msg[0] == 'ready':
+                # 工作进程装载完成
+                with self._lock:
+                    # 监控线程可能已将发送装载结果后退出的进程按装载前退出处理
+                    _handled = _msg[1] in self._init_pids
+                    self._init_pids.add(_msg[1])
+                    if _msg[2] == '' and not _handled:
+                        self._ready_pids.add(_msg[1])
+
+                if _msg[2] != '':
+                    self._log_error('PipelineWorker [%d] initialize error: %s' % (_msg[1], _msg[2]))
+                    self._init_errors.append(_msg[2])
+                if not _handled:
+                    self._ready.release()
+                continue
+
+            if _msg[0] == 'start':
+                # 工作进程开始处理任务
+                _, _task_id, _pid = _msg
+                with self._lock:
+                    _dead = _pid in self._dead_pids
+                    if not _dead:
+                        self._running[_task_id] = _pid
+
+                if _dead:
+                    # 监控线程已处理过该进程的退出，直接返回失败
+                    self._set_future(
+                        _task_id, ('exception', '', None, 'PipelineWorker [%d] exited' % _pid)
+                    )
+                continue
+
+            _, _task_id, _status, _collection, _vertor_format, _error = _msg
+            with self._lock:
+                self._running.pop(_task_id, None)
+
+            self._set_future(_task_id, (_status, _collection, _vertor_format, _error))
+
+    def _monitor_loop(self):
+        """
+        监控工作进程，异常退出时将其正在处理的任务返回失败并重新启动工作进程
+        """
+        while not self._monitor_event.wait(self.monitor_interval):
+            for _index, _process in enumerate(self._processes):
+                if _process.is_alive():
+                    continue
+
+                _pid = _process.pid
+                with self._lock:
+                    if _pid in self._dead_pids:
+                        continue
+
+                    self._dead_pids.add(_pid)
+                    _was_ready = _pid in self._ready_pids
+                    _init_exited = _pid not in self._init_pids
+                    self._init_pids.add(_pid)
+                    _task_ids = [_id for _id, _run_pid in self._running.items() if _run_pid == _pid]
+                    for _task_id in _task_ids:
+                        self._running.pop(_task_id)
+
+                _error = 'PipelineWorker [%d] exited with code [%s]' % (_pid, str(_process.exitcode))
+                self._log_error(_error)
+                if _init_exited:
+                    # 装载完成前退出(例如装载模型时内存不足)，作为装载失败通知wait_ready
+                    self._init_errors.append(_error + ' before initialized')
+                    self._ready.release()
+
+                for _task_id in _task_ids:
+                    self._set_future(_task_id, ('exception', '', None, _error))
+
+                if _was_ready and not self._closed:
+                    # 已正常装载的工作进程异常退出，重新启动(装载失败的进程不重启，避免反复失败)
+                    self._processes[_index] = self._start_worker(_index)
+
+            if len(self._dead_pids) > 0 and not any(
+                [_process.is_alive() for _process in self._processes]
+            ):
+                # 没有可用的工作进程，所有等待中的任务直接返回失败
+                with self._lock:
+                    _task_ids = list(self._futures.keys())
+                for _task_id in _task_ids:
+                    self._set_future(
+                        _task_id, ('exception', '', None, 'no PipelineWorker alive')
+                    )
+
+    def _set_future(self, task_id: int, result: tuple):
+        """
+        设置任务结果
+        """
+        with self._lock:
+            _future = self._futures.get(task_id, None)
+
+        if _future is not None and not _future.done():
+            try:
+                _future.set_result(result)
+            except Exception:
+                # 可能同时被其他线程设置
+                pass
+
+    def _log_error(self, msg: str):
+        """
+        输出error日志
+        """
+        if self.logger is not None:
+            self.logger.error(msg)
+
+
+def _worker_main(worker_config: dict, task_queue, result_queue):
+    """
+    工作进程主函数，装载管道插件后循环处理任务
+
+    @param {dict} worker_config - 工作进程配置
+    @param {multiprocessing.Queue} task_queue - 任务队列
+    @param {multiprocessing.SimpleQueue} result_queue - 结果队列
+    """
+    _pid = os.getpid()
+    try:
+        # 与ServerLoader一致的管道装载处理
+        _execute_path = worker_config['execute_path']
+        _pipeline_config = worker_config['pipeline']
+        RunTool.set_global_var('EXECUTE_PATH', _execute_path)
+        RunTool.set_global_var('PIPELINE_PROCESSER_PARA', _pipeline_config['processer_para'])
+        RunTool.set_global_var('PIPELINE_ROUTER_PARA', _pipeline_config['router_para'])
+        for _plugins_path in _pipeline_config['plugins_path'].split(','):
+            Pipeline.load_plugins_by_path(os.path.join(_execute_path, _plugins_path.strip()))
+
+        _pipelines = dict()
+        for _name, _config in _pipeline_config['pipeline_config'].items():
+            _pipelines[_name] = CompiledPipeline(_name, _config)
+    except:
+        result_queue.put(('ready', _pid, traceback.format_exc()))
+        return
+
+    result_queue.put(('ready', _pid, ''))
+
+    while True:
+        _task = task_queue.get()
+        if _task is None:
+            break
+
+        _task_id, _pipeline, _init_collection, _shm_name, _format, _offset, _deadline = _task
+        result_queue.put(('start', _task_id, _pid))
+        if time.time() > _deadline:
+            # 前端已放弃等待
+            result_queue.put(('result', _task_id, 'cancelled', '', None, 'task timeout'))
+            continue
+
+        _shm = None
+        try:
+            # 从共享内存获取图片数据(复制出来，管道处理过程不持有共享内存的引用)
+            try:
+                _shm = shared_memory.SharedMemory(name=_shm_name)
+            except FileNotFoundError:
+                # 前端等待超时已释放共享内存
+                result_queue.put(('result', _task_id, 'cancelled', '', None, 'task timeout'))
+                continue
+
+            if _format[0] == 'array':
+                _image = np.ndarray(_format[1], dtype=np.uint8, buffer=_shm.buf).copy()
+            else:
+                _image = bytes(_shm.buf[0:_format[1]])
+
+            _status, _output = Pipeline(
+                _pipeline, _pipelines[_pipeline], is_asyn=False, run_in_caller=True
+            ).start({'image': _image, 'collection': _init_collection}, {})
+
+            if _status != 'success':
+                result_queue.put(
+                    ('result', _task_id, _status, '', None, 'pipeline status [%s]' % _status)
+                )
+                continue
+
+            # 将特征向量按原数据类型写入共享内存
+            _vertor = np.asarray(_output['vertor'])
+            if _offset + _vertor.nbytes > _shm.size:
+                raise RuntimeError('vertor size [%d] exceeds the reserved size!' % _vertor.nbytes)
+
+            _view = np.ndarray(_vertor.shape, dtype=_vertor.dtype, buffer=_shm.buf, offset=_offset)
+            _view[:] = _vertor
+            del _view
+
+            result_queue.put(
+                ('result', _task_id, 'success', _output['collection'],
+                 (_vertor.shape, _vertor.dtype.str), '')
+            )
+        except:
+            result_queue.put(('result', _task_id, 'exception', '', None, traceback.format_exc()))
+        finally:
+            if _shm is not None:
+                _shm.close()
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -22,6 +22,7 @@ from HiveNetLib.base_tools.run_tool import RunTool
 # 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 from search_by_image.lib.loader import ServerLoader
+from search_by_image.lib.serving import ServingTool
 
 
 __MOUDLE__ = 'server'  # 模块名
@@ -35,16 +36,32 @@ app = Flask(__name__)
 CORS(app)
 
 
-def start_server(**kwargs):
+def create_app() -> Flask:
     """
-    启动以图搜图服务端应用
+    装载以图搜图服务并返回应用
+
+    @returns {Flask} - 已装载服务的应用
     """
     SERVER_CONFIG = RunTool.get_global_var('SERVER_CONFIG')
     _loader = ServerLoader(SERVER_CONFIG, app=app)
     RunTool.set_global_var('SER_LOADER', _loader)
+    return _loader.app
+
+
+def start_server(**kwargs):
+    """
+    启动以图搜图服务端应用
+    """
+    SERVER_CONFIG = RunTool.get_global_var('SERVER_CONFIG')
+    if SERVER_CONFIG.get('server_mode', 'flask') == 'gunicorn':
+        # 预派生多进程模式，在各个工作进程中装载服务
+        ServingTool.run_gunicorn(create_app, SERVER_CONFIG)
+        return
+
+    create_app()
 
     # 启动服务
-    _loader.start_restful_server()
+    RunTool.get_global_var('SER_LOADER').start_restful_server()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+测试结果缓存
+@module test_cache
+@file test_cache.py
+"""
+
+import os
+import sys
+import time
+import pytest
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.cache import LRUCache
+
+
+def test_lru_max_size():
+    """
+    测试按数量淘汰最久未使用的缓存
+    """
+    _cache = LRUCache(max_size=2)
+    _cache.set('a', 1)
+    _cache.set('b', 2)
+    assert _cache.get('a') == 1  # a成为最近使用
+    _cache.set('c', 3)
+
+    assert _cache.get('b') is None
+    assert _cache.get('a') == 1
+    assert _cache.get('c') == 3
+    assert _cache.stats['count'] == 2
+
+
+def test_lru_ttl():
+    """
+    测试缓存过期
+    """
+    _cache = LRUCache(ttl=0.05)
+    _cache.set('a', 1)
+    assert _cache.get('a') == 1
+
+    time.sleep(0.1)
+    assert _cache.get('a', 'expired') == 'expired'
+    assert _cache.stats['count'] == 0
+
+
+def test_lru_max_memory():
+    """
+    测试按内存预算淘汰缓存
+    """
+    _cache = LRUCache(max_size=0, max_memory=100, size_fun=len)
+    assert _cache.set('a', 'x' * 40)
+    assert _cache.set('b', 'x' * 40)
+    assert _cache.set('c', 'x' * 40)
+
+    # 超出预算淘汰最早的a
+    assert _cache.get('a') is None
+    assert _cache.stats['memory'] == 80
+
+    # 单个值超过预算不存入，也不影响已有缓存
+    assert not _cache.set('d', 'x' * 101)
+    assert _cache.get('d') is None
+    assert _cache.get('b') is not None
+    assert _cache.stats['memory'] == 80
+
+
+def test_lru_invalidate_tag():
+    """
+    测试按标签批量失效
+    """
+    _cache = LRUCache()
+    _cache.set('a', 1, tags=['c1'])
+    _cache.set('b', 2, tags=['c1', 'c2'])
+    _cache.set('c', 3, tags=['c2'])
+
+    _cache.invalidate_tag('c1')
+    assert _cache.get('a') is None
+    assert _cache.get('b') is None
+    assert _cache.get('c') == 3
+
+    _cache.invalidate_tag('c2')
+    assert _cache.get('c') is None
+    assert _cache.stats['count'] == 0
+
+
+def test_lru_version():
+    """
+    测试计算期间出现失效操作时不存入过期的值
+    """
+    _cache = LRUCache()
+    _version = _cache.version
+    _cache.invalidate_tag('c1')
+    assert not _cache.set('a', 1, tags=['c1'], version=_version)
+    assert _cache.get('a') is None
+
+    assert _cache.set('a', 1, tags=['c1'], version=_cache.version)
+    assert _cache.get('a') == 1
+
+
+def test_lru_copy_value():
+    """
+    测试缓存值深拷贝，调用方修改不影响缓存内容
+    """
+    _cache = LRUCache()
+    _value = [{'id': 1}]
+    _cache.set('a', _value)
+    _value[0]['id'] = 2
+    _get_value = _cache.get('a')
+    assert _get_value == [{'id': 1}]
+
+    _get_value.append({'id': 3})
+    assert _cache.get('a') == [{'id': 1}]
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])
@@ -10,6 +10,7 @@
 import os
 import sys
 import math
+import time
 import itertools
 import numpy as np
 from io import BytesIO
@@ -23,6 +24,7 @@ from HiveNetLib.base_tools.file_tool import FileTool
 sys.path.append(os.path.abspath(os.path.join(
     os.path.dirname(__file__), os.path.pardir)))
 from search_by_image.lib.pipeline import Pipeline, PipelineProcesser
+from search_by_image.lib.image_carrier import ImageCarrier
 
 
 def init_pipeline_plugins():
@@ -95,13 +97,13 @@ def test_JadeTypeDetect():
             _input = {
                 'type': '',
                 'sub_type': '',
-                'image': Image.open(_file_bytes),
+                'image': ImageCarrier(data=_file_bytes),
                 'score': 0.0
             }
             _output = _processer_class.execute(_input, {}, _pipeline)
 
-            # 输出图片和对应文字
-            _image = _output['image']
+            # 输出图片和对应文字(复制一份再绘制文字)
+            _image = _output['image'].image.copy()
             _print_str = 'type: %s\nsub_type: %s\nscore: %s' % (
                 _output['type'], _output['sub_type'], str(_output['score']))
             _draw = ImageDraw.Draw(_image)  # PIL图片上打印汉字
@@ -132,13 +134,13 @@ def test_PendantTypeDetect():
             _input = {
                 'type': '',
                 'sub_type': '',
-                'image': Image.open(_file_bytes),
+                'image': ImageCarrier(data=_file_bytes),
                 'score': 0.0
             }
             _output = _processer_class.execute(_input, {}, _pipeline)
 
-            # 输出图片和对应文字
-            _image = _output['image']
+            # 输出图片和对应文字(复制一份再绘制文字)
+            _image = _output['image'].image.copy()
             _print_str = 'type: %s\nsub_type: %s\nscore: %s' % (
                 _output['type'], _output['sub_type'], str(_output['score']))
             _draw = ImageDraw.Draw(_image)  # PIL图片上打印汉字
@@ -169,7 +171,7 @@ def test_HistogramVetor():
             _input = {
                 'type': '',
                 'sub_type': '',
-                'image': Image.open(_file_bytes),
+                'image': ImageCarrier(data=_file_bytes),
                 'score': 0.0
             }
             _output = _processer_class.execute(_input, {}, _pipeline)
@@ -177,6 +179,107 @@ def test_HistogramVetor():
             print(_output['vertor'])
 
 
+def test_HSVClusterHistogramVetor_engine():
+    """
+    测试HSV聚类直方图numpy引擎与python引擎的结果一致性及性能
+    """
+    _execute_path = RunTool.get_global_var('EXECUTE_PATH')
+    _pipeline = RunTool.get_global_var('EMPTY_PIPELINE')
+    _processer_class: PipelineProcesser = Pipeline.get_plugin(
+        'processer', 'HSVClusterHistogramVetor')
+    _config = RunTool.get_global_var('PIPELINE_PROCESSER_PARA')['HSVClusterHistogramVetor']
+    _filelist = FileTool.get_filelist(
+        os.path.join(_execute_path, os.path.pardir, 'test_data/test_pic/'),
+        is_fullname=True
+    )
+    for _file in _filelist:
+        _outputs = {}
+        for _engine in ('python', 'numpy'):
+            _config['engine'] = _engine
+            _input = {
+                'type': '',
+                'sub_type': '',
+                'image': Image.open(_file),
+                'score': 0.0
+            }
+            _start = time.time()
+            _outputs[_engine] = _processer_class.execute(_input, {}, _pipeline)
+            print('%s [%s] use: %f' % (_file, _engine, time.time() - _start))
+
+        assert np.array_equal(_outputs['python']['vertor'], _outputs['numpy']['vertor']), \
+            'vertor not equal: %s' % _file
+        assert np.array_equal(
+            _outputs['python']['image'].array, _outputs['numpy']['image'].array
+        ), 'image not equal: %s' % _file
+
+    _config.pop('engine', None)
+
+
+def _apply_image_mask_by_loop(image_np, mask):
+    """
+    逐像素方式进行掩码处理(作为对照)
+    """
+    _image = Image.fromarray(image_np)
+    _image_pix = _image.load()
+    for _x in range(_image.size[0]):
+        for _y in range(_image.size[1]):
+            if mask[_y][_x] == 0:
+                _image_pix[_x, _y] = (0, 0, 0)
+    return _image
+
+
+def _random_image_and_mask(size: tuple):
+    """
+    构造随机图片及椭圆形状的掩码
+    """
+    _image_np = np.random.randint(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    _yy, _xx = np.ogrid[:size[1], :size[0]]
+    _mask = ((((_xx - size[0] / 2) / (size[0] / 3))**2 +
+              ((_yy - size[1] / 2) / (size[1] / 3))**2) <= 1).astype(np.uint8)
+    return _image_np, _mask
+
+
+def test_apply_image_mask():
+    """
+    测试掩码处理数组方式与逐像素方式的结果一致
+    """
+    _processer_class = Pipeline.get_plugin('processer', 'BangleMaskDetect')
+    _tools = sys.modules[_processer_class.__module__].Tools
+
+    _image_np, _mask = _random_image_and_mask((64, 48))
+    _loop_image = _apply_image_mask_by_loop(_image_np, _mask)
+    _array_image = _tools.apply_image_mask(Image.fromarray(_image_np), _mask)
+    assert np.array_equal(np.asarray(_loop_image), np.asarray(_array_image)), \
+        'mask result not equal'
+
+
+def benchmark_apply_image_mask():
+    """
+    对比掩码处理逐像素方式与数组方式的性能(耗时较长，不作为测试用例执行)
+    """
+    _processer_class = Pipeline.get_plugin('processer', 'BangleMaskDetect')
+    _tools = sys.modules[_processer_class.__module__].Tools
+
+    for _size in ((640, 480), (1280, 960), (2048, 1536), (4000, 3000)):
+        _image_np, _mask = _random_image_and_mask(_size)
+
+        # 逐像素处理
+        _start = time.time()
+        _loop_image = _apply_image_mask_by_loop(_image_np, _mask)
+        _loop_use = time.time() - _start
+
+        # 数组处理
+        _start = time.time()
+        _array_image = _tools.apply_image_mask(Image.fromarray(_image_np), _mask)
+        _array_use = time.time() - _start
+
+        assert np.array_equal(np.asarray(_loop_image), np.asarray(_array_image)), \
+            'mask result not equal: %s' % str(_size)
+        print('%dx%d: loop %f, array %f, speedup %.1f' % (
+            _size[0], _size[1], _loop_use, _array_use, _loop_use / max(_array_use, 1e-6)
+        ))
+
+
 def test_jade_pipeline():
     """
     测试管道
@@ -458,6 +561,15 @@ if __name__ == '__main__':
     # 测试HistogramVetor
     # test_HistogramVetor()
 
+    # 测试HSVClusterHistogramVetor的计算引擎
+    # test_HSVClusterHistogramVetor_engine()
+
+    # 测试掩码处理
+    # test_apply_image_mask()
+
+    # 对比掩码处理性能
+    # benchmark_apply_image_mask()
+
     # 测试管道
     test_jade_pipeline()
 
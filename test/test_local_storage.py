@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+测试本地存储
+@module test_local_storage
+@file test_local_storage.py
+"""
+
+import os
+import sys
+import gc
+import threading
+import numpy as np
+import pytest
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.local_storage import (
+    LocalVectorCollection, LocalVectorStore, LocalDocStorage
+)
+
+
+def _random_vectors(num: int, dimension: int = 8, seed: int = 0):
+    """
+    生成随机向量
+    """
+    return np.random.RandomState(seed).rand(num, dimension).astype(np.float32)
+
+
+def _brute_force(vectors, query, topk: int) -> list:
+    """
+    暴力计算L2距离最近的行号
+    """
+    _dist = ((vectors - query) ** 2).sum(axis=1)
+    return np.argsort(_dist, kind='stable')[0:topk].tolist()
+
+
+def test_vector_insert_search(tmp_path):
+    """
+    测试向量插入及FLAT搜索
+    """
+    _store = LocalVectorStore({'path': str(tmp_path), 'dimension': 8})
+    _store.add_collections(['c1'])
+    _vectors = _random_vectors(100)
+    _ids = _store.insert_vectors('c1', _vectors)
+    assert _ids == list(range(1, 101))
+
+    _res = _store.search_vectors('c1', _vectors[0:2], topk=5)
+    assert len(_res) == 2
+    for _query, _matches in zip(_vectors[0:2], _res):
+        assert [_match.id for _match in _matches] == [
+            _ids[_row] for _row in _brute_force(_vectors, _query, 5)
+        ]
+        assert _matches[0].distance == pytest.approx(0.0, abs=1e-5)
+
+
+def test_vector_ip_metric(tmp_path):
+    """
+    测试内积度量返回内积最大的向量
+    """
+    _store = LocalVectorStore({'path': str(tmp_path), 'dimension': 8, 'metric_type': 'IP'})
+    _store.add_collections(['c1'])
+    _vectors = _random_vectors(50)
+    _ids = _store.insert_vectors('c1', _vectors)
+
+    _query = _random_vectors(1, seed=1)[0]
+    _matches = _store.search_vectors('c1', [_query], topk=3)[0]
+    _ip = _vectors @ _query
+    assert [_match.id for _match in _matches] == [_ids[_row] for _row in np.argsort(-_ip)[0:3]]
+    assert _matches[0].distance == pytest.approx(float(_ip.max()), rel=1e-5)
+
+
+def test_vector_get_delete(tmp_path):
+    """
+    测试获取及删除向量
+    """
+    _store = LocalVectorStore({'path': str(tmp_path), 'dimension': 8})
+    _store.add_collections(['c1'])
+    _vectors = _random_vectors(10)
+    _ids = _store.insert_vectors('c1', _vectors)
+
+    _get = _store.get_vectors('c1', [_ids[3], 999])
+    assert np.allclose(_get[0], _vectors[3])
+    assert _get[1] is None
+
+    _store.del_vectors('c1', [_ids[3]])
+    assert _store.get_vectors('c1', [_ids[3]]) == [None]
+    _matches = _store.search_vectors('c1', [_vectors[3]], topk=10)[0]
+    assert _ids[3] not in [_match.id for _match in _matches]
+    assert len(_matches) == 9
+
+
+def test_vector_reopen(tmp_path):
+    """
+    测试重新打开存储后数据保持不变
+    """
+    _store = LocalVectorStore({'path': str(tmp_path), 'dimension': 8})
+    _store.add_collections(['c1', 'c2'])
+    _vectors = _random_vectors(20)
+    _ids = _store.insert_vectors('c1', _vectors)
+    _store.del_collections(['c2'])
+
+    _store = LocalVectorStore({'path': str(tmp_path), 'dimension': 8})
+    assert _store.list_collection() == ['c1']
+    assert np.allclose(_store.get_vectors('c1', [_ids[5]])[0], _vectors[5])
+    assert _store.insert_vectors('c1', _random_vectors(1)) == [21]
+
+    with pytest.raises(RuntimeError):
+        LocalVectorStore({'path': str(tmp_path), 'dimension': 16})
+
+
+def test_vector_ivf_train(tmp_path):
+    """
+    测试IVF索引在插入时后台训练，训练后查询所有聚类与暴力搜索一致
+    """
+    _collection = LocalVectorCollection(
+        str(tmp_path / 'c1'), 8, index_type='IVF', nlist=4
+    )
+    _vectors = _random_vectors(4 * 39)
+    _ids = _collection.insert(_vectors)
+    _collection.start_train().join()
+    assert _collection.centroids is not None
+    assert _collection.meta['trained_count'] == len(_ids)
+
+    # 训练后插入的向量直接分配聚类
+    _more = _random_vectors(10, seed=1)
+    _ids += _collection.insert(_more)
+    _all = np.concatenate([_vectors, _more])
+    _matches = _collection.search(_all[-1:], topk=5, nprobe=4)[0]
+    assert [_match.id for _match in _matches] == [
+        _ids[_row] for _row in _brute_force(_all, _all[-1], 5)
+    ]
+
+    # 只查询最近的聚类时，查询向量自身一定能找到
+    _matches = _collection.search(_all[-1:], topk=1, nprobe=1)[0]
+    assert _matches[0].id == _ids[-1]
+
+
+def test_vector_ivf_inverted(tmp_path):
+    """
+    测试IVF倒排列表与聚类分配一致，查询只访问最近聚类的行
+    """
+    _collection = LocalVectorCollection(str(tmp_path / 'c1'), 8, index_type='IVF', nlist=4)
+    _vectors = _random_vectors(4 * 39)
+    _collection.insert(_vectors)
+    _collection.start_train().join()
+    _collection.insert(_random_vectors(10, seed=1))
+
+    def _lists_rows(collection):
+        _count = collection.count
+        return [
+            collection.inverted[_list][0:collection.inverted_sizes[_list]].tolist()
+            for _list in range(collection.centroids.shape[0])
+        ], [
+            np.nonzero(collection.lists[0:_count] == _list)[0].tolist()
+            for _list in range(collection.centroids.shape[0])
+        ]
+
+    _inverted, _expect = _lists_rows(_collection)
+    assert _inverted == _expect
+    assert sum([len(_rows) for _rows in _inverted]) == _collection.count
+
+    # 查询只访问最近聚类的倒排列表中的行
+    _searched = list()
+    _search_rows = _collection._search_rows
+
+    def _record_rows(query, vectors, ids, count, rows, topk):
+        _searched.append(rows.tolist())
+        return _search_rows(query, vectors, ids, count, rows, topk)
+
+    _collection._search_rows = _record_rows
+    _query = _vectors[0]
+    _probe = _collection._top(_collection._distance(_query, _collection.centroids), 1)[0]
+    _collection.search([_query], topk=3, nprobe=1)
+    assert _searched == [_expect[_probe]]
+
+    # 重新打开时根据lists.npy重新生成
+    _reopen = LocalVectorCollection(str(tmp_path / 'c1'), 8, index_type='IVF', nlist=4)
+    assert _lists_rows(_reopen) == (_inverted, _expect)
+
+
+def test_vector_assign_chunked(tmp_path):
+    """
+    测试分块计算聚类分配与不分块结果一致
+    """
+    _collection = LocalVectorCollection(str(tmp_path / 'c1'), 8, nlist=4)
+    _vectors = _random_vectors(1000)
+    _centroids = _random_vectors(16, seed=1)
+    assert np.array_equal(
+        _collection._assign(_vectors, _centroids, max_elements=50),
+        _collection._assign(_vectors, _centroids)
+    )
+
+
+def _doc_storage(path) -> LocalDocStorage:
+    """
+    创建包含c1集合的文档存储
+    """
+    _storage = LocalDocStorage({'path': str(path)}, index_fields=['collection', 'info.name'])
+    _storage.new_collections('db', ['c1'])
+    return _storage
+
+
+def test_doc_insert_search(tmp_path):
+    """
+    测试文档插入及按向量id、域值查询
+    """
+    _storage = _doc_storage(tmp_path)
+    assert _storage.collection_exists('db', 'c1')
+    assert _storage.get_missing_indexes('db', 'c1', ['_id', 'ids', 'collection', 'info.name']) == []
+    assert _storage.get_missing_indexes('db', 'c1', ['other']) == ['other']
+
+    _docs = [
+        {
+            'ids': _i, 'collection': 'a' if _i % 2 == 0 else 'b',
+            'info': {'name': 'n%d' % _i, 'size': _i}
+        } for _i in range(10)
+    ]
+    _obj_ids = _storage.insert_documents('db', 'c1', _docs)
+    assert _obj_ids == [_doc['_id'] for _doc in _docs]
+
+    _found = _storage.search_by_id('db', 'c1', str(_obj_ids[2]))
+    assert len(_found) == 1 and _found[0]['info']['name'] == 'n2'
+    assert _found[0]['_id'] == _obj_ids[2]
+
+    _found = _storage.search_by_vector_id('db', 'c1', [3, 1], fields=['info.name'])
+    assert _found == [{'ids': 1, 'info': {'name': 'n1'}}, {'ids': 3, 'info': {'name': 'n3'}}]
+
+    assert _storage.count_by_field('db', 'c1', 'collection', 'a') == 5
+    assert _storage.count_by_field('db', 'c1', 'collection', []) == 0
+    _found = _storage.search_by_field('db', 'c1', 'collection', ['b'], page_size=2, page_num=2)
+    assert [_doc['ids'] for _doc in _found] == [5, 7]
+    _found = _storage.search_with_skip('db', 'c1', None, None, 8, 5)
+    assert [_doc['ids'] for _doc in _found] == [8, 9]
+
+    with pytest.raises(AttributeError):
+        _storage.search_by_field('db', 'c1', "x') OR 1=1 --", 'a')
+
+
+def test_doc_search_after(tmp_path):
+    """
+    测试按_id游标分页
+    """
+    _storage = _doc_storage(tmp_path)
+    _obj_ids = _storage.insert_documents(
+        'db', 'c1', [{'ids': _i, 'collection': 'a'} for _i in range(7)]
+    )
+
+    _pages = list()
+    _after_id = None
+    while True:
+        _page = _storage.search_after('db', 'c1', 'collection', 'a', _after_id, 3)
+        if len(_page) == 0:
+            break
+        _pages.append([_doc['ids'] for _doc in _page])
+        _after_id = _page[-1]['_id']
+
+    assert _pages == [[0, 1, 2], [3, 4, 5], [6]]
+    assert sorted(_obj_ids) == _obj_ids
+
+    # 按字段与_id的组合索引查询，不需要额外排序
+    _plan = ' '.join([_row[-1] for _row in _storage._get_conn('db').execute(
+        "EXPLAIN QUERY PLAN SELECT doc FROM %s WHERE json_extract(doc, '$.collection') = ? "
+        "AND _id > ? ORDER BY _id LIMIT 3" % _storage._table('c1'), ('a', str(_obj_ids[2]))
+    ).fetchall()])
+    assert 'idx_c1_collection__id' in _plan
+    assert 'TEMP B-TREE' not in _plan
+
+
+def test_doc_delete(tmp_path):
+    """
+    测试按id及域值删除文档
+    """
+    _storage = _doc_storage(tmp_path)
+    _obj_ids = _storage.insert_documents(
+        'db', 'c1', [{'ids': _i, 'collection': 'a'} for _i in range(1200)]
+    )
+
+    assert _storage.delete_by_id('db', 'c1', _obj_ids[0]) == 1
+    # 超过单批参数数量的批量删除
+    assert _storage.delete_by_ids('db', 'c1', _obj_ids[0:1100]) == 1099
+    assert _storage.count_by_field('db', 'c1', None, None) == 100
+    assert _storage.delete_by_field('db', 'c1', 'ids', [1150, 1151]) == 2
+    assert _storage.count_by_field('db', 'c1', None, None) == 98
+
+    _storage.delete_collections('db', ['c1'])
+    assert _storage.list_collection('db') == []
+
+
+def test_doc_thread_connections(tmp_path):
+    """
+    测试线程结束后关闭其数据库连接
+    """
+    _storage = _doc_storage(tmp_path)
+
+    def _count():
+        _storage.count_by_field('db', 'c1', None, None)
+
+    for _i in range(20):
+        _thread = threading.Thread(target=_count)
+        _thread.start()
+        _thread.join()
+
+    gc.collect()
+    # 只保留主线程的连接
+    assert len(_storage._thread_conns) == 1
+
+    _storage.close()
+    assert len(_storage._thread_conns) == 0
+    assert _storage.count_by_field('db', 'c1', None, None) == 0
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+测试管道处理控制
+@module test_pipeline
+@file test_pipeline.py
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.pipeline import (
+    Tools, Pipeline, PipelineProcesser, PipelineRouter, CompiledPipeline, AsyncPipeline
+)
+
+
+class AddOne(PipelineProcesser):
+    """
+    测试用的同步处理器，输入数值加1，并登记执行线程
+    """
+
+    @classmethod
+    def processer_name(cls) -> str:
+        return 'AddOne'
+
+    @classmethod
+    def execute(cls, input_data, context: dict, pipeline_obj):
+        context.setdefault('threads', list()).append(threading.get_ident())
+        return input_data + 1
+
+
+class AsyncDouble(PipelineProcesser):
+    """
+    测试用的协程处理器，输入数值乘2
+    """
+
+    @classmethod
+    def processer_name(cls) -> str:
+        return 'AsyncDouble'
+
+    @classmethod
+    async def execute(cls, input_data, context: dict, pipeline_obj):
+        await asyncio.sleep(0.01)
+        return input_data * 2
+
+
+class FeebackTen(PipelineProcesser):
+    """
+    测试用的异步处理器，在其他线程中通过asyn_node_feeback反馈输入数值加10
+    """
+
+    @classmethod
+    def processer_name(cls) -> str:
+        return 'FeebackTen'
+
+    @classmethod
+    def is_asyn(cls) -> bool:
+        return True
+
+    @classmethod
+    def execute(cls, input_data, context: dict, pipeline_obj):
+        _node_id = context['node_id']
+        threading.Timer(
+            0.01, pipeline_obj.asyn_node_feeback, args=(_node_id, input_data + 10),
+            kwargs={'context': {'feeback': True}}
+        ).start()
+
+
+class RaiseError(PipelineProcesser):
+    """
+    测试用的处理器，执行时抛出异常
+    """
+
+    @classmethod
+    def processer_name(cls) -> str:
+        return 'RaiseError'
+
+    @classmethod
+    def execute(cls, input_data, context: dict, pipeline_obj):
+        raise ValueError('test error')
+
+
+class DefaultZero(PipelineProcesser):
+    """
+    测试用的同步处理器，输入为None时输出0
+    """
+
+    @classmethod
+    def processer_name(cls) -> str:
+        return 'DefaultZero'
+
+    @classmethod
+    def execute(cls, input_data, context: dict, pipeline_obj):
+        return 0 if input_data is None else input_data
+
+
+class GoToLast(PipelineRouter):
+    """
+    测试用的路由器，跳转到最后一个节点
+    """
+
+    @classmethod
+    def router_name(cls) -> str:
+        return 'GoToLast'
+
+    @classmethod
+    def get_next(cls, output, context: dict, pipeline_obj, **kwargs):
+        return str(len(pipeline_obj.pipeline))
+
+
+for _plugin in (AddOne, AsyncDouble, FeebackTen, RaiseError, DefaultZero, GoToLast):
+    Pipeline.add_plugin(_plugin)
+
+# 通用处理器插件(UrlImageFetch)
+Pipeline.load_plugins_by_file(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, 'pipeline_plugins', 'processer.py'
+))
+
+
+def _pipeline_config(*nodes) -> str:
+    """
+    生成按顺序执行的管道配置
+
+    @param {tuple} nodes - 节点的处理器名，或节点配置字典
+
+    @returns {str} - 管道配置json字符串
+    """
+    _config = dict()
+    for _i, _node in enumerate(nodes):
+        if isinstance(_node, str):
+            _node = {'processor': _node}
+        _node.setdefault('name', 'node%d' % (_i + 1))
+        _config[str(_i + 1)] = _node
+    return json.dumps(_config)
+
+
+def test_compiled_pipeline():
+    """
+    测试预编译管道配置的插件及节点名索引
+    """
+    _compiled = CompiledPipeline('test', _pipeline_config(
+        {'name': 'add', 'processor': 'AddOne', 'router': 'GoToLast'},
+        {'name': 'double', 'processor': 'AsyncDouble', 'exception_router': 'GoToLast'},
+        {'name': 'add', 'processor': 'AddOne'}
+    ))
+    assert _compiled.processers == {'1': AddOne, '2': AsyncDouble, '3': AddOne}
+    assert _compiled.coroutines == {'1': False, '2': True, '3': False}
+    assert _compiled.routers == {'GoToLast': GoToLast}
+    # 同名节点以第一个为准
+    assert _compiled.node_ids == {'add': '1', 'double': '2'}
+
+    _pipeline = Pipeline('test', _compiled)
+    assert _pipeline.compiled is _compiled
+    assert Tools.get_node_id_by_name('double', _pipeline) == '2'
+    assert Tools.get_node_id_by_name('add', _pipeline) == '1'
+    assert Tools.get_node_id_by_name('not_exists', _pipeline) is None
+
+
+def test_compiled_pipeline_missing_plugin():
+    """
+    测试预编译时找不到插件抛出异常
+    """
+    with pytest.raises(AttributeError):
+        CompiledPipeline('test', _pipeline_config('NotExists'))
+
+    with pytest.raises(AttributeError):
+        CompiledPipeline('test', _pipeline_config({'processor': 'AddOne', 'router': 'NotExists'}))
+
+    with pytest.raises(AttributeError):
+        CompiledPipeline('test', _pipeline_config(
+            {'processor': 'AddOne', 'exception_router': 'NotExists'}
+        ))
+
+
+def test_compiled_pipeline_shared():
+    """
+    测试多个管道执行对象共享同一个预编译配置，执行状态互不影响
+    """
+    _compiled = CompiledPipeline('test', _pipeline_config(
+        {'processor': 'AddOne', 'router': 'GoToLast'}, 'RaiseError', 'AddOne'
+    ))
+    _pipelines = [Pipeline('test', _compiled, run_in_caller=True) for _i in range(2)]
+    assert _pipelines[0].start(1, {}) == ('success', 3)
+    assert _pipelines[1].start(10, {}) == ('success', 12)
+    assert [_trace['node_id'] for _trace in _pipelines[0].trace_list] == ['1', '3']
+    assert _pipelines[0].pipeline is _compiled.pipeline
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """
+    禁止通过time.sleep轮询等待
+    """
+    def _sleep(seconds):
+        raise AssertionError('time.sleep called!')
+
+    monkeypatch.setattr(time, 'sleep', _sleep)
+
+
+def test_run_in_caller(no_sleep):
+    """
+    测试同步管道在调用线程中执行节点，执行完成直接返回
+    """
+    _pipeline = Pipeline('test', _pipeline_config('AddOne', 'AddOne'), run_in_caller=True)
+    assert _pipeline.start(1, {}) == ('success', 3)
+    assert _pipeline.context['threads'] == [threading.get_ident()] * 2
+
+    # 不在调用线程中执行时启动运行线程
+    _pipeline = Pipeline('test', _pipeline_config('AddOne', 'AddOne'))
+    assert _pipeline.start(1, {}) == ('success', 3)
+    assert threading.get_ident() not in _pipeline.context['threads']
+
+
+def test_run_in_caller_asyn_processer(no_sleep):
+    """
+    测试在调用线程中执行时等待异步处理器反馈后继续执行
+    """
+    _pipeline = Pipeline(
+        'test', _pipeline_config('AddOne', 'FeebackTen', 'AddOne'), run_in_caller=True
+    )
+    assert _pipeline.start(1, {}) == ('success', 13)
+    assert _pipeline.context['feeback']
+    # 反馈后的节点在反馈线程启动的运行线程中执行
+    assert _pipeline.context['threads'][0] == threading.get_ident()
+    assert _pipeline.context['threads'][1] != threading.get_ident()
+
+
+def test_run_in_caller_exception(no_sleep):
+    """
+    测试在调用线程中执行出现异常时返回异常状态，不抛出异常
+    """
+    _pipeline = Pipeline(
+        'test', _pipeline_config('AddOne', 'RaiseError', 'AddOne'), run_in_caller=True
+    )
+    assert _pipeline.start(1, {}) == ('exception', None)
+    assert [_trace['status'] for _trace in _pipeline.trace_list] == ['S', 'E']
+    assert 'ValueError' in _pipeline.trace_list[-1]['status_msg']
+
+    # 异常路由器跳转后继续执行
+    _pipeline = Pipeline('test', _pipeline_config(
+        'AddOne', {'processor': 'RaiseError', 'exception_router': 'GoToLast'}, 'DefaultZero'
+    ), run_in_caller=True)
+    assert _pipeline.start(1, {}) == ('success', 0)
+
+    # 管道可再次执行
+    assert _pipeline.start(1, {}) == ('success', 0)
+
+
+def test_async_pipeline_processers():
+    """
+    测试AsyncPipeline按顺序执行同步、协程及异步处理器
+    """
+    _pipeline = AsyncPipeline(
+        'test', _pipeline_config('AddOne', 'AsyncDouble', 'FeebackTen', 'AddOne')
+    )
+    _status, _output = asyncio.run(_pipeline.start_async(1, {}))
+    assert _status == 'success'
+    assert _output == (1 + 1) * 2 + 10 + 1
+    assert [_trace['status'] for _trace in _pipeline.trace_list] == ['S'] * 4
+    assert _pipeline.context['feeback']
+    # 同步处理器在线程池中执行
+    assert threading.get_ident() not in _pipeline.context['threads']
+
+
+def test_async_pipeline_concurrent():
+    """
+    测试同一事件循环中并发执行多个管道
+    """
+    _config = _pipeline_config('AsyncDouble', 'FeebackTen', 'AddOne')
+
+    async def _run_all():
+        return await asyncio.gather(*[
+            AsyncPipeline('test', _config).start_async(_i, {}) for _i in range(20)
+        ])
+
+    assert asyncio.run(_run_all()) == [('success', _i * 2 + 11) for _i in range(20)]
+
+
+def test_async_pipeline_exception():
+    """
+    测试处理器异常时结束管道执行
+    """
+    _pipeline = AsyncPipeline('test', _pipeline_config('AddOne', 'RaiseError', 'AddOne'))
+    _status, _output = asyncio.run(_pipeline.start_async(1, {}))
+    assert _status == 'exception'
+    assert _output is None
+    assert [_trace['status'] for _trace in _pipeline.trace_list] == ['S', 'E']
+    assert 'ValueError' in _pipeline.trace_list[-1]['status_msg']
+
+
+def test_async_pipeline_exception_router():
+    """
+    测试处理器异常时通过异常路由器跳转节点继续执行
+    """
+    _pipeline = AsyncPipeline('test', _pipeline_config(
+        'AddOne', {'processor': 'RaiseError', 'exception_router': 'GoToLast'},
+        'AsyncDouble', 'DefaultZero'
+    ))
+    _status, _output = asyncio.run(_pipeline.start_async(1, {}))
+    assert _status == 'success'
+    # 跳过第3个节点，最后节点的输入为异常节点的输出(None)
+    assert _output == 0
+    assert [_trace['node_id'] for _trace in _pipeline.trace_list] == ['1', '2', '4']
+    assert [_trace['status'] for _trace in _pipeline.trace_list] == ['S', 'E', 'S']
+    assert _pipeline.trace_list[1]['router_name'] == 'GoToLast'
+
+
+def test_pipeline_not_support_coroutine():
+    """
+    测试同步管道执行协程处理器时管道异常结束
+    """
+    _pipeline = Pipeline('test', _pipeline_config('AsyncDouble'), run_in_caller=True)
+    _status, _output = _pipeline.start(1, {})
+    assert _status == 'exception'
+    assert 'only support AsyncPipeline' in _pipeline.trace_list[-1]['status_msg']
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    """
+    测试用的图片下载服务
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/image':
+            self._send(200, {'Content-Length': '5'}, b'image')
+        elif self.path == '/chunked':
+            self._send(200, {'Transfer-Encoding': 'chunked'}, b'3\r\nima\r\n2\r\nge\r\n0\r\n\r\n')
+        elif self.path == '/eof':
+            self._send(200, {'Connection': 'close'}, b'image-eof')
+        elif self.path == '/redirect':
+            self._send(302, {'Location': '/image', 'Content-Length': '0'}, b'')
+        elif self.path == '/loop':
+            self._send(302, {'Location': '/loop', 'Content-Length': '0'}, b'')
+        else:
+            self._send(404, {'Content-Length': '0'}, b'')
+
+    def _send(self, status: int, headers: dict, body: bytes):
+        self.send_response(status)
+        for _name, _value in headers.items():
+            self.send_header(_name, _value)
+        self.end_headers()
+        self.wfile.write(body)
+        if 'Content-Length' not in headers.keys():
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    """
+    启动测试用的图片下载服务
+
+    @returns {str} - 服务的Url前缀
+    """
+    _server = ThreadingHTTPServer(('127.0.0.1', 0), _ImageHandler)
+    _thread = threading.Thread(target=_server.serve_forever, daemon=True)
+    _thread.start()
+    yield 'http://127.0.0.1:%d' % _server.server_address[1]
+    _server.shutdown()
+    _server.server_close()
+
+
+def _fetch(url: str, **context):
+    """
+    通过AsyncPipeline执行UrlImageFetch处理器下载图片
+
+    @returns {str, object, AsyncPipeline} - 管道状态, 管道输出, 管道对象
+    """
+    _pipeline = AsyncPipeline('fetch', _pipeline_config(
+        {'processor': 'UrlImageFetch', 'context': context}
+    ))
+    _status, _output = asyncio.run(_pipeline.start_async({'url': url, 'collection': 'c1'}, {}))
+    return _status, _output, _pipeline
+
+
+def test_url_image_fetch(image_server):
+    """
+    测试协程处理器通过Url下载图片
+    """
+    for _path, _image in (('/image', b'image'), ('/chunked', b'image'),
+                          ('/eof', b'image-eof'), ('/redirect', b'image')):
+        _status, _output, _pipeline = _fetch(image_server + _path)
+        assert _status == 'success'
+        assert _output == {'image': _image, 'collection': 'c1'}
+
+
+def test_url_image_fetch_error(image_server):
+    """
+    测试下载失败时管道异常结束
+    """
+    for _path, _msg, _context in (('/missing', 'http status [404]', {}),
+                                  ('/loop', 'too many redirects', {}),
+                                  ('/image', 'over limit', {'fetch_max_size': 4})):
+        _status, _output, _pipeline = _fetch(image_server + _path, **_context)
+        assert _status == 'exception'
+        assert _msg in _pipeline.trace_list[-1]['status_msg']
+
+    _status, _output, _pipeline = _fetch('ftp://127.0.0.1/image')
+    assert _status == 'exception'
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])
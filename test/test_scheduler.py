@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+测试批量推理调度
+@module test_scheduler
+@file test_scheduler.py
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.scheduler import MicroBatchScheduler
+
+
+def _submit_concurrent(scheduler: MicroBatchScheduler, items: list) -> list:
+    """
+    多线程同时提交请求，返回每个请求的结果或异常
+
+    @param {MicroBatchScheduler} scheduler - 调度器
+    @param {list} items - 请求数据清单
+
+    @returns {list} - 与请求顺序一致的结果清单，执行异常的位置为异常对象
+    """
+    _barrier = threading.Barrier(len(items))
+
+    def _submit(item):
+        _barrier.wait()
+        try:
+            return scheduler.submit(item, timeout=10)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(items)) as _executor:
+        return list(_executor.map(_submit, items))
+
+
+def test_batch_merge():
+    """
+    测试并发请求合并为批量执行
+    """
+    _batch_sizes = list()
+
+    def _batch_fun(items):
+        _batch_sizes.append(len(items))
+        return [_item * 2 for _item in items]
+
+    _scheduler = MicroBatchScheduler('test', _batch_fun, batch_size=4, batch_delay=0.2)
+    try:
+        _results = _submit_concurrent(_scheduler, list(range(8)))
+    finally:
+        _scheduler.close()
+
+    assert _results == [_item * 2 for _item in range(8)]
+    assert max(_batch_sizes) > 1
+    assert max(_batch_sizes) <= 4
+
+
+def test_batch_error_fan_out():
+    """
+    测试批量中单个请求失败时，只有该请求收到异常
+    """
+    def _batch_fun(items):
+        if 3 in items:
+            raise ValueError('bad item')
+        return [_item * 2 for _item in items]
+
+    _scheduler = MicroBatchScheduler('test', _batch_fun, batch_size=8, batch_delay=0.2)
+    try:
+        _results = _submit_concurrent(_scheduler, list(range(6)))
+    finally:
+        _scheduler.close()
+
+    for _item, _result in zip(range(6), _results):
+        if _item == 3:
+            assert isinstance(_result, ValueError)
+        else:
+            assert _result == _item * 2
+
+
+def test_batch_result_size_mismatch():
+    """
+    测试批量函数返回结果数量不一致时抛出异常
+    """
+    _scheduler = MicroBatchScheduler('test', lambda items: [], batch_size=1)
+    try:
+        with pytest.raises(RuntimeError):
+            _scheduler.submit(1, timeout=10)
+    finally:
+        _scheduler.close()
+
+
+def test_submit_after_close():
+    """
+    测试关闭后提交请求抛出异常
+    """
+    _scheduler = MicroBatchScheduler('test', lambda items: items)
+    _scheduler.close()
+    with pytest.raises(RuntimeError):
+        _scheduler.submit_async(1)
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+使用本地存储测试搜索引擎的搜索库处理
+@module test_search_engine_local
+@file test_search_engine_local.py
+"""
+
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pytest
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.pipeline import Pipeline, PipelineProcesser
+from search_by_image.lib.storage import VectorMatch
+from search_by_image.lib.search import SearchEngine
+
+
+class TextVertor(PipelineProcesser):
+    """
+    测试用的特征向量处理器，图片数据为"集合名:向量值,向量值,..."格式的文本
+    """
+
+    run_count = 0  # 执行次数
+
+    @classmethod
+    def processer_name(cls) -> str:
+        return 'TextVertor'
+
+    @classmethod
+    def execute(cls, input_data, context: dict, pipeline_obj):
+        cls.run_count += 1
+        _collection, _values = input_data['image'].decode('utf-8').split(':')
+        return {
+            'collection': _collection,
+            'vertor': np.array([float(_v) for _v in _values.split(',')], dtype=np.float32)
+        }
+
+
+Pipeline.add_plugin(TextVertor)
+# 通用处理器插件(UrlImageFetch)
+Pipeline.load_plugins_by_file(os.path.join(
+    os.path.dirname(__file__), os.path.pardir, 'pipeline_plugins', 'processer.py'
+))
+
+
+def _create_engine(path, result_cache: bool = False, metric_type: str = 'L2',
+                   **search_config) -> SearchEngine:
+    """
+    创建使用本地向量存储及本地文档存储的搜索引擎
+
+    @param {pathlib.Path} path - 数据存放目录
+    @param {bool} result_cache=False - 是否启用查询结果缓存
+    @param {str} metric_type='L2' - 向量度量类型
+    @param {kwargs} search_config - 要覆盖的search_config配置
+
+    @returns {SearchEngine} - 搜索引擎
+    """
+    _search_config = {
+        'app_name': 'test', 'collections': 'c1, c2', 'default_collection': 'c1',
+        'topk': 5, 'nprobe': 16, 'match_score': 0.0
+    }
+    _search_config.update(search_config)
+    return SearchEngine({
+        'search_config': _search_config,
+        'pipeline': {'pipeline_config': {
+            'Text': '{"1": {"name": "input", "processor": "TextVertor", "context": {}, "router": ""}}'
+        }},
+        'mongodb': {'type': 'local', 'path': str(path / 'doc')},
+        'milvus': {
+            'type': 'local', 'path': str(path / 'vector'), 'dimension': 4,
+            'metric_type': metric_type
+        },
+        'result_cache': {'enable': result_cache}
+    })
+
+
+def _add_images(engine: SearchEngine, collection: str, docs: list) -> list:
+    """
+    直接将图片信息及特征向量写入搜索库
+
+    @param {SearchEngine} engine - 搜索引擎
+    @param {str} collection - 集合名
+    @param {list} docs - 图片信息清单，图片信息带vertor时使用该特征向量，否则使用随机向量
+
+    @returns {list} - 向量id清单
+    """
+    _vertors = np.random.RandomState(len(docs)).rand(len(docs), 4)
+    if 'vertor' in docs[0].keys():
+        _vertors = np.array([_doc.pop('vertor') for _doc in docs])
+    _ids = engine.milvus_db.insert_vectors('%s_%s' % (engine.app_name, collection), _vertors)
+    for _doc, _id in zip(docs, _ids):
+        _doc['ids'] = _id
+    engine.mongo_db.insert_documents(engine.database, collection, docs)
+    return _ids
+
+
+def _get_all_by_cursor(engine: SearchEngine, page_size: int, **kwargs) -> list:
+    """
+    通过游标逐页获取所有图片信息
+
+    @returns {list} - 每页的(集合名, 图片名)清单
+    """
+    _pages = list()
+    _cursor = None
+    while True:
+        _images, _cursor = engine.get_images_by_cursor(
+            kwargs.get('field_name', None), kwargs.get('field_values', None),
+            collection=kwargs.get('collection', ''), page_size=page_size, cursor=_cursor
+        )
+        _pages.append([(_image['collection'], _image['name']) for _image in _images])
+        if _cursor is None:
+            return _pages
+
+
+def test_get_images_by_cursor(tmp_path):
+    """
+    测试跨集合的游标分页
+    """
+    _engine = _create_engine(tmp_path)
+    _add_images(_engine, 'c1', [{'name': 'a%d' % _i, 'tag': _i % 2} for _i in range(5)])
+    _add_images(_engine, 'c2', [{'name': 'b%d' % _i, 'tag': _i % 2} for _i in range(4)])
+
+    _pages = _get_all_by_cursor(_engine, 3)
+    assert _pages == [
+        [('c1', 'a0'), ('c1', 'a1'), ('c1', 'a2')],
+        [('c1', 'a3'), ('c1', 'a4'), ('c2', 'b0')],
+        [('c2', 'b1'), ('c2', 'b2'), ('c2', 'b3')],
+        []
+    ]
+
+    # 带条件及指定集合
+    assert _get_all_by_cursor(_engine, 2, field_name='tag', field_values=[1]) == [
+        [('c1', 'a1'), ('c1', 'a3')], [('c2', 'b1'), ('c2', 'b3')], []
+    ]
+    assert _get_all_by_cursor(_engine, 4, collection='c2') == [
+        [('c2', 'b0'), ('c2', 'b1'), ('c2', 'b2'), ('c2', 'b3')], []
+    ]
+
+    # 结果与偏移分页一致
+    _images = _engine.get_images(None, None, page_size=3, page_num=2)
+    assert [_image['name'] for _image in _images] == ['a3', 'a4', 'b0']
+
+
+def test_get_images_by_cursor_error(tmp_path):
+    """
+    测试游标分页的参数错误
+    """
+    _engine = _create_engine(tmp_path)
+    _add_images(_engine, 'c1', [{'name': 'a0'}])
+
+    for _page_size in (0, -1):
+        with pytest.raises(AttributeError):
+            _engine.get_images_by_cursor(None, None, page_size=_page_size)
+
+    with pytest.raises(AttributeError):
+        _engine.get_images_by_cursor(None, None, cursor='not a cursor')
+
+    _images, _cursor = _engine.get_images_by_cursor(None, None, page_size=1)
+    assert _cursor is not None
+    with pytest.raises(AttributeError):
+        # 游标的集合不在查询的集合中
+        _engine.get_images_by_cursor(None, None, collection='c2', cursor=_cursor)
+
+
+def test_remove_images(tmp_path):
+    """
+    测试按批删除图片，每批只调用一次向量删除
+    """
+    _engine = _create_engine(tmp_path, result_cache=True)
+    _ids1 = _add_images(
+        _engine, 'c1', [{'name': 'a%d' % _i, 'tag': _i % 2} for _i in range(11)]
+    )
+    _ids2 = _add_images(
+        _engine, 'c2', [{'name': 'b%d' % _i, 'tag': _i % 2} for _i in range(4)]
+    )
+    _engine.result_cache.set('c1_key', [], tags=['c1'])
+    _engine.result_cache.set('c2_key', [], tags=['c2'])
+
+    _del_calls = list()
+    _del_vectors = _engine.milvus_db.del_vectors
+
+    def _record_del_vectors(collection, ids):
+        _del_calls.append((collection, len(ids)))
+        return _del_vectors(collection, ids)
+
+    _engine.milvus_db.del_vectors = _record_del_vectors
+
+    _removed = _engine.remove_images('tag', [1], collection='c1', batch_size=2)
+    assert _removed == {'total': 5, 'collections': {'c1': 5}}
+    assert _del_calls == [('test_c1', 2), ('test_c1', 2), ('test_c1', 1)]
+
+    # 向量及文档都已删除，其他集合不受影响
+    _vertors = _engine.milvus_db.get_vectors('test_c1', _ids1)
+    assert [_i for _i in range(11) if _vertors[_i] is None] == [1, 3, 5, 7, 9]
+    assert [_image['name'] for _image in _engine.get_images('tag', [1], page_size=0)] == [
+        'b1', 'b3'
+    ]
+    assert _engine.result_cache.get('c1_key') is None
+    assert _engine.result_cache.get('c2_key') == []
+
+    # 不指定集合时删除所有集合的匹配图片
+    _removed = _engine.remove_images(None, None, batch_size=3)
+    assert _removed == {'total': 10, 'collections': {'c1': 6, 'c2': 4}}
+    assert _engine.get_images(None, None, page_size=0) == []
+    assert _engine.milvus_db.get_vectors('test_c2', _ids2) == [None] * 4
+    assert _engine.result_cache.get('c2_key') is None
+
+    with pytest.raises(AttributeError):
+        _engine.remove_images(None, None, batch_size=0)
+
+
+def test_remove_images_error(tmp_path):
+    """
+    测试删除中途出现异常时，已删除部分的缓存失效，且可按相同条件重新删除
+    """
+    _engine = _create_engine(tmp_path, result_cache=True)
+    _add_images(_engine, 'c1', [{'name': 'a%d' % _i} for _i in range(5)])
+    _engine.result_cache.set('c1_key', [], tags=['c1'])
+
+    _del_vectors = _engine.milvus_db.del_vectors
+    _calls = list()
+
+    def _fail_del_vectors(collection, ids):
+        _calls.append(len(ids))
+        if len(_calls) == 2:
+            raise RuntimeError('delete error')
+        return _del_vectors(collection, ids)
+
+    _engine.milvus_db.del_vectors = _fail_del_vectors
+    with pytest.raises(RuntimeError):
+        _engine.remove_images(None, None, collection='c1', batch_size=2)
+
+    assert _engine.result_cache.get('c1_key') is None
+    assert len(_engine.get_images(None, None, collection='c1', page_size=0)) == 3
+
+    _removed = _engine.remove_images(None, None, collection='c1', batch_size=2)
+    assert _removed == {'total': 3, 'collections': {'c1': 3}}
+
+
+def _add_search_images(engine: SearchEngine):
+    """
+    在c1、c2集合各写入两张可搜索的图片
+    """
+    _add_images(engine, 'c1', [
+        {'name': 'a0', 'vertor': [0, 0, 0, 0]}, {'name': 'a1', 'vertor': [1, 1, 1, 1]}
+    ])
+    _add_images(engine, 'c2', [
+        {'name': 'b0', 'vertor': [0, 0, 0, 0.5]}, {'name': 'b1', 'vertor': [2, 2, 2, 2]}
+    ])
+
+
+def _names(images: list) -> list:
+    """
+    获取搜索结果的(集合名, 图片名)清单
+    """
+    return [(_image['collection'], _image['name']) for _image in images]
+
+
+def test_search_batch(tmp_path):
+    """
+    测试批量搜索的结果与逐张搜索一致
+    """
+    _engine = _create_engine(tmp_path, topk=1)
+    _add_search_images(_engine)
+
+    _images = [b'c1:1,1,1,1.1', b'c2:2,2,2,1.9', b'c1:0,0,0,0.1', b':0,0,0,0.4']
+    _res = _engine.search_batch(_images, 'Text', fields=['name'])
+    assert [_names(_item) for _item in _res] == [
+        [('c1', 'a1')], [('c2', 'b1')], [('c1', 'a0')], [('c1', 'a0')]
+    ]
+    assert _res == [_engine.search(_image, 'Text', fields=['name']) for _image in _images]
+
+    with pytest.raises(AttributeError):
+        _engine.search_batch([b'c1:0,0,0,0'] * 33, 'Text')
+
+
+def test_search_batch_fanout(tmp_path):
+    """
+    测试批量搜索中未识别出集合的图片与search一样并发搜索候选集合
+    """
+    _engine = _create_engine(tmp_path, topk=2, fanout_collections=2)
+    _add_search_images(_engine)
+
+    _images = [b':0,0,0,0.4', b'c1:0,0,0,0.4']
+    _res = _engine.search_batch(_images, 'Text', fields=['name'])
+    assert [_names(_item) for _item in _res] == [
+        [('c2', 'b0'), ('c1', 'a0')], [('c1', 'a0'), ('c1', 'a1')]
+    ]
+    assert _res == [_engine.search(_image, 'Text', fields=['name']) for _image in _images]
+
+
+def test_search_batch_cache(tmp_path):
+    """
+    测试批量搜索使用查询结果缓存，集合变更后缓存失效
+    """
+    _engine = _create_engine(tmp_path, result_cache=True, topk=1, max_batch_size=2)
+    _add_search_images(_engine)
+
+    TextVertor.run_count = 0
+    _res = _engine.search_batch([b'c1:1,1,1,1', b'c2:2,2,2,2'], 'Text', fields=['name'])
+    assert TextVertor.run_count == 2
+
+    # 单张搜索及批量搜索共用缓存
+    assert _engine.search(b'c1:1,1,1,1', 'Text', fields=['name']) == _res[0]
+    assert _engine.search_batch([b'c2:2,2,2,2'], 'Text', fields=['name']) == [_res[1]]
+    assert TextVertor.run_count == 2
+
+    _engine.remove_images('name', ['a1'], collection='c1')
+    _new_res = _engine.search_batch([b'c1:1,1,1,1', b'c2:2,2,2,2'], 'Text', fields=['name'])
+    assert TextVertor.run_count == 3
+    assert _names(_new_res[0]) == [('c1', 'a0')]
+    assert _new_res[1] == _res[1]
+
+    with pytest.raises(AttributeError):
+        _engine.search_batch([b'c1:1,1,1,1'] * 3, 'Text')
+
+
+@pytest.mark.parametrize('metric_type, expect, expect_c1', [
+    ('L2', [('c2', 'b0'), ('c1', 'a0'), ('c2', 'b1')], [('c1', 'a0'), ('c1', 'a1')]),
+    ('IP', [('c1', 'a1'), ('c2', 'b1'), ('c2', 'b0')], [('c1', 'a1'), ('c1', 'a0')])
+])
+def test_search_fanout_metric(tmp_path, metric_type, expect, expect_c1):
+    """
+    测试并发搜索候选集合时按度量类型合并全局的topk
+    """
+    _engine = _create_engine(tmp_path, metric_type=metric_type, topk=3, fanout_collections=2)
+    _add_images(_engine, 'c1', [
+        {'name': 'a0', 'vertor': [1, 0, 0, 0]}, {'name': 'a1', 'vertor': [3, 3, 0, 0]}
+    ])
+    _add_images(_engine, 'c2', [
+        {'name': 'b0', 'vertor': [0.8, 0.6, 0, 0]}, {'name': 'b1', 'vertor': [0, 2, 0, 0]}
+    ])
+
+    _res = _engine.search(b':0.8,0.6,0,0', 'Text', fields=['name'])
+    assert _names(_res) == expect
+
+    # 指定集合时同样按匹配度排序
+    _res = _engine.search(b'c1:0.8,0.6,0,0', 'Text', fields=['name'])
+    assert _names(_res) == expect_c1
+
+
+@pytest.mark.parametrize('metric_type, expect, expect_distances, expect_next', [
+    ('L2', ['a1', 'a2'], [0.0, 1.0], ['a0']),
+    ('IP', ['a3', 'a2'], [8.0, 3.0], ['a1'])
+])
+def test_search_rerank(tmp_path, metric_type, expect, expect_distances, expect_next):
+    """
+    测试重排序按原始向量精确计算距离，并按度量类型排序
+    """
+    _engine = _create_engine(
+        tmp_path, metric_type=metric_type, topk=2, nprobe=16, rerank_multiple=2,
+        rerank_nprobe=4, rerank_cache_size=10
+    )
+    _ids = _add_images(_engine, 'c1', [
+        {'name': 'a0', 'vertor': [0, 0, 0, 0]}, {'name': 'a1', 'vertor': [1, 1, 0, 0]},
+        {'name': 'a2', 'vertor': [2, 1, 0, 0]}, {'name': 'a3', 'vertor': [4, 4, 0, 0]}
+    ])
+
+    # 近似查询返回的候选项顺序及距离均不准确(倒序, 距离为0)
+    _calls = list()
+    _search_vectors = _engine.milvus_db.search_vectors
+
+    def _approximate_search(collection, vector, topk=10, nprobe=16):
+        _calls.append((topk, nprobe))
+        return [
+            [VectorMatch(_match.id, 0.0) for _match in reversed(_matchs)]
+            for _matchs in _search_vectors(collection, vector, topk=topk, nprobe=nprobe)
+        ]
+
+    _engine.milvus_db.search_vectors = _approximate_search
+    _get_vectors = _engine.milvus_db.get_vectors
+    _get_ids = list()
+
+    def _record_get_vectors(collection, ids):
+        _get_ids.extend(ids)
+        return _get_vectors(collection, ids)
+
+    _engine.milvus_db.get_vectors = _record_get_vectors
+
+    _res = _engine._search_vectors('c1', [[1, 1, 0, 0]])
+    assert _calls == [(4, 4)]
+    assert [_match.id for _match in _res[0]] == [_ids[int(_name[1])] for _name in expect]
+    assert [_match.distance for _match in _res[0]] == pytest.approx(expect_distances)
+
+    # 原始向量从缓存获取
+    _get_count = len(_get_ids)
+    _engine._search_vectors('c1', [[1, 1, 0, 0]])
+    assert len(_get_ids) == _get_count
+
+    # 近似查询返回已删除的候选项时，获取不到原始向量的候选项不参与排序
+    _candidates = _approximate_search('test_c1', [[1, 1, 0, 0]], topk=4)
+    _engine.milvus_db.search_vectors = lambda collection, vector, topk=10, nprobe=16: _candidates
+    _engine.milvus_db.del_vectors('test_c1', [_res[0][0].id])
+    _engine.rerank_cache.clear()
+    _res = _engine._search_vectors('c1', [[1, 1, 0, 0]])
+    assert [_match.id for _match in _res[0]] == [
+        _ids[int(_name[1])] for _name in expect[1:] + expect_next
+    ]
+
+
+def test_bulk_import_images(tmp_path):
+    """
+    测试批量导入，图片信息写入失败时删除已写入的向量
+    """
+    _path = tmp_path / 'images'
+    _path.mkdir()
+    for _collection, _num in (('c1', 3), ('c2', 2)):
+        for _i in range(_num):
+            _name = '%s_%d' % (_collection, _i)
+            (_path / (_name + '.txt')).write_text('%s:%d,1,0,0' % (_collection, _i))
+            (_path / (_name + '.json')).write_text(
+                '{"name": "%s", "collection": "%s"}' % (_name, _collection)
+            )
+
+    # 不输出进度日志
+    _engine = _create_engine(tmp_path, import_progress_interval=0)
+    _insert_documents = _engine.mongo_db.insert_documents
+
+    def _insert_c1_only(database, collection, docs):
+        if collection == 'c2':
+            raise RuntimeError('insert documents error')
+        return _insert_documents(database, collection, docs)
+
+    _engine.mongo_db.insert_documents = _insert_c1_only
+    _stat = _engine.import_images(str(_path), 'Text', bulk=True, workers=2, batch_size=2)
+    assert (_stat['total'], _stat['success'], _stat['failed']) == (5, 3, 2)
+
+    assert _engine.milvus_db.search_vectors('test_c2', [[0, 1, 0, 0]], topk=5) == [[]]
+    assert len(_engine.milvus_db.search_vectors('test_c1', [[0, 1, 0, 0]], topk=5)[0]) == 3
+    assert sorted([_image['name'] for _image in _engine.get_images(None, None, 'c1')]) == [
+        'c1_0', 'c1_1', 'c1_2'
+    ]
+
+
+class _TextImageHandler(BaseHTTPRequestHandler):
+    """
+    测试用的图片下载服务，返回Url路径对应的文本图片数据
+    """
+
+    def do_GET(self):
+        _image = self.path[1:].encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(_image)))
+        self.end_headers()
+        self.wfile.write(_image)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_search_by_url(tmp_path):
+    """
+    测试下载Url的图片并搜索
+    """
+    _server = ThreadingHTTPServer(('127.0.0.1', 0), _TextImageHandler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    try:
+        _url = 'http://127.0.0.1:%d/' % _server.server_address[1]
+        _engine = _create_engine(tmp_path, topk=1)
+        _add_images(_engine, 'c1', [
+            {'name': 'a0', 'vertor': [1, 0, 0, 0]}, {'name': 'a1', 'vertor': [0, 1, 0, 0]}
+        ])
+
+        _res = _engine.search_by_url(_url + 'c1:0,1,0,0', 'Text', fields=['name'])
+        assert _names(_res) == [('c1', 'a1')]
+        assert _res == _engine.search(b'c1:0,1,0,0', 'Text', fields=['name'])
+
+        with pytest.raises(RuntimeError):
+            _engine.search_by_url('http://127.0.0.1:1/c1:0,1,0,0', 'Text')
+    finally:
+        _server.shutdown()
+        _server.server_close()
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+测试生产服务运行支持
+@module test_serving
+@file test_serving.py
+"""
+
+import os
+import sys
+import time
+import warnings
+import threading
+import pytest
+from flask import Flask, jsonify
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.serving import ConcurrencyLimiter, ServingTool
+
+
+def _acquire_in_thread(limiter: ConcurrencyLimiter) -> tuple:
+    """
+    在新线程中获取处理许可
+
+    @returns {threading.Thread, list} - 执行线程, 获取结果清单(线程结束后有值)
+    """
+    _result = list()
+    _thread = threading.Thread(target=lambda: _result.append(limiter.acquire()))
+    _thread.start()
+    return _thread, _result
+
+
+def _wait_stats(limiter: ConcurrencyLimiter, key: str, value: int):
+    """
+    等待统计值达到指定值
+    """
+    _end = time.time() + 5
+    while limiter.stats[key] != value:
+        assert time.time() < _end, 'wait stats [%s] timeout!' % key
+        time.sleep(0.01)
+
+
+def test_limiter_queue():
+    """
+    测试达到并发上限时进入等待队列，释放后继续处理
+    """
+    _limiter = ConcurrencyLimiter(max_concurrency=1, max_queue=1, queue_timeout=10)
+    assert _limiter.acquire()
+
+    _thread, _result = _acquire_in_thread(_limiter)
+    _wait_stats(_limiter, 'waiting', 1)
+
+    # 等待队列已满直接拒绝
+    assert not _limiter.acquire()
+    assert _limiter.stats == {'active': 1, 'waiting': 1, 'rejected': 1}
+
+    _limiter.release()
+    _thread.join()
+    assert _result == [True]
+    assert _limiter.stats == {'active': 1, 'waiting': 0, 'rejected': 1}
+
+    _limiter.release()
+    assert _limiter.stats['active'] == 0
+
+
+def test_limiter_timeout():
+    """
+    测试等待超时的请求被拒绝
+    """
+    _limiter = ConcurrencyLimiter(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+    assert _limiter.acquire()
+
+    _start = time.time()
+    assert not _limiter.acquire()
+    assert time.time() - _start >= 0.05
+    assert _limiter.stats == {'active': 1, 'waiting': 0, 'rejected': 1}
+
+    # 没有等待队列时直接拒绝
+    _limiter = ConcurrencyLimiter(max_concurrency=1, max_queue=0, queue_timeout=10)
+    assert _limiter.acquire()
+    assert not _limiter.acquire()
+
+
+def _create_app(limiter: ConcurrencyLimiter) -> tuple:
+    """
+    创建安装了并发限制的Flask应用
+
+    @returns {Flask, threading.Event} - Flask应用, 放行阻塞请求的事件
+    """
+    _app = Flask('test_serving')
+    _release = threading.Event()
+
+    @_app.route('/api/block')
+    def _block():
+        _release.wait(10)
+        return jsonify({'status': '00000'})
+
+    @_app.route('/api/error')
+    def _error():
+        raise ValueError('test error')
+
+    @_app.route('/health')
+    def _health():
+        return jsonify({'status': '00000'})
+
+    ServingTool.install_limiter(_app, limiter)
+    return _app, _release
+
+
+def test_install_limiter_429():
+    """
+    测试超过并发限制的请求返回429及Retry-After头，非限制路径不受影响
+    """
+    _limiter = ConcurrencyLimiter(max_concurrency=1, max_queue=0, retry_after=3)
+    _app, _release = _create_app(_limiter)
+
+    _responses = list()
+    _thread = threading.Thread(
+        target=lambda: _responses.append(_app.test_client().get('/api/block'))
+    )
+    _thread.start()
+    _wait_stats(_limiter, 'active', 1)
+
+    _resp = _app.test_client().get('/api/block')
+    assert _resp.status_code == 429
+    assert _resp.headers['Retry-After'] == '3'
+    assert _resp.get_json()['status'] == '20002'
+    assert _app.test_client().get('/health').status_code == 200
+
+    _release.set()
+    _thread.join()
+    assert _responses[0].status_code == 200
+    assert _limiter.stats == {'active': 0, 'waiting': 0, 'rejected': 1}
+
+
+def test_install_limiter_release_on_error():
+    """
+    测试请求处理出现异常时释放处理许可
+    """
+    _limiter = ConcurrencyLimiter(max_concurrency=1, max_queue=0)
+    _app, _release = _create_app(_limiter)
+    _release.set()
+
+    assert _app.test_client().get('/api/error').status_code == 500
+    assert _limiter.stats['active'] == 0
+    assert _app.test_client().get('/api/block').status_code == 200
+
+
+def _server_config(**kwargs) -> dict:
+    """
+    生成检查gunicorn配置使用的服务配置
+    """
+    _config = {'milvus': {'type': 'milvus'}}
+    _config.update(kwargs)
+    return _config
+
+
+def test_check_gunicorn_limiter():
+    """
+    测试启用并发限制时必须保留空闲线程
+    """
+    _config = _server_config(limiter={'enable': True, 'max_concurrency': 4, 'max_queue': 4})
+    ServingTool.check_gunicorn_config(
+        _config, {'workers': 1, 'worker_class': 'gthread', 'threads': 9}
+    )
+    with pytest.raises(RuntimeError):
+        ServingTool.check_gunicorn_config(
+            _config, {'workers': 1, 'worker_class': 'gthread', 'threads': 8}
+        )
+    with pytest.raises(RuntimeError):
+        ServingTool.check_gunicorn_config(_config, {'workers': 1, 'worker_class': 'sync'})
+
+    # 协程类工作进程不限制线程数
+    ServingTool.check_gunicorn_config(_config, {'workers': 1, 'worker_class': 'gevent'})
+    # 未启用并发限制
+    ServingTool.check_gunicorn_config(
+        _server_config(), {'workers': 1, 'worker_class': 'gthread', 'threads': 1}
+    )
+
+
+def test_check_gunicorn_workers():
+    """
+    测试多个工作进程时检查各进程独立的状态
+    """
+    _options = {'workers': 2, 'worker_class': 'gthread', 'threads': 4}
+    with pytest.raises(RuntimeError):
+        ServingTool.check_gunicorn_config(_server_config(milvus={'type': 'local'}), _options)
+    ServingTool.check_gunicorn_config(
+        _server_config(milvus={'type': 'local'}), dict(_options, workers=1)
+    )
+
+    with pytest.warns(RuntimeWarning, match='result_cache'):
+        ServingTool.check_gunicorn_config(
+            _server_config(result_cache={'enable': True}), _options
+        )
+    with pytest.warns(RuntimeWarning, match='vector_cache'):
+        ServingTool.check_gunicorn_config(
+            _server_config(vector_cache={'enable': True, 'type': 'memory'}), _options
+        )
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        ServingTool.check_gunicorn_config(
+            _server_config(vector_cache={'enable': True, 'type': 'mmap'}), _options
+        )
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])
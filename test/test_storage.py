@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+测试Milvus存储的连接重试
+@module test_storage
+@file test_storage.py
+"""
+
+import os
+import sys
+import grpc
+import milvus as mv
+import pytest
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.storage import MilvusIns, MongoStorage
+
+
+class FakeMilvus(object):
+    """
+    模拟的Milvus连接，按顺序返回预设的结果(异常对象则抛出)
+    """
+
+    def __init__(self, results: list, calls: list):
+        self.results = results
+        self.calls = calls
+
+    def _next(self, fun_name: str):
+        self.calls.append((id(self), fun_name))
+        _res = self.results.pop(0)
+        if isinstance(_res, Exception):
+            raise _res
+        return _res
+
+    def search(self, **kwargs):
+        return self._next('search')
+
+    def insert(self, **kwargs):
+        return self._next('insert')
+
+
+def _create_milvus(results: list, retry_times: int = 1):
+    """
+    创建使用模拟连接的Milvus操作对象
+
+    @returns {MilvusIns, list} - Milvus操作对象, 调用记录清单[(连接id, 函数名), ...]
+    """
+    _calls = list()
+    _milvus = MilvusIns({'host': '127.0.0.1', 'port': 19530, 'retry_times': retry_times})
+    _milvus.pool._new_client = lambda: FakeMilvus(results, _calls)
+    _milvus.pool._close_client = lambda client: None
+    return _milvus, _calls
+
+
+def test_search_retry_on_connect_error():
+    """
+    测试查询出现连接异常时使用新连接重试
+    """
+    _milvus, _calls = _create_milvus([mv.NotConnectError('lost'), (mv.Status(), [['ok']])])
+    assert _milvus.search_vectors('c1', [[0.0]]) == [['ok']]
+    assert [_call[1] for _call in _calls] == ['search', 'search']
+    # 出现异常的连接已丢弃
+    assert _calls[0][0] != _calls[1][0]
+
+
+def test_search_retry_on_transport_status():
+    """
+    测试查询返回通讯异常状态时重试，超过重试次数后抛出异常
+    """
+    _unavailable = mv.Status(grpc.StatusCode.UNAVAILABLE, 'unavailable')
+    _milvus, _calls = _create_milvus([(_unavailable, []), (mv.Status(), [['ok']])])
+    assert _milvus.search_vectors('c1', [[0.0]]) == [['ok']]
+    assert len(_calls) == 2
+
+    _timeout = mv.Status(mv.Status.UNEXPECTED_ERROR, 'Request timeout')
+    _milvus, _calls = _create_milvus([(_timeout, []), (_timeout, [])])
+    with pytest.raises(RuntimeError):
+        _milvus.search_vectors('c1', [[0.0]])
+    assert len(_calls) == 2
+
+
+def test_search_no_retry_on_other_error():
+    """
+    测试非通讯异常不重试
+    """
+    _milvus, _calls = _create_milvus([ValueError('bad param'), (mv.Status(), [])])
+    with pytest.raises(ValueError):
+        _milvus.search_vectors('c1', [[0.0]])
+
+    _milvus, _calls = _create_milvus([(mv.Status(mv.Status.ILLEGAL_TOPK, 'topk'), [])])
+    with pytest.raises(RuntimeError):
+        _milvus.search_vectors('c1', [[0.0]])
+    assert len(_calls) == 1
+
+
+def test_insert_no_retry():
+    """
+    测试插入出现通讯异常时不重试，避免重复写入
+    """
+    _milvus, _calls = _create_milvus([mv.NotConnectError('lost'), (mv.Status(), [1])])
+    with pytest.raises(mv.NotConnectError):
+        _milvus.insert_vectors('c1', [[0.0]])
+
+    _timeout = mv.Status(mv.Status.UNEXPECTED_ERROR, 'Request timeout')
+    _milvus, _calls = _create_milvus([(_timeout, []), (mv.Status(), [1])])
+    with pytest.raises(RuntimeError):
+        _milvus.insert_vectors('c1', [[0.0]])
+    assert [_call[1] for _call in _calls] == ['insert']
+
+
+class FakeMongoCollection(object):
+    """
+    模拟的MongoDB集合，只支持索引操作
+    """
+
+    def __init__(self):
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+
+    def index_information(self):
+        return self.indexes
+
+    def create_index(self, keys, **kwargs):
+        self.indexes['_'.join(['%s_%d' % _key for _key in keys])] = {'key': list(keys)}
+
+
+def test_mongo_compound_indexes():
+    """
+    测试为查询字段创建与_id的组合索引，单字段索引视为缺失
+    """
+    _storage = MongoStorage({'host': '127.0.0.1', 'connect': False})
+    _collection = FakeMongoCollection()
+    _collection.create_index([('name', 1)])
+    _storage.db = {'db': {'c1': _collection}}
+
+    assert _storage.get_missing_indexes('db', 'c1', ['_id', 'ids', 'name']) == ['ids', 'name']
+    _storage.create_indexes('db', 'c1', ['_id', 'ids', 'name'])
+    assert _collection.indexes['name_1__id_1']['key'] == [('name', 1), ('_id', 1)]
+    assert _collection.indexes['ids_1__id_1']['key'] == [('ids', 1), ('_id', 1)]
+    assert _storage.get_missing_indexes('db', 'c1', ['_id', 'ids', 'name']) == []
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+测试管道多进程处理池
+@module test_worker_pool
+@file test_worker_pool.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pytest
+# 根据当前文件路径将包路径纳入，在非安装的情况下可以引用到
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.path.pardir)))
+from search_by_image.lib.worker_pool import PipelineWorkerPool
+
+
+# 测试用的管道处理器插件，在工作进程中装载
+PLUGIN_CODE = '''
+import os
+import numpy as np
+from search_by_image.lib.pipeline import PipelineProcesser
+
+
+class PoolVertor(PipelineProcesser):
+    """
+    bytes图片按内容返回特征向量，数组图片按形状返回特征向量；图片内容为crash时退出进程
+    """
+
+    @classmethod
+    def processer_name(cls) -> str:
+        return 'PoolVertor'
+
+    @classmethod
+    def execute(cls, input_data, context: dict, pipeline_obj):
+        _image = input_data['image']
+        if isinstance(_image, np.ndarray):
+            _vertor = [_image.shape[0], _image.shape[1], _image[0, 0, 0], os.getpid()]
+        elif _image == b'crash':
+            os._exit(3)
+        elif _image == b'error':
+            raise ValueError('test error')
+        else:
+            _vertor = [len(_image), _image[0], 0.5, os.getpid()]
+
+        return {'collection': input_data['collection'] or 'c1', 'vertor': np.array(_vertor)}
+'''
+
+
+def _server_config(tmp_path, plugin_code: str = PLUGIN_CODE) -> dict:
+    """
+    生成使用测试插件的服务配置
+
+    @param {pathlib.Path} tmp_path - 插件存放目录
+    @param {str} plugin_code - 插件模块代码
+
+    @returns {dict} - 服务配置
+    """
+    _path = tmp_path / 'plugins'
+    _path.mkdir()
+    (_path / 'pool_plugin.py').write_text(plugin_code, encoding='utf-8')
+    return {
+        'execute_path': str(tmp_path),
+        'pipeline': {
+            'plugins_path': 'plugins',
+            'processer_para': {},
+            'router_para': {},
+            'pipeline_config': {
+                'Pool': '{"1": {"name": "vertor", "processor": "PoolVertor"}}'
+            }
+        },
+        'milvus': {'dimension': 4}
+    }
+
+
+def test_pool_round_trip(tmp_path):
+    """
+    测试图片及特征向量通过共享内存在工作进程间传递
+    """
+    _pool = PipelineWorkerPool(_server_config(tmp_path), workers=2, monitor_interval=0.1)
+    try:
+        assert _pool.wait_ready(timeout=60)
+        _status, _output = _pool.run_pipeline('Pool', b'\x07abc', init_collection='c2')
+        assert _status == 'success'
+        assert _output['collection'] == 'c2'
+        assert _output['vertor'].dtype == np.float64
+        assert _output['vertor'][0:3].tolist() == [4.0, 7.0, 0.5]
+        assert int(_output['vertor'][3]) != os.getpid()
+
+        _status, _output = _pool.run_pipeline('Pool', b'error')
+        assert (_status, _output) == ('exception', None)
+    finally:
+        _pool.close()
+
+
+def test_pool_decode(tmp_path):
+    """
+    测试在前端进程解码图片后通过共享内存传递数组
+    """
+    from io import BytesIO
+    from PIL import Image
+    _bytesio = BytesIO()
+    Image.new('RGB', (40, 20), (200, 0, 0)).save(_bytesio, format='PNG')
+
+    _pool = PipelineWorkerPool(
+        _server_config(tmp_path), workers=1, decode=True, max_input_side=10
+    )
+    try:
+        assert _pool.wait_ready(timeout=60)
+        _status, _output = _pool.run_pipeline('Pool', _bytesio.getvalue())
+        assert _status == 'success'
+        # 按最大边长缩小后的数组(高 * 宽)
+        assert _output['vertor'][0:3].tolist() == [5.0, 10.0, 200.0]
+    finally:
+        _pool.close()
+
+
+def test_pool_crash_recovery(tmp_path):
+    """
+    测试工作进程异常退出时正在处理的任务返回失败，并重新启动工作进程
+    """
+    _pool = PipelineWorkerPool(_server_config(tmp_path), workers=1, monitor_interval=0.1)
+    try:
+        assert _pool.wait_ready(timeout=60)
+        _pid = int(_pool.run_pipeline('Pool', b'a')[1]['vertor'][3])
+
+        _start = time.time()
+        assert _pool.run_pipeline('Pool', b'crash') == ('exception', None)
+        assert time.time() - _start < _pool.task_timeout
+
+        # 重新启动的工作进程继续处理任务
+        _status, _output = _pool.run_pipeline('Pool', b'a')
+        assert _status == 'success'
+        assert int(_output['vertor'][3]) != _pid
+    finally:
+        _pool.close()
+
+
+def test_pool_init_error(tmp_path):
+    """
+    测试工作进程装载管道失败时wait_ready抛出异常
+    """
+    _pool = PipelineWorkerPool(
+        _server_config(tmp_path, plugin_code='raise ImportError("no model")\n'),
+        workers=2, monitor_interval=0.1
+    )
+    try:
+        with pytest.raises(RuntimeError, match='no model'):
+            _pool.wait_ready(timeout=60)
+    finally:
+        _pool.close()
+
+
+def test_pool_exit_before_ready(tmp_path):
+    """
+    测试工作进程装载完成前退出(例如内存不足)时wait_ready不等待超时直接抛出异常
+    """
+    _pool = PipelineWorkerPool(
+        _server_config(tmp_path, plugin_code='import os\nos._exit(9)\n'),
+        workers=1, monitor_interval=0.1
+    )
+    try:
+        _start = time.time()
+        with pytest.raises(RuntimeError, match='before initialized'):
+            _pool.wait_ready(timeout=60)
+        assert time.time() - _start < 30
+    finally:
+        _pool.close()
+
+
+if __name__ == '__main__':
+    # 执行测试
+    pytest.main([__file__, '-q'])